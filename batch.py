@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import get_setting
+from graph import _run_config, build_inputs, get_async_graph
+
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(get_setting("BATCH_CONCURRENCY", "batch.concurrency", default=4))
+BATCH_RECURSION_LIMIT = int(get_setting("BATCH_RECURSION_LIMIT", "batch.recursion_limit", default=100))
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def read_requests(path: Path):
+    """Yield (request_id, user_id, user_message) per JSONL line without loading the whole file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"{path}:{line_no}: skipping invalid JSON ({e})")
+                continue
+            request_id = str(item.get("request_id") or item.get("id") or f"line-{line_no}")
+            message = item.get("user_message") or item.get("message") or item.get("body")
+            if not message:
+                logger.error(f"{path}:{line_no}: skipping request {request_id} without user_message")
+                continue
+            yield request_id, str(item.get("user_id") or "default"), message
+
+
+def completed_request_ids(output: Path) -> set[str]:
+    """Request ids that already have an ``ok`` result in ``output``."""
+    done = set()
+    if not output.exists():
+        return done
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by a crash; that request simply runs again.
+                continue
+            if row.get("status") == "ok":
+                done.add(row["request_id"])
+    return done
+
+
+def batch_run_nonce(output: Path, resume: bool) -> str:
+    """Nonce of the batch run writing ``output``, kept next to it in ``<output>.run``.
+
+    ``--no-resume`` starts a new one, so its requests get fresh threads instead of continuing
+    (and adding to) the checkpoints of an earlier run; resuming reuses the stored one.
+    """
+    path = output.with_name(f"{output.name}.run")
+    if resume and path.exists():
+        return path.read_text(encoding="utf-8").strip()
+    nonce = "" if resume else uuid.uuid4().hex[:8]
+    path.write_text(nonce, encoding="utf-8")
+    return nonce
+
+
+def batch_thread_id(batch_name: str, request_id: str, nonce: str = "") -> str:
+    """Per-request thread id, stable within a batch run so a resumed batch finds the request's checkpoints.
+
+    A readable prefix plus a hash of the raw parts, so request ids that sanitize alike
+    ("a/b", "a b", "a_b") never share checkpoints or a run workspace.
+    """
+    prefix = re.sub(r"[^\w.-]", "_", f"batch_{batch_name}_{nonce + '_' if nonce else ''}{request_id}")
+    digest = hashlib.sha256(json.dumps([batch_name, nonce, request_id]).encode("utf-8")).hexdigest()[:8]
+    return f"{prefix}-{digest}"
+
+
+async def run_request(request_id: str, user_id: str, user_message: str, thread_id: str, recursion_limit: int) -> dict:
+    """Run (or continue from its checkpoint) one request and describe the outcome as a result row."""
+    from tracing import UsageCounter
+
+    config = _run_config(thread_id, recursion_limit)
+    # Counts this invocation only: calls made before an interruption are not included.
+    counter = UsageCounter()
+    config["callbacks"] = [*config["callbacks"], counter]
+    started_at = _utc_now()
+    started = time.monotonic()
+    row = {"request_id": request_id, "user_id": user_id, "thread_id": thread_id, "started_at": started_at}
+    try:
+        snapshot = await get_async_graph().aget_state(config)
+        if snapshot.next:
+            # Interrupted in an earlier batch: completed steps are not re-executed.
+            row["resumed"] = True
+            values = await get_async_graph().ainvoke(None, config)
+        else:
+            values = await get_async_graph().ainvoke(build_inputs(user_message, user_id), config)
+        row.update({
+            "status": "ok",
+            "final_report_pdf_path": values.get("final_report_pdf_path", ""),
+            **counter.totals(),
+            "steps": len((values.get("plan") or {}).get("steps") or []),
+            "replan_stats": values.get("replan_stats") or {},
+            "plan_stats": values.get("plan_stats") or {},
+        })
+    except Exception as e:
+        logger.exception(f"Request {request_id} failed")
+        row.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    row["finished_at"] = _utc_now()
+    row["duration_s"] = round(time.monotonic() - started, 3)
+    return row
+
+
+async def run_batch(
+    input_path: Path,
+    output_path: Path,
+    concurrency: int = BATCH_CONCURRENCY,
+    resume: bool = True,
+    recursion_limit: int = BATCH_RECURSION_LIMIT,
+) -> dict:
+    """Run every request of ``input_path`` with at most ``concurrency`` in flight.
+
+    Result rows are appended to ``output_path`` as each request finishes. With
+    ``resume`` requests that already have an ``ok`` row are skipped and
+    interrupted ones continue from their checkpoint (checkpoint.backend=sqlite
+    makes that survive a process restart).
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    skip = completed_request_ids(output_path) if resume else set()
+    batch_name = input_path.stem
+    nonce = batch_run_nonce(output_path, resume)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    tasks = set()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+
+        async def worker(request_id: str, user_id: str, user_message: str) -> None:
+            try:
+                row = await run_request(
+                    request_id, user_id, user_message, batch_thread_id(batch_name, request_id, nonce), recursion_limit
+                )
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[row["status"]] += 1
+                logger.info(f"[{row['status']}] {request_id} in {row['duration_s']}s")
+            finally:
+                semaphore.release()
+
+        for request_id, user_id, user_message in read_requests(input_path):
+            if request_id in skip:
+                counts["skipped"] += 1
+                continue
+            # Acquire before creating the task so only `concurrency` requests are ever in memory.
+            await semaphore.acquire()
+            task = asyncio.create_task(worker(request_id, user_id, user_message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSONL file of analysis requests through the graph.")
+    parser.add_argument("input", type=Path, help="JSONL with user_message (or body), optional user_id and request_id")
+    parser.add_argument("-o", "--output", type=Path, help="result JSONL (default: <input>.results.jsonl)")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--recursion-limit", type=int, default=BATCH_RECURSION_LIMIT)
+    parser.add_argument("--no-resume", action="store_true", help="overwrite the output and rerun every request")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    output = args.output or args.input.with_name(f"{args.input.stem}.results.jsonl")
+    summary = asyncio.run(run_batch(args.input, output, args.concurrency, not args.no_resume, args.recursion_limit))
+    print(json.dumps({"output": str(output), **summary}))
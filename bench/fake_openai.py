@@ -0,0 +1,268 @@
+"""Scripted OpenAI-compatible chat-completions server for offline benchmarks.
+
+It answers the agent's requests by shape rather than by model: planner calls get
+a fixed plan, the replanner gets its input plan back, execute steps get one
+``python_exec`` call on the dataset followed by a summary, and the report phase
+gets a ``render_report`` call (and, when that cannot write the PDF, e.g. without
+fpdf2 or the CJK font, a code call that writes a small one) with the final text. Latency and token
+counts are configurable so model-bound and script-bound runs can both be modeled.
+Like vLLM with prefix caching, usage reports ``prompt_tokens_details.cached_tokens``:
+the leading messages (tools count as part of the first) it has seen before.
+
+    python bench/fake_openai.py --port 8765 --latency 0.2 --tokens-per-second 200
+"""
+import argparse
+import ast
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STEP_CODE = """
+if "df" not in globals():
+    df = pd.read_parquet("dataset.parquet")
+numeric = df.select_dtypes("number")
+print(numeric.corr()["{target}"].sort_values(ascending=False).round(3).to_string())
+print(df.groupby("{column}")["{target}"].agg(["mean", "count"]).round(2).to_string())
+"""
+REPORT_CODE = """
+# A one-page PDF written by hand, so the benchmark does not depend on a plotting stack.
+text = "Mean G3 by studytime: " + ", ".join(
+    f"{k}={v:.1f}" for k, v in df.groupby("studytime")["G3"].mean().items()
+) if "df" in globals() else "report"
+stream = f"BT /F1 11 Tf 40 800 Td ({text}) Tj ET".encode()
+objects = [
+    b"<< /Type /Catalog /Pages 2 0 R >>",
+    b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+    b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+    b"<< /Length %d >>\\nstream\\n" % len(stream) + stream + b"\\nendstream",
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+]
+out, offsets = bytearray(b"%PDF-1.4\\n"), []
+for i, body in enumerate(objects, start=1):
+    offsets.append(len(out))
+    out += b"%d 0 obj\\n" % i + body + b"\\nendobj\\n"
+xref = len(out)
+out += b"xref\\n0 %d\\n0000000000 65535 f \\n" % (len(objects) + 1)
+out += b"".join(b"%010d 00000 n \\n" % offset for offset in offsets)
+out += b"trailer << /Size %d /Root 1 0 R >>\\nstartxref\\n%d\\n%%%%EOF\\n" % (len(objects) + 1, xref)
+open("final_report.pdf", "wb").write(bytes(out))
+print("saved final_report.pdf", len(out), "bytes")
+"""
+REPORT_TEXT = "# Report\nFinal grades rise with study time and fall with past failures."
+REPORT_SECTIONS = [
+    {"heading": "Findings", "markdown": "Final grades rise with **study time** and fall with past failures.\n\n"
+     "| Factor | Direction |\n|---|---|\n| **studytime** | positive |\n| failures | negative |"},
+    {"heading": "Conclusion", "markdown": "- Study time helps\n- Past failures predict lower grades", "charts": []},
+]
+STEP_COLUMNS = ["studytime", "failures", "higher", "Medu", "internet", "romantic", "goout", "absences"]
+
+
+def scripted_plan(steps: int) -> dict:
+    """``steps`` analysis steps: the first ones independent, the last one depending on all others."""
+    plan_steps = []
+    for i in range(steps):
+        column = STEP_COLUMNS[i % len(STEP_COLUMNS)]
+        step = {"title": f"Analyse G3 by {column}", "description": f"Relate final grade G3 to {column}", "status": "pending"}
+        if i == steps - 1 and steps > 1:
+            step = {"title": "Summarise findings", "description": "Combine the step results", "status": "pending",
+                    "depends_on": list(range(steps - 1))}
+        plan_steps.append(step)
+    return {"thought": "scripted benchmark plan", "goal": "Find what final grades correlate with", "steps": plan_steps}
+
+
+def _text(messages: list) -> str:
+    return "\n".join(str(message.get("content") or "") for message in messages)
+
+
+def _tool_call(name: str, arguments: dict) -> dict:
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+class Script:
+    """Decides the assistant message for one chat-completions request."""
+
+    def __init__(self, steps: int = 4):
+        self.steps = steps
+
+    def reply(self, body: dict) -> dict:
+        messages = body.get("messages") or []
+        text = _text(messages)
+        if not body.get("tools"):
+            if "You are updating the plan" in text:
+                raw = text.split("Plan:\n")[-1].split("\n\nGoal:")[0]
+                try:
+                    return {"content": json.dumps(ast.literal_eval(raw), ensure_ascii=False)}
+                except (ValueError, SyntaxError):
+                    pass
+            return {"content": json.dumps(scripted_plan(self.steps), ensure_ascii=False)}
+
+        last = messages[-1] if messages else {}
+        tool_names = {tool["function"]["name"] for tool in body["tools"]}
+        exec_tool = "python_exec" if "python_exec" in tool_names else "shell_exec"
+        is_report = "report generation expert" in text
+        if last.get("role") == "tool":
+            if is_report:
+                return {"content": REPORT_TEXT}
+            return {"content": f"Step finished. Output: {str(last.get('content'))[:120]}"}
+        # The report node keeps the content of the turn that produced the PDF as the final report.
+        if is_report and "render_report" in tool_names and "not created any .pdf" not in str(last.get("content")):
+            arguments = {"title": "Student performance", "sections": REPORT_SECTIONS}
+            return {"content": REPORT_TEXT, "tool_calls": [_tool_call("render_report", arguments)]}
+        if is_report:
+            code = REPORT_CODE
+        else:
+            column = STEP_COLUMNS[0]
+            for name in STEP_COLUMNS:
+                if f"Relate final grade G3 to {name}" in str(last.get("content")):
+                    column = name
+            code = STEP_CODE.format(target="G3", column=column)
+        if exec_tool == "shell_exec":
+            arguments = {"command": "python - <<'EOF'\nimport pandas as pd\n" + code + "\nEOF"}
+        else:
+            arguments = {"code": code}
+        content = REPORT_TEXT if is_report else ""
+        return {"content": content, "tool_calls": [_tool_call(exec_tool, arguments)]}
+
+
+class FakeOpenAIServer:
+    """ThreadingHTTPServer serving ``/v1/chat/completions`` from a ``Script``."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        completion_tokens: int = 200,
+        steps: int = 4,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.script = Script(steps)
+        self.requests = 0
+        self._prefixes: set[str] = set()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def cached_tokens(self, body: dict) -> int:
+        """Prompt tokens of the leading messages an earlier request already sent, and remember this one."""
+        messages = body.get("messages") or []
+        digest, cached, matching = hashlib.sha256(json.dumps(body.get("tools") or []).encode()), 0, True
+        with self._lock:
+            for message in messages:
+                digest.update(json.dumps(message, sort_keys=True).encode())
+                key = digest.hexdigest()
+                if matching and key in self._prefixes:
+                    cached += len(str(message.get("content") or "")) // 4
+                    continue
+                matching = False
+                self._prefixes.add(key)
+        return cached
+
+    def _delay(self) -> float:
+        generation = self.completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return self.latency + generation
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, content_type: str, data: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._send(200, "application/json", json.dumps({"data": [{"id": "fake", "object": "model"}]}).encode())
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                message = {"role": "assistant", **server.script.reply(body)}
+                time.sleep(server._delay())
+                usage = {
+                    "prompt_tokens": len(_text(body.get("messages") or [])) // 4,
+                    "completion_tokens": server.completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": server.cached_tokens(body)},
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                finish = "tool_calls" if message.get("tool_calls") else "stop"
+                if body.get("stream"):
+                    self._stream(body, message, finish, usage)
+                    return
+                out = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                    "usage": usage,
+                }
+                self._send(200, "application/json", json.dumps(out).encode())
+
+            def _stream(self, body: dict, message: dict, finish: str, usage: dict) -> None:
+                chunks = [{"role": "assistant", "content": ""}]
+                content = message.get("content") or ""
+                chunks += [{"content": content[i : i + 16]} for i in range(0, len(content), 16)]
+                chunks += [{"tool_calls": [dict(call, index=i)]} for i, call in enumerate(message.get("tool_calls") or [])]
+                events = []
+                for delta in chunks + [{}]:
+                    chunk = {
+                        "id": "chatcmpl-stream",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None if delta else finish}],
+                    }
+                    events.append(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+                events.append(b"data: [DONE]\n\n")
+                self._send(200, "text/event-stream", b"".join(events))
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scripted OpenAI-compatible server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="simulated decode speed, 0 = instant")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=4, help="steps in the scripted plan")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.tokens_per_second, args.completion_tokens, args.steps)
+    print(f"Serving scripted completions on {server.base_url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,114 @@
+"""Import-time budget for the agent's entry modules.
+
+Imports each module in a fresh interpreter with ``python -X importtime``, keeps
+the fastest of ``--repeat`` runs and compares the module's cumulative import
+time and the number of modules it pulls in with ``bench/importtime_baseline.json``.
+Exits 1 when a module got slower by more than ``--tolerance`` or imports more
+than ``MODULE_GROWTH`` more modules (a new eager dependency; unlike timings
+this does not depend on machine load), and prints the slowest imports behind it.
+
+    python bench/importtime.py
+    python bench/importtime.py --update-baseline
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+BASELINE = BENCH_DIR / "importtime_baseline.json"
+# graph/batch/streaming back the CLIs; nodes and tools are what a graph build adds on top.
+MODULES = ["graph", "batch", "streaming", "nodes", "tools"]
+# Differences below this are noise, whatever the relative change.
+MIN_REGRESSION_MS = 30.0
+MODULE_GROWTH = 0.1
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(module: str) -> tuple[float, list[tuple[float, str]]]:
+    """Cumulative import time of ``module`` in ms, and (self ms, name) of everything it imported."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # nodes refuses to import without a key; no request is made.
+    env.setdefault("OPENAI_API_KEY", "importtime")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total, imports = 0.0, []
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        imports.append((int(match.group(1)) / 1000, match.group(4)))
+        if match.group(4) == module and len(match.group(3)) == 1:
+            total = int(match.group(2)) / 1000
+    return total, imports
+
+
+def measure_all(modules: list[str], repeat: int) -> tuple[dict, dict]:
+    """{module: {"ms", "modules"}} and the per-import details of the fastest run."""
+    result, details = {}, {}
+    for module in modules:
+        total, details[module] = min((measure(module) for _ in range(repeat)), key=lambda run: run[0])
+        result[module] = {"ms": round(total, 1), "modules": len(details[module])}
+    return result, details
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[tuple[str, str]]:
+    """(module, human-readable regression) pairs of ``result`` against ``baseline``."""
+    regressions = []
+    for module, before in baseline.items():
+        now = result.get(module)
+        if now is None:
+            continue
+        if now["ms"] > before["ms"] * (1 + tolerance) and now["ms"] - before["ms"] > MIN_REGRESSION_MS:
+            regressions.append((module, f"import {module}: {now['ms']} ms > {before['ms']} ms (+{tolerance:.0%})"))
+        if now["modules"] > before["modules"] * (1 + MODULE_GROWTH):
+            regressions.append((module, f"import {module}: {now['modules']} modules > {before['modules']} (+{MODULE_GROWTH:.0%})"))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check import times of the agent modules against a budget.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5, help="imports per module; the fastest counts")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown")
+    parser.add_argument("--update-baseline", action="store_true", help="store these times as the new budget")
+    args = parser.parse_args()
+
+    result, details = measure_all(args.modules, args.repeat)
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    for module, now in result.items():
+        before = baseline.get(module)
+        budget = f"   (baseline {before['ms']:.1f} ms, {before['modules']} modules)" if before else ""
+        print(f"{module:<12} {now['ms']:>9.1f} ms {now['modules']:>6} modules{budget}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **result}, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline at {args.baseline}; create one with --update-baseline")
+        return 0
+    regressions = compare(result, baseline, args.tolerance)
+    for _, regression in regressions:
+        print(f"REGRESSION {regression}")
+    for module in sorted({module for module, _ in regressions}):
+        print(f"Slowest imports under {module}:")
+        for self_ms, name in sorted(details[module], reverse=True)[:10]:
+            print(f"    {self_ms:>8.1f} ms  {name}")
+    if not regressions:
+        print(f"No regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
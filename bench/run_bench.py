@@ -0,0 +1,275 @@
+"""End-to-end benchmark of the agent graph against the scripted fake server.
+
+Starts ``fake_openai.FakeOpenAIServer`` in-process, points the agent at it and at
+the bundled ``train-00000-of-00001.parquet`` (in a throwaway workspace), then,
+after one untimed warm-up run, runs the async graph at each concurrency level
+and reports runs/minute, run latency, per-node overhead (node time minus its
+LLM and tool spans), tool and LLM time and checkpoint cost per run. With a baseline file the run fails (exit
+code 1) when a metric regresses by more than ``--tolerance``.
+
+    python bench/run_bench.py --levels 1,4 --runs 4
+    python bench/run_bench.py --update-baseline
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+DATASET = ROOT / "train-00000-of-00001.parquet"
+BASELINE = BENCH_DIR / "baseline.json"
+# Differences below these are noise, whatever the relative change.
+MIN_REGRESSION_MS = 25.0
+MIN_REGRESSION_RUNS_PER_MINUTE = 1.0
+
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+
+def _configure_environment(server: FakeOpenAIServer, workspace: Path, checkpoint_backend: str) -> None:
+    """Settings must be in place before the agent modules are imported (they read them at import)."""
+    config_path = workspace / "bench_config.yaml"
+    config_path.write_text(json.dumps({"project": {"workspace": str(workspace)}}), encoding="utf-8")
+    os.environ.update({
+        "AGENT_CONFIG_PATH": str(config_path),
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": server.base_url,
+        "OPENAI_MODEL": "fake",
+        "DATASET_LOCAL_PATH": str(DATASET),
+        "CHECKPOINT_BACKEND": checkpoint_backend,
+        "CHECKPOINT_PATH": str(workspace / "checkpoints.sqlite"),
+        "LLM_CACHE_NODES": "",
+        # The benchmark attaches its own in-memory tracer.
+        "TRACING_ENABLED": "false",
+    })
+
+
+class CheckpointTimer:
+    """Wraps a checkpointer's async methods and accumulates the time spent in them."""
+
+    METHODS = ("aget_tuple", "aput", "aput_writes")
+
+    def __init__(self, checkpointer):
+        self.seconds = 0.0
+        self.calls = 0
+        for name in self.METHODS:
+            setattr(checkpointer, name, self._timed(getattr(checkpointer, name)))
+
+    def _timed(self, method):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.calls += 1
+
+        return timed
+
+    def reset(self) -> None:
+        self.seconds = 0.0
+        self.calls = 0
+
+
+def _p(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def _level_metrics(spans: list[dict], run_seconds: list[float], wall: float, checkpoint: CheckpointTimer) -> dict:
+    children: dict[str, float] = {}
+    for span in spans:
+        if span["kind"] in ("llm", "tool") and span["parentSpanId"]:
+            children[span["parentSpanId"]] = children.get(span["parentSpanId"], 0.0) + span["duration_ms"]
+    overhead: dict[str, list[float]] = {}
+    for span in spans:
+        if span["kind"] == "node":
+            overhead.setdefault(span["name"], []).append(max(0.0, span["duration_ms"] - children.get(span["spanId"], 0.0)))
+    tools = [span["duration_ms"] for span in spans if span["kind"] == "tool"]
+    llms = [span["duration_ms"] for span in spans if span["kind"] == "llm"]
+    prompt_tokens = sum(span["attributes"].get("prompt_tokens", 0) for span in spans if span["kind"] == "llm")
+    cached_tokens = sum(span["attributes"].get("cached_prompt_tokens", 0) for span in spans if span["kind"] == "llm")
+    runs = len(run_seconds)
+    return {
+        "runs": runs,
+        "wall_s": round(wall, 3),
+        "runs_per_minute": round(runs / wall * 60, 2),
+        "run_p50_s": round(_p(run_seconds, 0.5), 3),
+        "run_p95_s": round(_p(run_seconds, 0.95), 3),
+        "node_overhead_p50_ms": {name: round(_p(values, 0.5), 2) for name, values in sorted(overhead.items())},
+        "node_overhead_p95_ms": {name: round(_p(values, 0.95), 2) for name, values in sorted(overhead.items())},
+        "tool_p50_ms": round(_p(tools, 0.5), 2),
+        "tool_s_per_run": round(sum(tools) / 1000 / runs, 3),
+        "llm_p50_ms": round(_p(llms, 0.5), 2),
+        "llm_s_per_run": round(sum(llms) / 1000 / runs, 3),
+        "prompt_cached_share": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+        "checkpoint_ms_per_run": round(checkpoint.seconds * 1000 / runs, 2),
+        "checkpoint_calls_per_run": round(checkpoint.calls / runs, 1),
+    }
+
+
+async def run_level(concurrency: int, runs: int, checkpoint: CheckpointTimer) -> dict:
+    from graph import _run_config, build_inputs, get_async_graph
+    from tracing import SpanTracer
+
+    class Collector:
+        def __init__(self):
+            self.spans = []
+
+        def write(self, span: dict) -> None:
+            self.spans.append(span)
+
+    collector = Collector()
+    tracer = SpanTracer(collector)
+    semaphore = asyncio.Semaphore(concurrency)
+    run_seconds = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            config = {**_run_config(f"bench_c{concurrency}_{i}_{time.time_ns()}"), "callbacks": [tracer]}
+            started = time.perf_counter()
+            values = await get_async_graph().ainvoke(build_inputs("分析成绩与什么正相关, 文档名称为dataset.parquet", "bench"), config)
+            run_seconds.append(time.perf_counter() - started)
+            if not values.get("final_report"):
+                raise RuntimeError(f"Run {i} produced no report")
+
+    checkpoint.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    return _level_metrics(collector.spans, run_seconds, time.perf_counter() - started, checkpoint)
+
+
+async def run_levels(levels: list[int], runs: int, checkpoint: CheckpointTimer) -> dict:
+    # One untimed run first: imports and clients the agent creates on first use are not run cost.
+    await run_level(1, 1, checkpoint)
+    # Move that heap out of the collector's view; otherwise a full collection (100+ ms) of it lands
+    # in whichever timed call happens to be running and the metrics follow allocation counts.
+    gc.collect()
+    gc.freeze()
+    results = {}
+    for concurrency in levels:
+        results[str(concurrency)] = await run_level(concurrency, runs or max(2, 2 * concurrency), checkpoint)
+        _print_level(concurrency, results[str(concurrency)])
+    return results
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Human-readable regressions of ``result`` against ``baseline``."""
+    regressions = []
+    levels = baseline.get("levels", {})
+    # Overheads are compared uncontended (lowest level); at higher levels they mostly measure queueing.
+    overhead_level = min(levels, key=int) if levels else None
+    for level, base in levels.items():
+        current = result["levels"].get(level)
+        if current is None:
+            continue
+        lower_rpm = base["runs_per_minute"] * (1 - tolerance)
+        if current["runs_per_minute"] < lower_rpm and base["runs_per_minute"] - current["runs_per_minute"] > MIN_REGRESSION_RUNS_PER_MINUTE:
+            regressions.append(f"c={level} runs_per_minute {current['runs_per_minute']} < {base['runs_per_minute']} (-{tolerance:.0%})")
+        if level != overhead_level:
+            continue
+        checks =[("checkpoint_ms_per_run", base["checkpoint_ms_per_run"], current["checkpoint_ms_per_run"])]
+        checks += [
+            (f"node_overhead_p50_ms[{name}]", value, current["node_overhead_p50_ms"].get(name, 0.0))
+            for name, value in base["node_overhead_p50_ms"].items()
+        ]
+        for name, before, now in checks:
+            if now > before * (1 + tolerance) and now - before > MIN_REGRESSION_MS:
+                regressions.append(f"c={level} {name} {now} > {before} (+{tolerance:.0%})")
+    return regressions
+
+
+def _print_level(concurrency: int, metrics: dict) -> None:
+    print(
+        f"c={concurrency:<3} runs={metrics['runs']:<3} {metrics['runs_per_minute']:>8.1f} runs/min  "
+        f"run p50 {metrics['run_p50_s']:.2f}s p95 {metrics['run_p95_s']:.2f}s  "
+        f"llm {metrics['llm_s_per_run']:.2f}s/run  tool {metrics['tool_s_per_run']:.2f}s/run  "
+        f"checkpoint {metrics['checkpoint_ms_per_run']:.1f}ms/run  "
+        f"prompt cached {metrics.get('prompt_cached_share', 0.0):.0%}"
+    )
+    overhead = ", ".join(f"{name} {value:.1f}" for name, value in metrics["node_overhead_p50_ms"].items())
+    print(f"      node overhead p50 ms: {overhead}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the agent graph.")
+    parser.add_argument("--levels", default="1,4", help="comma-separated concurrency levels")
+    parser.add_argument("--runs", type=int, default=0, help="runs per level (default: 2 x concurrency, at least 2)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency per call in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=4, help="steps in the scripted plan")
+    parser.add_argument("--checkpoint", choices=("memory", "sqlite"), default="sqlite")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true", help="store this result as the new baseline")
+    parser.add_argument("--output", type=Path, help="also write the result JSON here")
+    parser.add_argument("--keep-workspace", action="store_true", help="keep the temporary workspace for inspection")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        steps=args.steps,
+    ).start()
+    workspace = Path(tempfile.mkdtemp(prefix="agent_bench_"))
+    _configure_environment(server, workspace, args.checkpoint)
+
+    import graph
+
+    checkpoint = CheckpointTimer(graph.get_async_graph().checkpointer)
+    # The agent logs every step at INFO; keep the benchmark output readable.
+    logging.getLogger("nodes").setLevel(logging.WARNING)
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    result = {
+        "settings": {key: getattr(args, key) for key in ("latency", "tokens_per_second", "completion_tokens", "steps", "checkpoint")},
+        "levels": {},
+    }
+    try:
+        result["levels"] = asyncio.run(run_levels(levels, args.runs, checkpoint))
+    finally:
+        server.stop()
+        from kernel import kernel_manager
+
+        kernel_manager.shutdown_all()
+        if args.keep_workspace:
+            print(f"Workspace kept at {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; create one with --update-baseline")
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("settings") != result["settings"]:
+        print("Baseline was recorded with different settings; comparison skipped")
+        return 0
+    regressions = compare(result, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
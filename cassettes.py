@@ -0,0 +1,239 @@
+"""Record-and-replay cassettes for whole runs.
+
+In ``record`` mode every LLM request/response and every tool input/output of a
+run is appended to ``workspace/cassettes/<thread_id>.jsonl.gz``. LLM calls are
+keyed by ``<node>/<step>/<n>`` (the n-th call of that node for that plan step)
+plus a hash of the request; tool calls by the tool_call_id the recorded model
+response issued. A ``replay`` run feeds the recorded responses back through the
+real graph: as long as each request hashes the same it costs no network or
+subprocess time. The first request that differs (a changed prompt, say) makes
+the run diverge, and from there on every call is live.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+import threading
+from pathlib import Path
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from config import WORKSPACE, get_setting
+from workspaces import LAST_USED_MARKER, RUNS_DIR, run_id_from_config, run_workspace, run_workspace_name
+
+logger = logging.getLogger(__name__)
+
+CASSETTES_DIR = WORKSPACE / get_setting("CASSETTES_DIR", "cassette.path", default="cassettes")
+# off | record: the mode of runs that do not choose one in their config (replays always choose).
+CASSETTE_MODE = get_setting("CASSETTE_MODE", "cassette.mode", default="off")
+
+
+def cassette_path(thread_id: str) -> Path:
+    return CASSETTES_DIR / (run_workspace_name(thread_id) + ".jsonl.gz")
+
+
+def _request_hash(node: str, messages: list) -> str:
+    # Only what the model sees: message ids, usage and response metadata differ between runs.
+    view = [
+        [
+            message.type,
+            message.content,
+            [[call["name"], call["args"], call["id"]] for call in getattr(message, "tool_calls", None) or []],
+            getattr(message, "tool_call_id", None),
+        ]
+        for message in messages
+    ]
+    payload = json.dumps([node, view], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _args_hash(args: dict) -> str:
+    return hashlib.sha256(json.dumps(args, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def read_cassette(thread_id: str) -> tuple[dict, dict, dict]:
+    """Recorded (run inputs, llm entries by key, tool entries by tool_call_id) of a run."""
+    run, llm_entries, tool_entries = {}, {}, {}
+    with gzip.open(cassette_path(thread_id), "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                entry = json.loads(line)
+                if entry["kind"] == "run":
+                    run = entry
+                elif entry["kind"] == "llm":
+                    llm_entries[entry["key"]] = entry
+                else:
+                    tool_entries[entry["call_id"]] = entry
+        except (EOFError, json.JSONDecodeError):
+            # A run killed while recording leaves a truncated last member.
+            pass
+    return run, llm_entries, tool_entries
+
+
+def recorded_inputs(thread_id: str) -> dict:
+    """user_id and user_message the recorded run was started with."""
+    run = read_cassette(thread_id)[0]
+    if not run:
+        raise ValueError(f"Cassette of {thread_id} has no run inputs")
+    return {"user_id": run["user_id"], "user_message": run["user_message"]}
+
+
+class CassetteSession:
+    """Record or replay state of one run (thread_id)."""
+
+    def __init__(self, thread_id: str, mode: str, source: str | None = None):
+        self.thread_id = thread_id
+        self.mode = mode
+        self.source = source or thread_id
+        self.diverged_at: str | None = None
+        self.stats = {"replayed_llm": 0, "live_llm": 0, "replayed_tools": 0, "live_tools": 0}
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._run, self._llm, self._tools = read_cassette(self.source) if mode == "replay" else ({}, {}, {})
+        if mode == "record":
+            CASSETTES_DIR.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay" and self.diverged_at is None
+
+    def _append(self, entry: dict) -> None:
+        # One gzip member per entry: cheap appends, and a crash loses at most the last call.
+        with self._lock, gzip.open(cassette_path(self.thread_id), "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def memory_context(self, build) -> str:
+        """The memory context of the run; a replay reuses the recorded one so its prompts match."""
+        if self.mode == "replay" and "memory_context" in self._run:
+            return self._run["memory_context"]
+        return build()
+
+    def record_run(self, user_id: str, user_message: str, memory_context: str) -> None:
+        if self.mode == "record":
+            self._append({"kind": "run", "user_id": user_id, "user_message": user_message, "memory_context": memory_context})
+
+    def _next_key(self, node: str, step) -> str:
+        scope = f"{node}/{'' if step is None else step}"
+        with self._lock:
+            n = self._counters.get(scope, 0)
+            self._counters[scope] = n + 1
+        return f"{scope}/{n}"
+
+    def _diverge(self, key: str) -> None:
+        with self._lock:
+            if self.diverged_at is None:
+                self.diverged_at = key
+                logger.info(f"Replay of {self.source} diverged at {key}; continuing with live calls")
+
+    def _replayed_response(self, key: str, request: str):
+        if not self.replaying:
+            return None
+        entry = self._llm.get(key)
+        if entry is None or entry["request"] != request:
+            self._diverge(key)
+            return None
+        self.stats["replayed_llm"] += 1
+        return messages_from_dict([entry["response"]])[0]
+
+    def _record_response(self, key: str, request: str, response) -> None:
+        self.stats["live_llm"] += 1
+        if self.mode == "record":
+            self._append({"kind": "llm", "key": key, "request": request, "response": messages_to_dict([response])[0]})
+
+    def llm(self, node: str, step, messages: list, call):
+        """Recorded response for this call, or ``call()`` (recorded in record mode)."""
+        key, request = self._next_key(node, step), _request_hash(node, messages)
+        response = self._replayed_response(key, request)
+        if response is None:
+            response = call()
+            self._record_response(key, request, response)
+        return response
+
+    async def allm(self, node: str, step, messages: list, call):
+        key, request = self._next_key(node, step), _request_hash(node, messages)
+        response = self._replayed_response(key, request)
+        if response is None:
+            response = await call()
+            self._record_response(key, request, response)
+        return response
+
+    def tool_results(self, calls: list[tuple]) -> list:
+        """Recorded result per (name, args, tool_call_id) call, ``None`` where it must run live."""
+        results = []
+        for name, args, tool_id in calls:
+            entry = self._tools.get(tool_id) if self.replaying else None
+            if entry and entry["name"] == name and entry["args"] == _args_hash(args):
+                self.stats["replayed_tools"] += 1
+                results.append(entry["result"])
+            else:
+                results.append(None)
+        return results
+
+    def record_tools(self, calls: list[tuple], results: list) -> None:
+        self.stats["live_tools"] += len(calls)
+        if self.mode != "record":
+            return
+        for (name, args, tool_id), result in zip(calls, results):
+            self._append({"kind": "tool", "call_id": tool_id, "name": name, "args": _args_hash(args), "result": result})
+
+
+class _Passthrough(CassetteSession):
+    """Session of a run without a cassette: every call is live and nothing is written."""
+
+    def __init__(self):
+        super().__init__("", "off")
+
+
+_PASSTHROUGH = _Passthrough()
+_sessions: dict[str, CassetteSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def session(config: dict | None) -> CassetteSession:
+    """Cassette session of the run ``config`` belongs to.
+
+    A run chooses its mode with ``configurable.cassette_mode`` (record or replay,
+    replaying ``configurable.cassette_source``); otherwise ``cassette.mode`` applies.
+    """
+    configurable = (config or {}).get("configurable") or {}
+    mode = configurable.get("cassette_mode") or CASSETTE_MODE
+    if mode not in ("record", "replay"):
+        return _PASSTHROUGH
+    thread_id = run_id_from_config(config)
+    with _sessions_lock:
+        if thread_id not in _sessions:
+            _sessions[thread_id] = CassetteSession(thread_id, mode, configurable.get("cassette_source"))
+        return _sessions[thread_id]
+
+
+def close(config: dict | None) -> dict | None:
+    """Forget the run's session and return its stats (None for runs without a cassette)."""
+    with _sessions_lock:
+        current = _sessions.pop(run_id_from_config(config), None)
+    if current is None:
+        return None
+    return {"mode": current.mode, "source": current.source, "diverged_at": current.diverged_at, **current.stats}
+
+
+def seed_workspace(source: str, thread_id: str) -> int:
+    """Copy the files of the recorded run's workspace into the replay's workspace.
+
+    Replayed tool calls do not run, so charts and PDFs they made come from here.
+    Copies rather than hardlinks: live calls after a divergence may rewrite them.
+    The dataset is linked by the planner as usual.
+    """
+    source_dir = RUNS_DIR / run_workspace_name(source)
+    if not source_dir.is_dir() or source == thread_id:
+        return 0
+    target_dir = run_workspace(thread_id)
+    copied = 0
+    for path in source_dir.rglob("*"):
+        relative = path.relative_to(source_dir)
+        target = target_dir / relative
+        if path.is_dir() or target.exists() or str(relative) in ("dataset.parquet", LAST_USED_MARKER):
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target)
+        copied += 1
+    return copied
@@ -0,0 +1,134 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from config import ROOT, WORKSPACE, get_setting
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ModuleNotFoundError:
+    SqliteSaver = None
+
+
+CHECKPOINT_BACKEND = get_setting("CHECKPOINT_BACKEND", "checkpoint.backend", default="memory")
+CHECKPOINT_PATH = ROOT / get_setting("CHECKPOINT_PATH", "checkpoint.path", default=WORKSPACE / "checkpoints.sqlite")
+# Checkpoints kept per thread; 0 keeps the full history.
+CHECKPOINT_KEEP_LAST = int(get_setting("CHECKPOINT_KEEP_LAST", "checkpoint.keep_last", default=20))
+
+_PRUNE_WRITES_SQL = (
+    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+    "ORDER BY checkpoint_id DESC LIMIT ?)"
+)
+_PRUNE_CHECKPOINTS_SQL = (
+    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+    "ORDER BY checkpoint_id DESC LIMIT ?)"
+)
+
+
+def _prune_params(config: dict, keep_last: int) -> tuple:
+    thread_id = str(config["configurable"]["thread_id"])
+    checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+    return (thread_id, checkpoint_ns, thread_id, checkpoint_ns, keep_last)
+
+
+class PruningMemorySaver(MemorySaver):
+    """MemorySaver that keeps only the last ``keep_last`` checkpoints per thread."""
+
+    def __init__(self, keep_last: int = CHECKPOINT_KEEP_LAST, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_last = keep_last
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        if self.keep_last > 0:
+            self._prune(next_config)
+        return next_config
+
+    def _prune(self, config: dict) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+        # Checkpoint ids are monotonic (uuid6), so lexical order is creation order.
+        for checkpoint_id in sorted(checkpoints)[: -self.keep_last]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        # Drop channel blobs no remaining checkpoint points at.
+        live_versions = set()
+        for serialized, _, _ in checkpoints.values():
+            saved = self.serde.loads_typed(serialized)
+            live_versions.update(saved["channel_versions"].items())
+        stale = [
+            key for key in self.blobs
+            if key[0] == thread_id and key[1] == checkpoint_ns and (key[2], key[3]) not in live_versions
+        ]
+        for key in stale:
+            del self.blobs[key]
+
+
+if SqliteSaver is not None:
+
+    class PruningSqliteSaver(SqliteSaver):
+        """SqliteSaver (WAL mode) that keeps only the last ``keep_last`` checkpoints per thread.
+
+        The async methods run the sync ones in a worker thread, so the same saver
+        serves both graph.invoke and the async graph without binding to a loop.
+        """
+
+        def __init__(self, conn: sqlite3.Connection, keep_last: int = CHECKPOINT_KEEP_LAST, **kwargs):
+            super().__init__(conn, **kwargs)
+            self.keep_last = keep_last
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            if self.keep_last > 0:
+                params = _prune_params(next_config, self.keep_last)
+                with self.cursor() as cur:
+                    cur.execute(_PRUNE_WRITES_SQL, params)
+                    cur.execute(_PRUNE_CHECKPOINTS_SQL, params)
+            return next_config
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            items = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+            )
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def build_checkpointer(backend: str | None = None, path: Path | None = None):
+    """Create the checkpointer selected by ``checkpoint.backend`` (memory or sqlite)."""
+    backend = backend or CHECKPOINT_BACKEND
+    if backend == "memory":
+        return PruningMemorySaver(keep_last=CHECKPOINT_KEEP_LAST)
+    if backend != "sqlite":
+        raise ValueError(f"Unknown checkpoint backend: {backend}")
+    if SqliteSaver is None:
+        raise ValueError(
+            "checkpoint.backend=sqlite requires langgraph-checkpoint-sqlite: pip install langgraph-checkpoint-sqlite"
+        )
+
+    path = Path(path or CHECKPOINT_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return PruningSqliteSaver(conn, keep_last=CHECKPOINT_KEEP_LAST)
@@ -42,6 +42,15 @@ def get_setting(env_name: str, config_path: str, default=None, required: bool =
     return value
 
 
+def setting_list(value) -> list[str]:
+    """A list setting given either as a YAML list or a comma-separated env string."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value)
+
+
 workspace_config = get_config("project.workspace", "workspace")
 WORKSPACE = (ROOT / workspace_config).resolve()
 WORKSPACE.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
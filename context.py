@@ -0,0 +1,242 @@
+import json
+import logging
+import re
+import threading
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Per-message overhead of the chat template (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+FOLDED_OBSERVATIONS_HEADER = "Summary of earlier completed steps (older observations folded to save context):"
+COMPACTED_PREFIX_RE = re.compile(r"^\[compacted [a-z ]+\] ")
+
+
+class TokenCounter:
+    """Counts tokens with the served model's tokenizer, falling back to a byte heuristic.
+
+    The tokenizer is loaded lazily on first use. Without an explicit
+    ``context.tokenizer`` setting only a locally cached copy is used, so counting
+    never triggers a download.
+    """
+
+    def __init__(self, tokenizer_name: str | None, local_files_only: bool = True):
+        self.tokenizer_name = tokenizer_name
+        self.local_files_only = local_files_only
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        if self._loaded:
+            return self._tokenizer
+        with self._lock:
+            if not self._loaded:
+                try:
+                    from transformers import AutoTokenizer
+
+                    self._tokenizer = AutoTokenizer.from_pretrained(
+                        self.tokenizer_name, local_files_only=self.local_files_only
+                    )
+                except Exception as e:
+                    logger.info(f"Tokenizer {self.tokenizer_name!r} unavailable ({type(e).__name__}), estimating tokens from bytes")
+                    self._tokenizer = None
+                self._loaded = True
+        return self._tokenizer
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self._get_tokenizer() if self.tokenizer_name else None
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        # ~3 UTF-8 bytes per token is conservative for mixed English/CJK text.
+        return len(text.encode("utf-8")) // 3 + 1
+
+    def count_message(self, message: BaseMessage) -> int:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(content)
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            tokens += self.count_text(json.dumps(tool_call.get("args"), ensure_ascii=False)) + MESSAGE_OVERHEAD_TOKENS
+        return tokens
+
+    def count_messages(self, messages: list[BaseMessage], tools: list | None = None) -> int:
+        tokens = sum(self.count_message(message) for message in messages)
+        for tool in tools or []:
+            tokens += self.count_text(json.dumps(convert_to_openai_tool(tool), ensure_ascii=False))
+        return tokens
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + " ..."
+
+
+class ContextManager:
+    """Keeps execute/report prompts under a token budget.
+
+    The most recent observations and tool results stay verbatim while the
+    prompt fits; older observations are folded into one rolling summary
+    message. Over budget, ``fit`` shrinks content from oldest and least needed
+    to newest and, as a last resort, drops whole turns, so every call stays
+    under the budget. Each ToolMessage stays with the AIMessage that requested it.
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        max_prompt_tokens: int = 12000,
+        keep_recent_observations: int = 3,
+        keep_recent_tool_results: int = 2,
+        summary_chars: int = 300,
+    ):
+        self.counter = counter
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_recent_observations = keep_recent_observations
+        self.keep_recent_tool_results = keep_recent_tool_results
+        self.summary_chars = summary_chars
+
+    def compact_observations(self, observations: list) -> list:
+        """Fold all but the most recent observations into one summary message.
+
+        State keeps the full observations; the fold is recomputed from them on
+        every call, so the summary rolls forward as steps complete.
+        """
+        observations = list(observations or [])
+        if len(observations) <= self.keep_recent_observations:
+            return observations
+        split = len(observations) - self.keep_recent_observations
+        older, recent = observations[:split], observations[split:]
+        lines = [FOLDED_OBSERVATIONS_HEADER]
+        for message in older:
+            content = message.content if isinstance(message, BaseMessage) else str(message)
+            lines.append(f"- {_shorten(content, self.summary_chars)}")
+        return [AIMessage(content="\n".join(lines))] + recent
+
+    def fit(self, messages: list[BaseMessage], tools: list | None = None) -> tuple[list[BaseMessage], int]:
+        """Compact ``messages`` until they fit the budget.
+
+        In order, stopping as soon as the prompt fits: older tool results and
+        tool-call arguments (e.g. ``create_file`` contents) become previews,
+        then observations, then every tool result and argument down to a
+        shorter preview. If that is not enough, the oldest turns are dropped
+        (observations, then tool turns, then context messages); the system
+        prompt and the latest turn are kept. Returns the messages and their
+        prompt token count.
+        """
+        tokens = self.counter.count_messages(messages, tools)
+        if tokens <= self.max_prompt_tokens:
+            return messages, tokens
+
+        messages = list(messages)
+        tool_indexes = [i for i, m in enumerate(messages) if isinstance(m, ToolMessage)]
+        call_indexes = [i for i, m in enumerate(messages) if isinstance(m, AIMessage) and m.tool_calls]
+        observation_indexes = [
+            i for i, m in enumerate(messages) if isinstance(m, AIMessage) and not m.tool_calls and i < len(messages) - 1
+        ]
+        keep = self.keep_recent_tool_results
+        passes = [
+            (tool_indexes[:-keep] if keep else tool_indexes, self.summary_chars),
+            (call_indexes[:-keep] if keep else call_indexes, self.summary_chars),
+            (observation_indexes, self.summary_chars),
+            (tool_indexes + call_indexes, self.summary_chars // 3),
+        ]
+        for indexes, preview_chars in passes:
+            for i in indexes:
+                if tokens <= self.max_prompt_tokens:
+                    return messages, tokens
+                message = messages[i]
+                compacted = _compact_message(message, preview_chars)
+                if compacted is not message:
+                    messages[i] = compacted
+                    tokens += self.counter.count_message(compacted) - self.counter.count_message(message)
+
+        if tokens > self.max_prompt_tokens:
+            messages, tokens = self._drop_oldest_turns(messages, tokens)
+        return messages, tokens
+
+    def _drop_oldest_turns(self, messages: list[BaseMessage], tokens: int) -> tuple[list[BaseMessage], int]:
+        # A turn is one message, or an AIMessage with tool calls together with its ToolMessages.
+        turns: list[list[int]] = []
+        for i, message in enumerate(messages):
+            if isinstance(message, ToolMessage) and turns:
+                turns[-1].append(i)
+            else:
+                turns.append([i])
+        latest_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=None)
+        droppable = [
+            turn for turn in turns[:-1]
+            if not isinstance(messages[turn[0]], SystemMessage) and latest_human not in turn
+        ]
+        dropped = set()
+        for turn in sorted(droppable, key=lambda turn: (_drop_rank(messages, turn), turn[0])):
+            if tokens <= self.max_prompt_tokens:
+                break
+            dropped.update(turn)
+            tokens -= sum(self.counter.count_message(messages[i]) for i in turn)
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} oldest messages to fit the prompt budget ({self.max_prompt_tokens})")
+        if tokens > self.max_prompt_tokens:
+            logger.warning(f"Prompt still {tokens} tokens after dropping old turns (budget {self.max_prompt_tokens})")
+        return [message for i, message in enumerate(messages) if i not in dropped], tokens
+
+
+def _drop_rank(messages: list[BaseMessage], turn: list[int]) -> int:
+    """Observations go first, then tool turns, then context messages (memory, dataset profile)."""
+    first = messages[turn[0]]
+    if isinstance(first, AIMessage):
+        return 1 if first.tool_calls else 0
+    return 2
+
+
+def _preview(text: str, label: str, max_chars: int) -> str | None:
+    """``text`` cut to a labelled preview, or None when it is already that short."""
+    text = COMPACTED_PREFIX_RE.sub("", text, count=1)
+    shortened = _shorten(text, max_chars)
+    if shortened == " ".join(text.split()):
+        return None
+    return f"[compacted {label}] {shortened}"
+
+
+def _compact_message(message: BaseMessage, preview_chars: int) -> BaseMessage:
+    """Copy of ``message`` with its content and long tool-call arguments cut to previews, or itself if already short."""
+    update = {}
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    preview = _preview(content, "tool result" if isinstance(message, ToolMessage) else "message", preview_chars)
+    if preview is not None and len(preview) < len(content):
+        update["content"] = preview
+    tool_calls = getattr(message, "tool_calls", None) or []
+    if any(_long_args(call.get("args"), preview_chars) for call in tool_calls):
+        update["tool_calls"] = [
+            {**call, "args": {key: _compact_arg(value, preview_chars) for key, value in (call.get("args") or {}).items()}}
+            for call in tool_calls
+        ]
+    return message.model_copy(update=update) if update else message
+
+
+def _long_args(args, max_chars: int) -> bool:
+    return any(_compact_arg(value, max_chars) is not value for value in (args or {}).values())
+
+
+def _compact_arg(value, max_chars: int):
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    preview = _preview(text, "argument", max_chars)
+    return value if preview is None or len(preview) >= len(text) else preview
+
+
+context_manager = ContextManager(
+    counter=TokenCounter(
+        get_setting("CONTEXT_TOKENIZER", "context.tokenizer", default=get_setting("OPENAI_MODEL", "llm.model")),
+        local_files_only=get_setting("CONTEXT_TOKENIZER", "context.tokenizer") is None,
+    ),
+    max_prompt_tokens=int(get_setting("CONTEXT_MAX_PROMPT_TOKENS", "context.max_prompt_tokens", default=12000)),
+    keep_recent_observations=int(get_setting("CONTEXT_KEEP_RECENT_OBSERVATIONS", "context.keep_recent_observations", default=3)),
+    keep_recent_tool_results=int(get_setting("CONTEXT_KEEP_RECENT_TOOL_RESULTS", "context.keep_recent_tool_results", default=2)),
+    summary_chars=int(get_setting("CONTEXT_SUMMARY_CHARS", "context.summary_chars", default=300)),
+)
@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from config import ROOT, WORKSPACE, get_setting
+from tools import hf_dataset_settings, load_dataset_from_settings
+
+logger = logging.getLogger(__name__)
+
+DATASET_CACHE_DIR = ROOT / get_setting("DATASET_CACHE_DIR", "dataset_cache.path", default=WORKSPACE / "dataset_cache")
+# Total size of cached parquet files before least-recently-used entries are evicted; 0 disables.
+DATASET_CACHE_MAX_BYTES = int(get_setting("DATASET_CACHE_MAX_BYTES", "dataset_cache.max_bytes", default=20 * 1024**3))
+# How long a branch -> commit sha lookup is reused before asking the Hub again.
+DATASET_REVISION_TTL_SECONDS = float(get_setting("DATASET_REVISION_TTL_SECONDS", "dataset_cache.revision_ttl_seconds", default=3600))
+# Seconds to wait for the Hub; after a failure it is not asked again for REVISION_RETRY_SECONDS.
+DATASET_REVISION_TIMEOUT = float(get_setting("DATASET_REVISION_TIMEOUT", "dataset_cache.revision_timeout", default=5))
+REVISION_RETRY_SECONDS = 300
+COMMIT_SHA_RE = re.compile(r"[0-9a-f]{40}")
+
+
+def resolve_revision(dataset: str, revision: str | None, timeout: float = DATASET_REVISION_TIMEOUT) -> str | None:
+    """Commit sha the Hub serves for ``revision`` (default branch if None), or None when offline."""
+    if os.environ.get("HF_HUB_OFFLINE", "").lower() in ("1", "true", "yes"):
+        return None
+    try:
+        from huggingface_hub import HfApi
+
+        return HfApi().dataset_info(dataset, revision=revision, timeout=timeout).sha
+    except Exception as e:
+        logger.warning(f"Could not resolve revision of {dataset}@{revision or 'main'}: {type(e).__name__}: {e}")
+        return None
+
+
+class DatasetCache:
+    """Content-addressed store of materialized parquet files.
+
+    Entries are keyed by (dataset, config, split, revision sha), written once
+    via an atomic rename, marked read-only and handed to runs as hardlinks, so a
+    hit skips both the download and the parquet conversion.
+    """
+
+    def __init__(
+        self,
+        root: Path = DATASET_CACHE_DIR,
+        max_bytes: int = DATASET_CACHE_MAX_BYTES,
+        revision_ttl: float = DATASET_REVISION_TTL_SECONDS,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revision_ttl = revision_ttl
+        self._lock = threading.Lock()
+        self._revisions_lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def resolve_sha(self, settings: dict) -> str | None:
+        """Commit sha for the configured revision without a Hub call on every run.
+
+        A pinned commit sha is used as is. Branch lookups are kept in
+        ``revisions.json`` (shared by processes) for ``revision_ttl`` seconds;
+        after a failed lookup the Hub is not asked again for a while and None
+        is returned, so the newest local entry is used without waiting.
+        """
+        revision = settings["revision"]
+        if revision and COMMIT_SHA_RE.fullmatch(revision):
+            return revision
+        key = f"{settings['dataset']}@{revision or ''}"
+        path = self.root / "revisions.json"
+        now = time.time()
+        with self._revisions_lock:
+            try:
+                revisions = json.loads(path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                revisions = {}
+            cached = revisions.get(key) or {}
+            if cached.get("sha") and now - cached["resolved_at"] < self.revision_ttl:
+                return cached["sha"]
+            if cached.get("failed_at") and now - cached["failed_at"] < REVISION_RETRY_SECONDS:
+                return None
+            sha = resolve_revision(settings["dataset"], revision)
+            revisions[key] = {"sha": sha, "resolved_at": now} if sha else {**cached, "failed_at": now}
+            tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+            tmp_path.write_text(json.dumps(revisions), encoding="utf-8")
+            os.replace(tmp_path, path)
+        return sha
+
+    @staticmethod
+    def _key(dataset: str, config: str | None, split: str, sha: str) -> str:
+        raw = json.dumps([dataset, config or "", split, sha])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return self.root / f"{key}.parquet", self.root / f"{key}.json"
+
+    def _entries(self) -> list[dict]:
+        entries = []
+        for meta_path in self.root.glob("*.json"):
+            try:
+                entry = json.loads(meta_path.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            # revisions.json and the dataset profiles share the directory.
+            if isinstance(entry, dict) and "key" in entry:
+                entries.append(entry)
+        return entries
+
+    def _valid(self, key: str) -> bool:
+        parquet_path, meta_path = self._paths(key)
+        if not parquet_path.exists() or not meta_path.exists():
+            return False
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        # A run that wrote through its hardlink would change the size.
+        return parquet_path.stat().st_size == meta.get("size")
+
+    def lookup(self, settings: dict | None = None) -> Path | None:
+        """Path of the cached parquet for the dataset, or None on a miss."""
+        settings = settings or hf_dataset_settings()
+        return self._lookup(settings, self.resolve_sha(settings))
+
+    def _lookup(self, settings: dict, sha: str | None) -> Path | None:
+        if sha is None:
+            return self._latest_offline(settings)
+        key = self._key(settings["dataset"], settings["config"], settings["split"], sha)
+        if self._valid(key):
+            parquet_path, meta_path = self._paths(key)
+            os.utime(meta_path)
+            return parquet_path
+        return None
+
+    def _latest_offline(self, settings: dict) -> Path | None:
+        # Hub unreachable: reuse the newest entry for the same dataset/config/split.
+        candidates = [
+            entry for entry in self._entries()
+            if (entry["dataset"], entry.get("config"), entry["split"])
+            == (settings["dataset"], settings["config"], settings["split"])
+            and (not settings["revision"] or entry.get("revision") == settings["revision"])
+            and self._valid(entry["key"])
+        ]
+        if not candidates:
+            return None
+        latest = max(candidates, key=lambda entry: entry["created_at"])
+        return self._paths(latest["key"])[0]
+
+    def get_or_create(self, settings: dict | None = None) -> Path:
+        """Cached parquet path, loading and converting the dataset only on a miss."""
+        settings = settings or hf_dataset_settings()
+        sha = self.resolve_sha(settings)
+        cached = self._lookup(settings, sha)
+        if cached is not None:
+            logger.info(f"Dataset cache hit: {cached.name}")
+            return cached
+
+        ds = load_dataset_from_settings({**settings, "revision": sha or settings["revision"]})
+        sha = sha or getattr(ds, "_fingerprint", None) or uuid.uuid4().hex
+        key = self._key(settings["dataset"], settings["config"], settings["split"], sha)
+        parquet_path, meta_path = self._paths(key)
+
+        # Write under a unique name and rename, so overlapping runs never see a partial file.
+        tmp_path = self.root / f".{key}.{uuid.uuid4().hex[:8]}.tmp"
+        ds.to_parquet(str(tmp_path))
+        tmp_path.chmod(0o444)
+        os.replace(tmp_path, parquet_path)
+        meta = {
+            "key": key,
+            "dataset": settings["dataset"],
+            "config": settings["config"],
+            "split": settings["split"],
+            "revision": settings["revision"],
+            "sha": sha,
+            "size": parquet_path.stat().st_size,
+            "created_at": time.time(),
+        }
+        meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        logger.info(f"Dataset cache miss, stored {parquet_path.name} ({meta['size']} bytes)")
+        self.evict(keep=parquet_path)
+        return parquet_path
+
+    def profile_path(self, source: Path) -> Path:
+        """Where the dataset profile of ``source`` is cached, shared by every run.
+
+        Next to a cache entry; for a local file (``tools.load_data.local_path``) in the
+        cache directory under a hash of its path. The profile itself records the
+        file's size and mtime, so a changed file is profiled again.
+        """
+        source = Path(source).resolve()
+        if source.parent == self.root.resolve():
+            return source.with_name(f"{source.stem}.profile.json")
+        digest = hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:32]
+        return self.root / f"local_{digest}.profile.json"
+
+    @staticmethod
+    def link(source: Path, target: Path) -> Path:
+        """Hardlink a cached parquet to ``target`` (symlink/copy when linking is impossible)."""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists() and os.path.samefile(source, target):
+            return target
+        tmp_target = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}")
+        try:
+            os.link(source, tmp_target)
+        except OSError:
+            try:
+                tmp_target.symlink_to(source)
+            except OSError:
+                shutil.copyfile(source, tmp_target)
+        os.replace(tmp_target, target)
+        return target
+
+    def link_into(self, target: Path, settings: dict | None = None) -> Path:
+        """Materialize the configured dataset (if needed) and hardlink it to ``target``."""
+        return self.link(self.get_or_create(settings), target)
+
+    def evict(self, keep: Path | None = None) -> None:
+        """Drop least-recently-used entries (never ``keep``) until the cache fits ``max_bytes``."""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            entries = []
+            for entry in self._entries():
+                parquet_path, meta_path = self._paths(entry["key"])
+                if parquet_path.exists():
+                    entries.append((meta_path.stat().st_mtime, parquet_path, meta_path))
+            total = sum(parquet_path.stat().st_size for _, parquet_path, _ in entries)
+            for _, parquet_path, meta_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if parquet_path == keep:
+                    continue
+                total -= parquet_path.stat().st_size
+                # Runs holding a hardlink keep their copy; only the cache's name goes away.
+                parquet_path.unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                parquet_path.with_name(f"{parquet_path.stem}.profile.json").unlink(missing_ok=True)
+
+
+dataset_cache = DatasetCache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local dataset cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("warm", help="materialize the configured dataset before peak hours")
+    warm.add_argument("--dataset")
+    warm.add_argument("--config")
+    warm.add_argument("--split")
+    warm.add_argument("--revision")
+    sub.add_parser("list", help="list cached datasets")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        if args.dataset:
+            os.environ["HF_DATASET"] = args.dataset
+        settings = hf_dataset_settings()
+        settings.update({name: getattr(args, name) for name in ("config", "split", "revision") if getattr(args, name)})
+        print(dataset_cache.get_or_create(settings))
+    else:
+        for entry in sorted(dataset_cache._entries(), key=lambda e: e["created_at"]):
+            print(f"{entry['key']}  {entry['dataset']}/{entry.get('config') or '-'}:{entry['split']}@{entry['sha'][:12]}  {entry['size']} bytes")
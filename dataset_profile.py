@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_VERSION = 1
+# Distinct values tracked per column before cardinality is reported as a lower bound.
+MAX_TRACKED_DISTINCT = 10000
+# Columns with at most this many distinct values also report their most common values.
+TOP_VALUES_MAX_CARDINALITY = 20
+
+
+def _is_numeric(arrow_type) -> bool:
+    import pyarrow as pa
+
+    return pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_boolean(arrow_type)
+
+
+def profile_parquet(path: Path, batch_size: int = 65536) -> dict:
+    """Profile a parquet file in one streaming pass over its record batches.
+
+    Computes schema, null counts, (capped) cardinalities, numeric summaries and a
+    pairwise-complete Pearson correlation matrix without loading the whole table.
+    """
+    # numpy/pyarrow are only needed on a profile cache miss; keep them off the import path.
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    names = schema.names
+    numeric = [name for name in names if _is_numeric(schema.field(name).type)]
+    k = len(numeric)
+
+    rows = 0
+    nulls = {name: 0 for name in names}
+    distinct: dict[str, set] = {name: set() for name in names}
+    saturated = set()
+    counts = {name: {} for name in names}
+    # Pairwise sufficient statistics over rows where both columns are present.
+    n = np.zeros((k, k))
+    sx = np.zeros((k, k))
+    sxx = np.zeros((k, k))
+    sxy = np.zeros((k, k))
+    col_min = np.full(k, np.inf)
+    col_max = np.full(k, -np.inf)
+
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        rows += batch.num_rows
+        for name in names:
+            column = batch.column(name)
+            nulls[name] += column.null_count
+            if name in saturated:
+                continue
+            value_counts = pc.value_counts(column.drop_null()).to_pylist()
+            for item in value_counts:
+                value = item["values"]
+                distinct[name].add(value)
+                if len(counts[name]) <= TOP_VALUES_MAX_CARDINALITY:
+                    counts[name][value] = counts[name].get(value, 0) + item["counts"]
+            if len(distinct[name]) > MAX_TRACKED_DISTINCT:
+                saturated.add(name)
+                distinct[name] = set()
+
+        if k:
+            x = np.column_stack([
+                batch.column(name).cast(pa.float64()).to_numpy(zero_copy_only=False) for name in numeric
+            ])
+            mask = ~np.isnan(x)
+            x0 = np.where(mask, x, 0.0)
+            m = mask.astype(np.float64)
+            n += m.T @ m
+            sx += x0.T @ m
+            sxx += (x0 * x0).T @ m
+            sxy += x0.T @ x0
+            col_min = np.fmin(col_min, np.nanmin(np.where(mask, x, np.inf), axis=0))
+            col_max = np.fmax(col_max, np.nanmax(np.where(mask, x, -np.inf), axis=0))
+
+    columns = {}
+    for name in names:
+        info = {
+            "type": str(schema.field(name).type),
+            "nulls": nulls[name],
+            "distinct": f">{MAX_TRACKED_DISTINCT}" if name in saturated else len(distinct[name]),
+        }
+        if name not in saturated and len(distinct[name]) <= TOP_VALUES_MAX_CARDINALITY:
+            top = sorted(counts[name].items(), key=lambda item: -item[1])[:5]
+            info["top_values"] = [[str(value), count] for value, count in top]
+        columns[name] = info
+
+    correlations = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, name in enumerate(numeric):
+            count = n[i, i]
+            if count:
+                mean = sx[i, i] / count
+                var = max(sxx[i, i] / count - mean * mean, 0.0)
+                columns[name].update({
+                    "mean": round(float(mean), 4),
+                    "std": round(float(np.sqrt(var * count / (count - 1))) if count > 1 else 0.0, 4),
+                    "min": float(col_min[i]),
+                    "max": float(col_max[i]),
+                })
+        sy = sx.T
+        syy = sxx.T
+        corr = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+        for i, a in enumerate(numeric):
+            correlations[a] = {
+                b: (None if not np.isfinite(corr[i, j]) else round(float(corr[i, j]), 4))
+                for j, b in enumerate(numeric)
+            }
+
+    return {
+        "version": PROFILE_VERSION,
+        "rows": rows,
+        "columns": columns,
+        "numeric_columns": numeric,
+        "correlations": correlations,
+    }
+
+
+def load_or_build_profile(path: Path, profile_path: Path | None = None) -> dict:
+    """Profile ``path``, reusing ``profile_path`` (default ``<name>.profile.json`` next to it) while the file is unchanged."""
+    path = Path(path)
+    profile_path = Path(profile_path) if profile_path else path.with_name(f"{path.stem}.profile.json")
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "version": PROFILE_VERSION}
+    if profile_path.exists():
+        try:
+            cached = json.loads(profile_path.read_text(encoding="utf-8"))
+            if cached.get("fingerprint") == fingerprint:
+                return cached["profile"]
+        except Exception:
+            pass
+    profile = profile_parquet(path)
+    tmp_path = profile_path.with_name(f".{profile_path.name}.{uuid.uuid4().hex[:8]}")
+    tmp_path.write_text(json.dumps({"fingerprint": fingerprint, "profile": profile}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, profile_path)
+    return profile
+
+
+def render_profile(profile: dict, file_name: str = "dataset.parquet", max_columns: int = 60, top_correlations: int = 10) -> str:
+    """Compact text form of a profile for prompts."""
+    columns = profile["columns"]
+    lines = [f"{file_name}: {profile['rows']} rows, {len(columns)} columns"]
+    for name, info in list(columns.items())[:max_columns]:
+        parts = [f"{info['type']}", f"nulls={info['nulls']}", f"distinct={info['distinct']}"]
+        if "mean" in info:
+            parts.append(f"mean={info['mean']} std={info['std']} min={info['min']} max={info['max']}")
+        if "top_values" in info:
+            parts.append("top=" + ", ".join(f"{value}({count})" for value, count in info["top_values"]))
+        lines.append(f"- {name}: " + "; ".join(parts))
+    if len(columns) > max_columns:
+        lines.append(f"- ... {len(columns) - max_columns} more columns")
+
+    pairs = []
+    numeric = profile["numeric_columns"]
+    for i, a in enumerate(numeric):
+        for b in numeric[i + 1 :]:
+            value = profile["correlations"][a][b]
+            if value is not None:
+                pairs.append((abs(value), a, b, value))
+    if pairs:
+        lines.append("Strongest correlations (Pearson):")
+        for _, a, b, value in sorted(pairs, reverse=True)[:top_correlations]:
+            lines.append(f"- {a} ~ {b}: {value}")
+    return "\n".join(lines)
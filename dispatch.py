@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Worker threads shared by all tool calls of all runs in this process.
+TOOL_MAX_WORKERS = int(get_setting("TOOL_MAX_WORKERS", "tools.dispatch.max_workers", default=4))
+FILE_TOOLS = {"create_file", "str_replace"}
+EXEC_TOOLS = {"shell_exec", "python_exec"}
+
+
+def _call_text(name: str, args: dict) -> str:
+    if name == "shell_exec":
+        return str(args.get("command") or "")
+    if name == "python_exec":
+        return str(args.get("code") or "")
+    return ""
+
+
+def _call_path(name: str, args: dict) -> str | None:
+    if name in FILE_TOOLS and args.get("file_name"):
+        return os.path.normpath(str(args["file_name"]))
+    return None
+
+
+def _mentions(text: str, path: str) -> bool:
+    return path in text or os.path.basename(path) in text
+
+
+def _conflicts(earlier: tuple, later: tuple) -> bool:
+    """Whether ``later`` must wait for ``earlier`` (both are (name, args) of one turn)."""
+    (name_a, args_a), (name_b, args_b) = earlier, later
+    path_a, path_b = _call_path(name_a, args_a), _call_path(name_b, args_b)
+    if path_a and path_b:
+        return path_a == path_b
+    if name_a in EXEC_TOOLS and name_b in EXEC_TOOLS:
+        # Commands share the workspace (and python_exec a kernel), keep them in order.
+        return True
+    if path_a and name_b in EXEC_TOOLS:
+        return _mentions(_call_text(name_b, args_b), path_a)
+    if name_a in EXEC_TOOLS and path_b:
+        return _mentions(_call_text(name_a, args_a), path_b)
+    # Anything unknown is ordered conservatively.
+    return True
+
+
+def call_dependencies(calls: list[tuple]) -> list[set[int]]:
+    """For each (name, args) call, the indexes of earlier calls it must run after."""
+    return [
+        {j for j in range(i) if _conflicts(calls[j], calls[i])}
+        for i in range(len(calls))
+    ]
+
+
+class ToolDispatcher:
+    """Runs the tool calls of one model turn concurrently where that is safe.
+
+    Calls on the same file path run in turn order, commands run in turn order,
+    and a command waits for earlier writes to files it names. Results come back
+    in the order of ``calls`` so ToolMessages line up with the model's tool_calls.
+    """
+
+    def __init__(self, tools: dict, max_workers: int = TOOL_MAX_WORKERS):
+        self.tools = tools
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+        self._semaphore: asyncio.Semaphore | None = None
+        self._semaphore_loop = None
+
+    def run(self, calls: list[tuple], config=None) -> list:
+        """Invoke ``calls`` (name, args) and return their results in order.
+
+        ``config`` is one RunnableConfig for all calls or a list with one per call.
+        """
+        configs = config if isinstance(config, list) else [config] * len(calls)
+        if len(calls) <= 1 or self.max_workers == 1:
+            return [self.tools[name].invoke(args, configs[i]) for i, (name, args) in enumerate(calls)]
+        dependencies = call_dependencies(calls)
+        futures: list[Future] = []
+
+        def invoke(i: int):
+            # Dependencies were submitted earlier, so they are running or done (FIFO pool).
+            for j in dependencies[i]:
+                futures[j].exception()
+            name, args = calls[i]
+            return self.tools[name].invoke(args, configs[i])
+
+        for i in range(len(calls)):
+            futures.append(self._pool.submit(invoke, i))
+        return [future.result() for future in futures]
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def arun(self, calls: list[tuple], config=None) -> list:
+        """Async variant of ``run``."""
+        configs = config if isinstance(config, list) else [config] * len(calls)
+        if len(calls) <= 1 or self.max_workers == 1:
+            return [await self.tools[name].ainvoke(args, configs[i]) for i, (name, args) in enumerate(calls)]
+        dependencies = call_dependencies(calls)
+        semaphore = self._get_semaphore()
+        tasks: list[asyncio.Task] = []
+
+        async def invoke(i: int):
+            if dependencies[i]:
+                await asyncio.wait([tasks[j] for j in dependencies[i]])
+            name, args = calls[i]
+            async with semaphore:
+                return await self.tools[name].ainvoke(args, configs[i])
+
+        for i in range(len(calls)):
+            tasks.append(asyncio.ensure_future(invoke(i)))
+        return await asyncio.gather(*tasks)
@@ -1,30 +1,61 @@
-from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-from state import State
-from nodes import (
-    report_node,
-    execute_node,
-    create_planner_node,
-    update_planner_node
-)
-
-
-def _build_base_graph():
+import argparse
+import threading
+import uuid
+
+# langgraph, the node module (LLM client, tools) and the checkpointer are imported when a
+# graph is first built, so importing this module (CLI --help, workers) stays cheap.
+
+# Node functions by name in nodes.py; callables are accepted too.
+SYNC_NODES = {
+    "create_planner": "create_planner_node",
+    "update_planner": "update_planner_node",
+    "execute": "execute_node",
+    "execute_step": "execute_step_node",
+    "merge_steps": "merge_steps_node",
+    "report": "report_node",
+}
+ASYNC_NODES = {
+    "create_planner": "acreate_planner_node",
+    "update_planner": "aupdate_planner_node",
+    "execute": "execute_node",
+    "execute_step": "aexecute_step_node",
+    "merge_steps": "merge_steps_node",
+    "report": "areport_node",
+}
+
+
+def _resolve_nodes(nodes: dict) -> dict:
+    import nodes as node_module
+
+    return {name: getattr(node_module, fn) if isinstance(fn, str) else fn for name, fn in nodes.items()}
+
+
+def _build_base_graph(nodes: dict = SYNC_NODES):
     """Build and return the base state graph with all nodes and edges."""
+    from langgraph.graph import StateGraph, START, END
+    from state import State
+
+    nodes = _resolve_nodes(nodes)
     builder = StateGraph(State)
     builder.add_edge(START, "create_planner")
-    builder.add_node("create_planner", create_planner_node)
-    builder.add_node("update_planner", update_planner_node)
-    builder.add_node("execute", execute_node)
-    builder.add_node("report", report_node)
+    builder.add_node("create_planner", nodes["create_planner"])
+    builder.add_node("update_planner", nodes["update_planner"])
+    builder.add_node("execute", nodes["execute"])
+    # execute fans ready steps out to execute_step via Send; merge_steps joins them.
+    builder.add_node("execute_step", nodes["execute_step"])
+    builder.add_node("merge_steps", nodes["merge_steps"])
+    builder.add_node("report", nodes["report"])
+    builder.add_edge("execute_step", "merge_steps")
     builder.add_edge("report", END)
     return builder
 
 
-def build_graph_with_memory():
-    """Build and return the agent workflow graph with checkpoint memory."""
-    memory = MemorySaver()
-    builder = _build_base_graph()
+def build_graph_with_memory(nodes: dict = SYNC_NODES):
+    """Build and return the agent workflow graph with the configured checkpointer."""
+    from checkpoint import build_checkpointer
+
+    memory = build_checkpointer()
+    builder = _build_base_graph(nodes)
     return builder.compile(checkpointer=memory)
 
 
@@ -33,16 +64,143 @@ def build_graph():
     return build_graph_with_memory()
 
 
+def build_async_graph():
+    """Build the memory-enabled graph with async nodes, for use with ainvoke/astream."""
+    return build_graph_with_memory(ASYNC_NODES)
 
-graph = build_graph()
 
-
-if __name__ == "__main__":
-    inputs = {
-        "user_id": "demo_user",
-        "user_message": "对所给文档进行分析，生成一份分析报告，需要用图表为结论证明，不需要分析太多内容，只需要分析成绩与什么正相关即可,文档名称为dataset.parquet",
+def build_inputs(user_message: str, user_id: str = "default") -> dict:
+    return {
+        "user_id": user_id,
+        "user_message": user_message,
         "plan": None,
         "observations": [],
         "final_report": "",
     }
-    graph.invoke(inputs, {"recursion_limit": 100, "configurable": {"thread_id": "demo_user_thread"}})
+
+
+def _run_config(thread_id: str, recursion_limit: int = 100) -> dict:
+    from tracing import run_callbacks
+
+    return {"recursion_limit": recursion_limit, "configurable": {"thread_id": thread_id}, "callbacks": run_callbacks()}
+
+
+_graphs: dict = {}
+_graphs_lock = threading.Lock()
+
+
+def _compiled(name: str, build):
+    if name not in _graphs:
+        with _graphs_lock:
+            if name not in _graphs:
+                _graphs[name] = build()
+    return _graphs[name]
+
+
+def get_graph():
+    """The shared sync graph, compiled on first use."""
+    return _compiled("graph", build_graph)
+
+
+def get_async_graph():
+    """The shared async graph, compiled on first use."""
+    return _compiled("async_graph", build_async_graph)
+
+
+def __getattr__(name: str):
+    # ``graph.graph`` and ``graph.async_graph`` are built on first access.
+    if name == "graph":
+        return get_graph()
+    if name == "async_graph":
+        return get_async_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def arun(user_message: str, user_id: str = "default", thread_id: str | None = None, recursion_limit: int = 100):
+    """Run one analysis on the async graph.
+
+    Many calls can be awaited concurrently on one event loop (e.g. with asyncio.gather);
+    they share the module-level LLM client and its HTTP connection pool.
+    """
+    thread_id = thread_id or f"{user_id}_{uuid.uuid4().hex[:8]}"
+    config = _run_config(thread_id, recursion_limit)
+    return await get_async_graph().ainvoke(build_inputs(user_message, user_id), config)
+
+
+def resume(thread_id: str, recursion_limit: int = 100):
+    """Continue an interrupted run from its last checkpoint.
+
+    Completed steps are not re-executed; with checkpoint.backend=sqlite this
+    also works after a process restart. Returns the final state, or the saved
+    state unchanged if the run had already finished.
+    """
+    config = _run_config(thread_id, recursion_limit)
+    graph = get_graph()
+    snapshot = graph.get_state(config)
+    if not snapshot.next:
+        return snapshot.values
+    return graph.invoke(None, config)
+
+
+async def aresume(thread_id: str, recursion_limit: int = 100):
+    config = _run_config(thread_id, recursion_limit)
+    async_graph = get_async_graph()
+    snapshot = await async_graph.aget_state(config)
+    if not snapshot.next:
+        return snapshot.values
+    return await async_graph.ainvoke(None, config)
+
+
+def _replay(source_thread_id: str, thread_id: str | None, recursion_limit: int) -> tuple[dict, dict]:
+    from cassettes import recorded_inputs
+
+    config = _run_config(thread_id or f"{source_thread_id}_replay_{uuid.uuid4().hex[:8]}", recursion_limit)
+    config["configurable"].update({"cassette_mode": "replay", "cassette_source": source_thread_id})
+    inputs = recorded_inputs(source_thread_id)
+    return build_inputs(inputs["user_message"], inputs["user_id"]), config
+
+
+def replay(source_thread_id: str, thread_id: str | None = None, recursion_limit: int = 100):
+    """Run a recorded run (cassette.mode=record) again under a new thread_id.
+
+    Recorded LLM responses and tool results are fed back as long as the prompts
+    match the recording; from the first changed prompt on, calls are live.
+    """
+    inputs, config = _replay(source_thread_id, thread_id, recursion_limit)
+    return get_graph().invoke(inputs, config)
+
+
+async def areplay(source_thread_id: str, thread_id: str | None = None, recursion_limit: int = 100):
+    inputs, config = _replay(source_thread_id, thread_id, recursion_limit)
+    return await get_async_graph().ainvoke(inputs, config)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the dataset analysis agent.")
+    parser.add_argument("--resume", metavar="THREAD_ID", help="resume a run from its last checkpoint")
+    parser.add_argument("--replay", metavar="THREAD_ID", help="replay a recorded run from its cassette")
+    parser.add_argument("--serve", action="store_true", help="serve runs as Server-Sent Events")
+    parser.add_argument("--host", help="host for --serve (server.host)")
+    parser.add_argument("--port", type=int, help="port for --serve (server.port)")
+    args = parser.parse_args()
+    if args.resume:
+        resume(args.resume)
+        raise SystemExit(0)
+    if args.replay:
+        replay(args.replay)
+        raise SystemExit(0)
+    if args.serve:
+        import asyncio
+        import logging
+
+        import streaming
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        asyncio.run(streaming.serve(args.host or streaming.SERVER_HOST, args.port or streaming.SERVER_PORT))
+        raise SystemExit(0)
+
+    inputs = build_inputs(
+        user_id="demo_user",
+        user_message="对所给文档进行分析，生成一份分析报告，需要用图表为结论证明，不需要分析太多内容，只需要分析成绩与什么正相关即可,文档名称为dataset.parquet",
+    )
+    get_graph().invoke(inputs, _run_config("demo_user_thread"))
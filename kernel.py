@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from config import ROOT, WORKSPACE, get_setting
+
+logger = logging.getLogger(__name__)
+
+KERNEL_WORKER = ROOT / "kernel_worker.py"
+# Wall-clock limit for one python_exec call; the kernel is restarted when it is hit.
+PYTHON_EXEC_TIMEOUT = float(get_setting("PYTHON_EXEC_TIMEOUT", "tools.python_exec.timeout", default=600))
+# Kernels idle for longer than this are shut down by the reaper; 0 disables.
+PYTHON_EXEC_IDLE_TIMEOUT = float(get_setting("PYTHON_EXEC_IDLE_TIMEOUT", "tools.python_exec.idle_timeout", default=900))
+# stdout/stderr characters kept per call (head and tail); the tool result shows a shorter preview.
+PYTHON_EXEC_MAX_CAPTURE_CHARS = int(get_setting("PYTHON_EXEC_MAX_CAPTURE_CHARS", "tools.python_exec.max_capture_chars", default=1_000_000))
+KERNEL_START_TIMEOUT = 60
+# Upper bound of one response line: both capped streams, JSON-escaped (at most 6 bytes a character).
+MAX_RESPONSE_BYTES = 12 * PYTHON_EXEC_MAX_CAPTURE_CHARS + 65536
+
+
+class KernelDied(RuntimeError):
+    pass
+
+
+class PythonKernel:
+    """One long-lived ``kernel_worker.py`` process with a persistent namespace.
+
+    Requests go over the worker's stdin, replies come back on a dedicated pipe,
+    so anything the executed code writes to the real fd 1/2 cannot corrupt the
+    protocol. Calls are serialized; the worker is (re)started on demand.
+    """
+
+    def __init__(self, cwd: Path = WORKSPACE, timeout: float = PYTHON_EXEC_TIMEOUT):
+        self.cwd = Path(cwd)
+        self.timeout = timeout
+        self.last_used = time.monotonic()
+        self._proc: subprocess.Popen | None = None
+        self._responses_fd: int | None = None
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _start(self) -> None:
+        self.cwd.mkdir(parents=True, exist_ok=True)
+        read_fd, write_fd = os.pipe()
+        try:
+            self._proc = subprocess.Popen(
+                [sys.executable, "-u", str(KERNEL_WORKER), str(write_fd)],
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(write_fd,),
+                start_new_session=True,
+            )
+        finally:
+            os.close(write_fd)
+        self._responses_fd = read_fd
+        self._buffer = bytearray()
+        self._read_response(time.monotonic() + KERNEL_START_TIMEOUT)
+        logger.info(f"Started python kernel pid={self._proc.pid} cwd={self.cwd}")
+
+    def _read_response(self, deadline: float) -> dict:
+        scanned = 0
+        while (end := self._buffer.find(b"\n", scanned)) < 0:
+            scanned = len(self._buffer)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            ready, _, _ = select.select([self._responses_fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(self._responses_fd, 65536)
+            if not chunk:
+                raise KernelDied(f"kernel exited with code {self._proc.wait()}")
+            self._buffer += chunk
+            if len(self._buffer) > MAX_RESPONSE_BYTES:
+                raise KernelDied(f"response exceeded {MAX_RESPONSE_BYTES} bytes")
+        line = bytes(self._buffer[:end])
+        del self._buffer[: end + 1]
+        return json.loads(line)
+
+    def _stop(self) -> None:
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                # The worker leads its own session, so this also reaches anything it spawned.
+                try:
+                    os.killpg(self._proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            self._proc.wait()
+            if self._proc.stdin:
+                self._proc.stdin.close()
+        if self._responses_fd is not None:
+            os.close(self._responses_fd)
+        self._proc = None
+        self._responses_fd = None
+        self._buffer = bytearray()
+
+    def execute(self, code: str, timeout: float | None = None) -> dict:
+        """Run ``code`` in the kernel; returns stdout, stderr, exit_code and whether state was lost."""
+        timeout = timeout or self.timeout
+        with self._lock:
+            self.last_used = time.monotonic()
+            restarted = self._proc is not None and not self.alive
+            try:
+                if not self.alive:
+                    self._stop()
+                    self._start()
+                request = {"code": code, "max_output_chars": PYTHON_EXEC_MAX_CAPTURE_CHARS}
+                self._proc.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+                self._proc.stdin.flush()
+                result = self._read_response(time.monotonic() + timeout)
+                result["restarted"] = restarted
+                return result
+            except TimeoutError:
+                self._stop()
+                return {
+                    "stdout": "",
+                    "stderr": f"Execution timed out after {timeout:.0f}s; the kernel was killed and its variables are lost.",
+                    "exit_code": -signal.SIGKILL,
+                }
+            except (KernelDied, BrokenPipeError) as e:
+                self._stop()
+                return {
+                    "stdout": "",
+                    "stderr": f"Python kernel crashed ({e}); it will restart on the next call and its variables are lost.",
+                    "exit_code": -1,
+                }
+            finally:
+                self.last_used = time.monotonic()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._stop()
+
+
+class KernelManager:
+    """Per-run kernels keyed by run id, with a reaper thread for idle ones."""
+
+    def __init__(self, idle_timeout: float = PYTHON_EXEC_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._kernels: dict[str, PythonKernel] = {}
+        self._lock = threading.Lock()
+        self._reaper: threading.Thread | None = None
+
+    def get(self, run_id: str, cwd: Path = WORKSPACE) -> PythonKernel:
+        with self._lock:
+            kernel = self._kernels.get(run_id)
+            if kernel is None:
+                kernel = self._kernels[run_id] = PythonKernel(cwd=cwd)
+            if self.idle_timeout > 0 and self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_forever, name="kernel-reaper", daemon=True)
+                self._reaper.start()
+            return kernel
+
+    def shutdown(self, run_id: str) -> None:
+        with self._lock:
+            kernel = self._kernels.pop(run_id, None)
+        if kernel is not None:
+            kernel.shutdown()
+
+    def shutdown_all(self) -> None:
+        with self._lock:
+            kernels, self._kernels = list(self._kernels.values()), {}
+        for kernel in kernels:
+            kernel.shutdown()
+
+    def reap_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                run_id for run_id, kernel in self._kernels.items()
+                if now - kernel.last_used > self.idle_timeout and not kernel._lock.locked()
+            ]
+            kernels = [self._kernels.pop(run_id) for run_id in idle]
+        for run_id, kernel in zip(idle, kernels):
+            logger.info(f"Shutting down idle python kernel for run {run_id}")
+            kernel.shutdown()
+
+    def _reap_forever(self) -> None:
+        interval = max(1.0, min(60.0, self.idle_timeout / 4))
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap_idle()
+            except Exception:
+                logger.exception("Kernel reaper failed")
+
+
+kernel_manager = KernelManager()
@@ -0,0 +1,122 @@
+"""Worker process behind the python_exec tool.
+
+Reads one JSON request per line from stdin, executes the code in a namespace
+that persists across requests and writes one JSON response per line to the
+file descriptor given on the command line. Kept free of project imports so it
+starts fast.
+"""
+import io
+import json
+import os
+import sys
+import traceback
+from collections import deque
+from contextlib import redirect_stderr, redirect_stdout
+
+# Characters of stdout/stderr kept per call when the request does not say.
+DEFAULT_MAX_CAPTURE_CHARS = 1_000_000
+
+
+class HeadTailCapture(io.TextIOBase):
+    """Keeps the first and last ``max_chars // 2`` characters written, like shell.py's OutputPreview,
+    so a print loop cannot fill the kernel's (or the parent's) memory."""
+
+    def __init__(self, max_chars: int):
+        self.head_chars = max_chars // 2
+        self.tail_chars = max_chars - self.head_chars
+        self.head: list[str] = []
+        self.head_len = 0
+        self.tail: deque[str] = deque()
+        self.tail_len = 0
+        self.total = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        size = len(text)
+        self.total += size
+        if self.head_len < self.head_chars:
+            take = text[: self.head_chars - self.head_len]
+            self.head.append(take)
+            self.head_len += len(take)
+            text = text[len(take):]
+        if text and self.tail_chars:
+            self.tail.append(text)
+            self.tail_len += len(text)
+            while self.tail_len - len(self.tail[0]) >= self.tail_chars:
+                self.tail_len -= len(self.tail.popleft())
+        return size
+
+    def getvalue(self) -> str:
+        head = "".join(self.head)
+        tail = "".join(self.tail)[-self.tail_chars:] if self.tail_chars else ""
+        omitted = self.total - len(head) - len(tail)
+        if omitted <= 0:
+            return head + tail
+        return f"{head}\n... [truncated {omitted} chars] ...\n{tail}"
+
+
+def _preload(namespace: dict) -> None:
+    # Paid once per kernel instead of once per script.
+    try:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        namespace["plt"] = plt
+    except ImportError:
+        pass
+    for alias, module in (("np", "numpy"), ("pd", "pandas")):
+        try:
+            namespace[alias] = __import__(module)
+        except ImportError:
+            pass
+
+
+def _exit_code(exit: SystemExit) -> int:
+    # Same mapping as the interpreter: sys.exit() / None is success, a message is printed and means 1.
+    if exit.code is None:
+        return 0
+    if isinstance(exit.code, int):
+        return exit.code
+    print(exit.code, file=sys.stderr)
+    return 1
+
+
+def main(response_fd: int) -> None:
+    responses = os.fdopen(response_fd, "w", encoding="utf-8")
+    # Requests arrive on fd 0; move them to a private fd and give user code (and anything it
+    # spawns) an empty stdin, so input() cannot consume the protocol.
+    requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+    namespace = {"__name__": "__main__"}
+    _preload(namespace)
+    responses.write(json.dumps({"ready": True}) + "\n")
+    responses.flush()
+
+    for line in requests:
+        request = json.loads(line)
+        max_chars = request.get("max_output_chars") or DEFAULT_MAX_CAPTURE_CHARS
+        stdout, stderr = HeadTailCapture(max_chars), HeadTailCapture(max_chars)
+        exit_code = 0
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                exec(compile(request["code"], "<python_exec>", "exec"), namespace)
+            except SystemExit as e:
+                exit_code = _exit_code(e)
+            except BaseException as e:
+                # Skip this module's frame so the traceback starts at the user's code.
+                traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+                exit_code = 1
+        response = {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "exit_code": exit_code}
+        responses.write(json.dumps(response, ensure_ascii=False) + "\n")
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
@@ -0,0 +1,194 @@
+"""Tolerant JSON parser for model output.
+
+Parses the first JSON object or array in a piece of text in one pass and
+repairs the mistakes models commonly make instead of asking them again:
+surrounding prose, markdown fences and ``<think>`` blocks, single quotes,
+unquoted keys, Python literals, comments, and trailing or missing commas.
+
+Output cut off mid-value (an open string, comment or bracket at the end of
+the text) is not completed: guessing the rest would hand back a silently
+partial result, so it raises ``JSONRepairError`` and the caller asks again.
+"""
+import json
+import re
+
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+_LITERALS = {
+    "true": True, "false": False, "null": None,
+    "True": True, "False": False, "None": None,
+}
+_NUMBER_RE = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_BAREWORD_RE = re.compile(r"[A-Za-z_$][\w$-]*")
+
+
+class JSONRepairError(ValueError):
+    pass
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.repairs: list[str] = []
+
+    def _peek(self) -> str:
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def _skip(self) -> None:
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char.isspace():
+                self.pos += 1
+            elif self.text.startswith("//", self.pos) or char == "#":
+                end = self.text.find("\n", self.pos)
+                self.pos = len(self.text) if end < 0 else end + 1
+                self.repairs.append("comment")
+            elif self.text.startswith("/*", self.pos):
+                end = self.text.find("*/", self.pos + 2)
+                if end < 0:
+                    raise JSONRepairError("output cut off inside a comment")
+                self.pos = end + 2
+                self.repairs.append("comment")
+            else:
+                return
+
+    def value(self):
+        self._skip()
+        char = self._peek()
+        if char == "{":
+            return self._container("{", "}")
+        if char == "[":
+            return self._container("[", "]")
+        if char in "\"'":
+            return self._string()
+        match = _NUMBER_RE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            raw = match.group()
+            return float(raw) if any(c in raw for c in ".eE") else int(raw)
+        match = _BAREWORD_RE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            word = match.group()
+            if word in _LITERALS:
+                if word[0].isupper():
+                    self.repairs.append("python literal")
+                return _LITERALS[word]
+            self.repairs.append("bare word")
+            return word
+        if not char:
+            raise JSONRepairError("unexpected end of input")
+        raise JSONRepairError(f"unexpected character {char!r} at {self.pos}")
+
+    def _string(self) -> str:
+        quote = self.text[self.pos]
+        if quote == "'":
+            self.repairs.append("single quotes")
+        self.pos += 1
+        chunks = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == quote:
+                self.pos += 1
+                return "".join(chunks)
+            if char == "\\" and self.pos + 1 < len(self.text):
+                escape = self.text[self.pos : self.pos + 2]
+                if escape[1] == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", self.text[self.pos + 2 : self.pos + 6]):
+                    escape = self.text[self.pos : self.pos + 6]
+                try:
+                    chunks.append(json.loads(f'"{escape}"'))
+                except ValueError:
+                    chunks.append(escape[1])
+                self.pos += len(escape)
+                continue
+            chunks.append(char)
+            self.pos += 1
+        raise JSONRepairError("output cut off inside a string")
+
+    def _key(self) -> str:
+        self._skip()
+        char = self._peek()
+        if char in "\"'":
+            return self._string()
+        match = _BAREWORD_RE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            self.repairs.append("unquoted key")
+            return match.group()
+        raise JSONRepairError(f"expected a key at {self.pos}")
+
+    def _container(self, open_char: str, close_char: str):
+        self.pos += 1
+        is_object = open_char == "{"
+        result = {} if is_object else []
+        while True:
+            self._skip()
+            char = self._peek()
+            if not char:
+                raise JSONRepairError(f"output cut off before the closing {close_char!r}")
+            if char == close_char:
+                self.pos += 1
+                return result
+            if char == ",":
+                # Leading, doubled or trailing comma.
+                self.pos += 1
+                self.repairs.append("extra comma")
+                continue
+            if char in "]}":
+                # Mismatched closer: treat it as closing this container.
+                self.repairs.append("mismatched bracket")
+                self.pos += 1
+                return result
+            if is_object:
+                key = self._key()
+                self._skip()
+                if self._peek() == ":":
+                    self.pos += 1
+                else:
+                    self.repairs.append("missing colon")
+                self._skip()
+                if not self._peek():
+                    raise JSONRepairError(f"output cut off before the value of {key!r}")
+                if self._peek() in ",}":
+                    result[key] = None
+                    self.repairs.append("missing value")
+                else:
+                    result[key] = self.value()
+            else:
+                result.append(self.value())
+            self._skip()
+            char = self._peek()
+            if char == ",":
+                self.pos += 1
+                self._skip()
+                if self._peek() == close_char:
+                    self.repairs.append("trailing comma")
+            elif char and char != close_char:
+                self.repairs.append("missing comma")
+
+
+def _candidate(text: str) -> str:
+    text = _THINK_RE.sub("", text)
+    if "</think>" in text:
+        text = text.split("</think>")[-1]
+    fence = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.DOTALL)
+    if fence and fence.group(1).strip()[:1] in "{[":
+        text = fence.group(1)
+    return text
+
+
+def loads(text: str) -> tuple[object, list[str]]:
+    """Parse the first JSON value in ``text``; returns (value, list of repairs applied)."""
+    text = _candidate(text or "")
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise JSONRepairError("no JSON object or array found")
+    start = min(starts)
+    try:
+        return json.JSONDecoder().raw_decode(text, start)[0], []
+    except ValueError:
+        pass
+    parser = _Parser(text)
+    parser.pos = start
+    value = parser.value()
+    return value, parser.repairs
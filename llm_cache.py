@@ -0,0 +1,128 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from config import ROOT, WORKSPACE, get_setting, setting_list
+
+
+class SQLiteLLMCache(BaseCache):
+    """Disk-backed LLM response cache with size- and age-based eviction.
+
+    Plugged into a chat model through its ``cache`` field, so LangChain builds the
+    key from the normalized message list and the llm_string (model name, sampling
+    params and bound tool schemas).
+    """
+
+    def __init__(self, path: Path | None = None, max_entries: int = 5000, max_age_seconds: int = 7 * 24 * 3600):
+        self.path = path or (WORKSPACE / "cache" / "llm_cache.sqlite")
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _dump(generations: list[Generation]) -> str:
+        items = []
+        for generation in generations:
+            if isinstance(generation, ChatGeneration):
+                items.append({"message": message_to_dict(generation.message), "generation_info": generation.generation_info})
+            else:
+                items.append({"text": generation.text, "generation_info": generation.generation_info})
+        return json.dumps(items, ensure_ascii=False)
+
+    @staticmethod
+    def _load(value: str) -> list[Generation]:
+        generations = []
+        for item in json.loads(value):
+            if "message" in item:
+                message = messages_from_dict([item["message"]])[0]
+                generations.append(ChatGeneration(message=message, generation_info=item.get("generation_info")))
+            else:
+                generations.append(Generation(text=item["text"], generation_info=item.get("generation_info")))
+        return generations
+
+    def lookup(self, prompt: str, llm_string: str) -> list[Generation] | None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.max_age_seconds:
+                conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            else:
+                row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._load(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: list[Generation]) -> None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, self._dump(return_val), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age_seconds,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+# Node names (e.g. create_planner, update_planner) whose LLM calls go through the cache.
+LLM_CACHE_NODES = setting_list(get_setting("LLM_CACHE_NODES", "llm.cache.nodes", default=[]))
+
+llm_cache = None
+if LLM_CACHE_NODES:
+    llm_cache = SQLiteLLMCache(
+        path=ROOT / get_setting("LLM_CACHE_PATH", "llm.cache.path", default=WORKSPACE / "cache" / "llm_cache.sqlite"),
+        max_entries=int(get_setting("LLM_CACHE_MAX_ENTRIES", "llm.cache.max_entries", default=5000)),
+        max_age_seconds=int(get_setting("LLM_CACHE_MAX_AGE_SECONDS", "llm.cache.max_age_seconds", default=7 * 24 * 3600)),
+    )
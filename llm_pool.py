@@ -0,0 +1,378 @@
+"""Load balancing and failover across several OpenAI-compatible endpoints.
+
+The pool sits below the OpenAI SDK as an httpx transport, so one ``ChatOpenAI``
+(tools, streaming, structured output, the response cache and callbacks all
+unchanged) spreads its requests over every configured vLLM replica:
+
+- requests go to the healthy endpoint with the fewest requests in flight
+  (ties: fewest recent failures, then lowest latency),
+- one shared connection pool keeps connections to every replica alive,
+- per-endpoint latency (EWMA), request and failure counts are tracked,
+- an endpoint failing ``eject_after_failures`` times in a row is taken out of
+  rotation for ``eject_seconds`` (doubling while it keeps failing),
+- idempotent calls (chat completions, models) that fail to connect, time out
+  or get a 429/5xx are retried on another endpoint.
+
+A single endpoint (``llm.base_url``) is a pool of one.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable
+
+import httpx
+
+from config import get_setting, setting_list
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = get_setting("OPENAI_API_KEY", "llm.api_key")
+OPENAI_BASE_URL = get_setting("OPENAI_BASE_URL", "llm.base_url")
+# Either base URLs or {base_url, api_key} mappings; defaults to llm.base_url.
+LLM_ENDPOINTS = get_setting("LLM_ENDPOINTS", "llm.endpoints")
+LLM_MAX_CONNECTIONS = int(get_setting("LLM_MAX_CONNECTIONS", "llm.max_connections", default=64))
+LLM_REQUEST_TIMEOUT = float(get_setting("LLM_REQUEST_TIMEOUT", "llm.request_timeout", default=120))
+# Attempts after the first one, each on another endpoint while untried ones remain.
+LLM_POOL_MAX_RETRIES = int(get_setting("LLM_POOL_MAX_RETRIES", "llm.pool.max_retries", default=2))
+LLM_POOL_EJECT_AFTER_FAILURES = int(get_setting("LLM_POOL_EJECT_AFTER_FAILURES", "llm.pool.eject_after_failures", default=3))
+LLM_POOL_EJECT_SECONDS = float(get_setting("LLM_POOL_EJECT_SECONDS", "llm.pool.eject_seconds", default=30))
+MAX_EJECT_SECONDS = 600
+LATENCY_EWMA_ALPHA = 0.2
+RETRY_BACKOFF_SECONDS = 0.5
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_PATHS = ("/chat/completions", "/completions", "/embeddings", "/models")
+# The SDK is pointed here (no path); the transport puts the chosen endpoint's base URL in front.
+VIRTUAL_BASE_URL = "http://llm-pool"
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+class Endpoint:
+    """One replica and its health statistics (guarded by the pool's lock)."""
+
+    def __init__(self, base_url: str, api_key: str | None = None):
+        self.base_url = httpx.URL(base_url.rstrip("/"))
+        self.api_key = api_key
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency_ms = 0.0
+        self.ejected_until = 0.0
+        self.eject_seconds = LLM_POOL_EJECT_SECONDS
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def stats(self, now: float) -> dict:
+        return {
+            "base_url": str(self.base_url),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": round(self.failures / self.requests, 3) if self.requests else 0.0,
+            "latency_ms": round(self.latency_ms, 1),
+            "ejected_for_s": round(max(0.0, self.ejected_until - now), 1),
+        }
+
+
+def parse_endpoints(value=LLM_ENDPOINTS, default_base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY) -> list[Endpoint]:
+    entries = value if isinstance(value, list) else setting_list(value)
+    endpoints = []
+    for entry in entries or [default_base_url or DEFAULT_OPENAI_BASE_URL]:
+        if isinstance(entry, dict):
+            endpoints.append(Endpoint(entry["base_url"], entry.get("api_key") or api_key))
+        else:
+            endpoints.append(Endpoint(str(entry), api_key))
+    return endpoints
+
+
+class EndpointPool:
+    """Chooses endpoints and records the outcome of every request."""
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        max_retries: int = LLM_POOL_MAX_RETRIES,
+        eject_after_failures: int = LLM_POOL_EJECT_AFTER_FAILURES,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.max_retries = max_retries
+        self.eject_after_failures = eject_after_failures
+        self._lock = threading.Lock()
+
+    def acquire(self, tried: set[int]) -> int:
+        """Index of the endpoint for the next attempt; counts it as outstanding."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [i for i, e in enumerate(self.endpoints) if e.healthy(now) and i not in tried]
+            if not candidates:
+                candidates = [i for i, e in enumerate(self.endpoints) if e.healthy(now)]
+            if not candidates:
+                # Everything is ejected: use the replica that comes back first rather than fail.
+                candidates = [min(range(len(self.endpoints)), key=lambda i: self.endpoints[i].ejected_until)]
+            endpoint = min(
+                (self.endpoints[i] for i in candidates),
+                key=lambda e: (e.outstanding, e.consecutive_failures, e.latency_ms, random.random()),
+            )
+            index = self.endpoints.index(endpoint)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return index
+
+    def release(self, index: int, started: float, ok: bool) -> None:
+        endpoint = self.endpoints[index]
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.latency_ms = elapsed_ms if not endpoint.latency_ms else (
+                    LATENCY_EWMA_ALPHA * elapsed_ms + (1 - LATENCY_EWMA_ALPHA) * endpoint.latency_ms
+                )
+                endpoint.consecutive_failures = 0
+                endpoint.eject_seconds = LLM_POOL_EJECT_SECONDS
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            now = time.monotonic()
+            # Requests already in flight when it was ejected do not extend the ejection.
+            if endpoint.consecutive_failures >= self.eject_after_failures and endpoint.healthy(now) and len(self.endpoints) > 1:
+                endpoint.ejected_until = now + endpoint.eject_seconds
+                logger.warning(
+                    f"Ejecting LLM endpoint {endpoint.base_url} for {endpoint.eject_seconds:.0f}s "
+                    f"after {endpoint.consecutive_failures} consecutive failures"
+                )
+                endpoint.eject_seconds = min(endpoint.eject_seconds * 2, MAX_EJECT_SECONDS)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [endpoint.stats(now) for endpoint in self.endpoints]
+
+    def route(self, request: httpx.Request, index: int) -> httpx.Request:
+        """Copy of ``request`` addressed to endpoint ``index``."""
+        endpoint = self.endpoints[index]
+        url = httpx.URL(str(endpoint.base_url) + request.url.raw_path.decode("ascii"))
+        headers = request.headers.copy()
+        headers["host"] = url.netloc.decode("ascii")
+        if endpoint.api_key:
+            headers["authorization"] = f"Bearer {endpoint.api_key}"
+        return httpx.Request(request.method, url, headers=headers, content=request.content, extensions=request.extensions)
+
+
+def _retryable(request: httpx.Request) -> bool:
+    return request.method in ("GET", "POST") and request.url.path.endswith(IDEMPOTENT_PATHS)
+
+
+class _TrackedSyncStream(httpx.SyncByteStream):
+    """Response body that reports the request's outcome to the pool when it is closed."""
+
+    def __init__(self, stream, done):
+        self._stream = stream
+        self._done = done
+        self._ok = True
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except Exception:
+            self._ok = False
+            raise
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._done(self._ok)
+
+
+class _TrackedAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, stream, done):
+        self._stream = stream
+        self._done = done
+        self._ok = True
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except Exception:
+            self._ok = False
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._done(self._ok)
+
+
+class _Release:
+    """Releases an endpoint exactly once."""
+
+    def __init__(self, pool: EndpointPool, index: int):
+        self.pool = pool
+        self.index = index
+        self.started = time.monotonic()
+        self._released = False
+
+    def __call__(self, ok: bool) -> None:
+        if not self._released:
+            self._released = True
+            self.pool.release(self.index, self.started, ok)
+
+
+class PoolTransport(httpx.BaseTransport):
+    def __init__(self, pool: EndpointPool, transport: httpx.BaseTransport):
+        self.pool = pool
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        attempts = 1 + (self.pool.max_retries if _retryable(request) else 0)
+        tried: set[int] = set()
+        for attempt in range(attempts):
+            index = self.pool.acquire(tried)
+            if index in tried:
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            tried.add(index)
+            release = _Release(self.pool, index)
+            last = attempt == attempts - 1
+            try:
+                response = self.transport.handle_request(self.pool.route(request, index))
+            except httpx.TransportError as e:
+                release(False)
+                if last:
+                    raise
+                logger.warning(f"LLM endpoint {self.pool.endpoints[index].base_url} failed ({type(e).__name__}), retrying elsewhere")
+                continue
+            if response.status_code in RETRYABLE_STATUS and not last:
+                response.close()
+                release(False)
+                logger.warning(f"LLM endpoint {self.pool.endpoints[index].base_url} returned {response.status_code}, retrying elsewhere")
+                continue
+            ok = response.status_code < 500 and response.status_code != 429
+            response.stream = _TrackedSyncStream(response.stream, lambda body_ok, release=release, ok=ok: release(ok and body_ok))
+            return response
+        raise AssertionError("unreachable")
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncPoolTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of ``PoolTransport``.
+
+    Async connections belong to the event loop that opened them, so every running loop gets its
+    own connection pool from ``transport_factory``. It is closed when that loop shuts down
+    (``asyncio.run`` closes the loop's async generators first); pools of loops closed without
+    that shutdown are dropped on the next request.
+    """
+
+    def __init__(self, pool: EndpointPool, transport_factory: Callable[[], httpx.AsyncBaseTransport]):
+        self.pool = pool
+        self.transport_factory = transport_factory
+        self._transports: dict[asyncio.AbstractEventLoop, tuple[httpx.AsyncBaseTransport, AsyncIterator]] = {}
+        self._lock = threading.Lock()
+
+    async def _loop_transport(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        entry = self._transports.get(loop)
+        if entry is None:
+            with self._lock:
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self.transport_factory()
+                entry = self._transports[loop] = (transport, self._close_with_loop(loop, transport))
+            # Started here so the loop's shutdown_asyncgens() runs its finally block.
+            await entry[1].__anext__()
+        return entry[0]
+
+    async def _close_with_loop(self, loop: asyncio.AbstractEventLoop, transport: httpx.AsyncBaseTransport):
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._transports.pop(loop, None)
+            await transport.aclose()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        transport = await self._loop_transport()
+        attempts = 1 + (self.pool.max_retries if _retryable(request) else 0)
+        tried: set[int] = set()
+        for attempt in range(attempts):
+            index = self.pool.acquire(tried)
+            if index in tried:
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            tried.add(index)
+            release = _Release(self.pool, index)
+            last = attempt == attempts - 1
+            try:
+                response = await transport.handle_async_request(self.pool.route(request, index))
+            except httpx.TransportError as e:
+                release(False)
+                if last:
+                    raise
+                logger.warning(f"LLM endpoint {self.pool.endpoints[index].base_url} failed ({type(e).__name__}), retrying elsewhere")
+                continue
+            if response.status_code in RETRYABLE_STATUS and not last:
+                await response.aclose()
+                release(False)
+                logger.warning(f"LLM endpoint {self.pool.endpoints[index].base_url} returned {response.status_code}, retrying elsewhere")
+                continue
+            ok = response.status_code < 500 and response.status_code != 429
+            response.stream = _TrackedAsyncStream(response.stream, lambda body_ok, release=release, ok=ok: release(ok and body_ok))
+            return response
+        raise AssertionError("unreachable")
+
+    async def aclose(self) -> None:
+        with self._lock:
+            entry = self._transports.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+
+_pool: EndpointPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> EndpointPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = EndpointPool(parse_endpoints())
+    return _pool
+
+
+def http_clients(pool: EndpointPool | None = None) -> tuple[httpx.Client, httpx.AsyncClient]:
+    """Sync and async httpx clients that send through ``pool``, sharing keep-alive connections per replica
+    (the async client per event loop, so it works across ``asyncio.run`` calls)."""
+    pool = pool or get_pool()
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+    timeout = httpx.Timeout(LLM_REQUEST_TIMEOUT)
+    return (
+        httpx.Client(transport=PoolTransport(pool, httpx.HTTPTransport(limits=limits)), timeout=timeout),
+        httpx.AsyncClient(transport=AsyncPoolTransport(pool, lambda: httpx.AsyncHTTPTransport(limits=limits)), timeout=timeout),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the configured LLM endpoints.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("probe", help="GET /models on every endpoint and print status and latency")
+    args = parser.parse_args()
+
+    for endpoint in parse_endpoints():
+        started = time.monotonic()
+        headers = {"authorization": f"Bearer {endpoint.api_key}"} if endpoint.api_key else {}
+        try:
+            status = httpx.get(f"{endpoint.base_url}/models", headers=headers, timeout=10).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        print(f"{str(endpoint.base_url):<40} {status}  {(time.monotonic() - started) * 1000:.0f} ms")
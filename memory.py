@@ -1,10 +1,12 @@
 import json
+import sqlite3
 import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
 
-from config import WORKSPACE
+from config import ROOT, WORKSPACE, get_setting
 
 
 class JsonMemoryStore:
@@ -16,6 +18,14 @@ class JsonMemoryStore:
         self._lock = threading.Lock()
         self.path.parent.mkdir(parents=True, exist_ok=True)
 
+    def version(self, user_id: str) -> tuple[int, int]:
+        """Changes whenever the file is rewritten, by this process or another one."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_mtime_ns, stat.st_size
+
     def _load_all(self) -> dict[str, Any]:
         if not self.path.exists():
             return {}
@@ -62,4 +72,220 @@ class JsonMemoryStore:
             self._save_all(data)
 
 
-memory_store = JsonMemoryStore()
+class SqliteMemoryStore:
+    """Per-user memory store backed by SQLite, with the same API as JsonMemoryStore.
+
+    Reads touch only the requested user's rows and writes are single
+    transactions, so several worker processes can share one database file.
+    Every write bumps the user's row in ``versions`` in the same transaction
+    (a bulk import bumps the ``generation`` in ``meta``), so cached contexts in
+    every process see it. An existing user_memory.json is imported once on
+    first use.
+    """
+
+    def __init__(self, path: Path | None = None, max_reports: int = 20, json_path: Path | None = None):
+        self.path = path or (WORKSPACE / "memory" / "user_memory.sqlite")
+        self.max_reports = max_reports
+        self._version_lock = threading.Lock()
+        self._version_conn: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+        self._versions: dict[str, tuple[int, int]] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS preferences (
+                    user_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS reports (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    goal TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    pdf_path TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS reports_user_id ON reports (user_id, id);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS versions (
+                    user_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                );
+                """
+            )
+        self.migrate_from_json(json_path or (WORKSPACE / "memory" / "user_memory.json"))
+
+    def version(self, user_id: str) -> tuple[int, int]:
+        """(generation, user version) as recorded in the database, so writes by other processes count.
+
+        Checked on one kept-open connection that never writes: its ``PRAGMA data_version``
+        only changes after another connection commits, so until then the versions read
+        earlier are returned without touching the tables.
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            data_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._versions = {}
+            if user_id not in self._versions:
+                generation, version = self._version_conn.execute(
+                    "SELECT (SELECT value FROM meta WHERE key = 'generation'), "
+                    "(SELECT version FROM versions WHERE user_id = ?)",
+                    (user_id,),
+                ).fetchone()
+                self._versions[user_id] = (int(generation or 0), version or 0)
+            return self._versions[user_id]
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection, user_id: str) -> None:
+        conn.execute(
+            "INSERT INTO versions (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+            (user_id,),
+        )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front, serializing writers across processes.
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """Import a JsonMemoryStore file once; returns the number of users imported."""
+        if not json_path.exists():
+            return 0
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            try:
+                data = json.loads(json_path.read_text(encoding="utf-8"))
+            except Exception:
+                data = {}
+            for user_id, user_mem in data.items():
+                self._upsert_preferences(conn, user_id, user_mem.get("preferences") or {})
+                for report in (user_mem.get("reports") or [])[-self.max_reports :]:
+                    conn.execute(
+                        "INSERT INTO reports (user_id, time, goal, summary, pdf_path) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, report.get("time", ""), report.get("goal", ""), report.get("summary", ""), report.get("pdf_path", "")),
+                    )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(json_path),))
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('generation', '1') "
+                "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+        return len(data)
+
+    def get_user_memory(self, user_id: str) -> dict[str, Any]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM preferences WHERE user_id = ?", (user_id,)).fetchone()
+            rows = conn.execute(
+                "SELECT time, goal, summary, pdf_path FROM reports WHERE user_id = ? ORDER BY id",
+                (user_id,),
+            ).fetchall()
+        return {
+            "preferences": json.loads(row[0]) if row else {},
+            "reports": [
+                {"time": time, "goal": goal, "summary": summary, "pdf_path": pdf_path}
+                for time, goal, summary, pdf_path in rows
+            ],
+        }
+
+    @staticmethod
+    def _upsert_preferences(conn: sqlite3.Connection, user_id: str, preferences: dict[str, Any]) -> None:
+        row = conn.execute("SELECT data FROM preferences WHERE user_id = ?", (user_id,)).fetchone()
+        merged = json.loads(row[0]) if row else {}
+        merged.update(preferences)
+        conn.execute(
+            "INSERT OR REPLACE INTO preferences (user_id, data) VALUES (?, ?)",
+            (user_id, json.dumps(merged, ensure_ascii=False)),
+        )
+
+    def upsert_preferences(self, user_id: str, preferences: dict[str, Any]) -> None:
+        if not preferences:
+            return
+        with self._write() as conn:
+            self._upsert_preferences(conn, user_id, preferences)
+            self._bump_version(conn, user_id)
+
+    def append_report_memory(self, user_id: str, goal: str, summary: str, pdf_path: str) -> None:
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO reports (user_id, time, goal, summary, pdf_path) VALUES (?, ?, ?, ?, ?)",
+                (user_id, datetime.now(timezone.utc).isoformat(), goal, (summary or "")[:2000], pdf_path),
+            )
+            conn.execute(
+                "DELETE FROM reports WHERE user_id = ? AND id NOT IN ("
+                "SELECT id FROM reports WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                (user_id, user_id, self.max_reports),
+            )
+            self._bump_version(conn, user_id)
+
+
+class MemoryContextCache:
+    """Per-user memoized memory context, shared by all runs in the process.
+
+    An entry is rebuilt only when the store's version for that user changed,
+    i.e. after upsert_preferences/append_report_memory in any process, so
+    steady-state lookups cost one version read instead of loading the memory.
+    """
+
+    def __init__(self, store, builder: Callable[[dict[str, Any]], str]):
+        self.store = store
+        self.builder = builder
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[tuple[int, int], str]] = {}
+
+    def get(self, user_id: str) -> str:
+        version = self.store.version(user_id)
+        entry = self._entries.get(user_id)
+        if entry and entry[0] == version:
+            return entry[1]
+        context = self.builder(self.store.get_user_memory(user_id))
+        with self._lock:
+            self._entries[user_id] = (version, context)
+        return context
+
+
+def build_memory_store():
+    backend = get_setting("MEMORY_BACKEND", "memory.backend", default="sqlite")
+    if backend == "json":
+        return JsonMemoryStore()
+    if backend == "sqlite":
+        path = get_setting("MEMORY_PATH", "memory.path")
+        return SqliteMemoryStore(path=ROOT / path if path else None)
+    raise ValueError(f"Unknown memory backend: {backend}")
+
+
+memory_store = build_memory_store()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        json_file = Path(sys.argv[2]) if len(sys.argv) > 2 else WORKSPACE / "memory" / "user_memory.json"
+        store = memory_store if isinstance(memory_store, SqliteMemoryStore) else SqliteMemoryStore()
+        print(f"Imported {store.migrate_from_json(json_file)} users from {json_file} into {store.path}")
+    else:
+        print("usage: python memory.py migrate [user_memory.json]")
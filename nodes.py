@@ -1,38 +1,85 @@
+import asyncio
+import copy
 import json
 import logging
+import re
 import textwrap
+import threading
 from typing import Annotated, Literal
 from pathlib import Path
-from langchain_core.messages import AIMessage, HumanMessage,  SystemMessage, ToolMessage
-from langgraph.types import Command, interrupt
-from langchain_openai import ChatOpenAI
-from state import State
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
+from langgraph.types import Command, Send, interrupt
+from state import Plan, State
 from prompts import *
 from tools import *
-from memory import memory_store
-from config import WORKSPACE, get_setting
+from memory import MemoryContextCache, memory_store
+from llm_cache import LLM_CACHE_NODES, llm_cache
+from context import context_manager
+from prompt_layout import build_messages, prefix_tracker, tool_schemas
+from report_pdf import CHART_SUFFIXES
+from dispatch import ToolDispatcher
+from replan import replan_policy, tool_message_failed
+from lenient_json import loads as lenient_json_loads
+from dataset_cache import dataset_cache
+from dataset_profile import load_or_build_profile, render_profile
+from kernel import kernel_manager
+import cassettes
+from config import get_setting
+from workspaces import maybe_cleanup_run_workspaces, run_id_from_config, workspace_for_config
 OPENAI_API_KEY = get_setting("OPENAI_API_KEY", "llm.api_key", required=True)
 OPENAI_MODEL = get_setting("OPENAI_MODEL", "llm.model", default="gpt-4o-mini")
-OPENAI_BASE_URL = get_setting("OPENAI_BASE_URL", "llm.base_url")
+MAX_PARALLEL_STEPS = int(get_setting("MAX_PARALLEL_STEPS", "executor.max_parallel_steps", default=4))
+# json_schema: constrain planner output to the Plan schema (vLLM guided decoding / OpenAI
+# structured outputs); auto: same, but fall back to free text if the server rejects it; off.
+PLANNER_STRUCTURED_OUTPUT = get_setting("PLANNER_STRUCTURED_OUTPUT", "planner.structured_output", default="auto")
+PLANNER_MAX_ATTEMPTS = 5
+# A local parquet used instead of the Hugging Face dataset (offline runs, benchmarks).
+DATASET_LOCAL_PATH = get_setting("DATASET_LOCAL_PATH", "tools.load_data.local_path")
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY is not set.")
-llm = ChatOpenAI(
-  model=OPENAI_MODEL,
-  api_key=OPENAI_API_KEY,
-  base_url=OPENAI_BASE_URL,
-  temperature=0.0,
-  request_timeout=120
-)
+_llms: dict = {}
+_llm_lock = threading.Lock()
+
+
+def _create_llms() -> dict:
+    # Imported here: langchain_openai and the openai SDK take about a second to import.
+    from langchain_openai import ChatOpenAI
+    from llm_pool import LLM_REQUEST_TIMEOUT, VIRTUAL_BASE_URL, get_pool, http_clients
+
+    # Requests are spread over llm.endpoints by the pool's transport, which also owns retries
+    # (on another replica); its clients keep connections to every replica alive.
+    http_client, http_async_client = http_clients(get_pool())
+    llm = ChatOpenAI(
+      model=OPENAI_MODEL,
+      api_key=OPENAI_API_KEY,
+      base_url=VIRTUAL_BASE_URL,
+      temperature=0.0,
+      request_timeout=LLM_REQUEST_TIMEOUT,
+      max_retries=0,
+      http_client=http_client,
+      http_async_client=http_async_client,
+    )
+    return {"llm": llm, "cached_llm": llm.model_copy(update={"cache": llm_cache}) if llm_cache else llm}
+
+
+def node_llm(node_name: str):
+    """LLM for one node, created on first use; only nodes listed in llm.cache.nodes read/write the response cache."""
+    if not _llms:
+        with _llm_lock:
+            if not _llms:
+                _llms.update(_create_llms())
+    return _llms["cached_llm"] if node_name in LLM_CACHE_NODES else _llms["llm"]
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-hander = logging.StreamHandler()
-hander.setLevel(logging.INFO)
-
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-hander.setFormatter(formatter)
-logger.addHandler(hander)
+if not logger.handlers:
+    hander = logging.StreamHandler()
+    hander.setLevel(logging.INFO)
+    hander.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(hander)
 
 
 def build_memory_context(user_memory: dict) -> str:
@@ -42,7 +89,7 @@ def build_memory_context(user_memory: dict) -> str:
 
     lines = ["Long-term memory context:"]
     if preferences:
-        lines.append(f"- User preferences: {json.dumps(preferences, ensure_ascii=False)}")
+        lines.append(f"- User preferences: {json.dumps(preferences, ensure_ascii=False, sort_keys=True)}")
     if recent_reports:
         lines.append("- Recent report memories:")
         for idx, report in enumerate(recent_reports, start=1):
@@ -54,26 +101,61 @@ def build_memory_context(user_memory: dict) -> str:
     return "\n".join(lines)
 
 
+memory_context_cache = MemoryContextCache(memory_store, build_memory_context)
+
+
 def get_state_memory_context(state: State) -> str:
     user_id = state.get("user_id") or "default"
-    user_memory = memory_store.get_user_memory(user_id)
-    memory_context = build_memory_context(user_memory)
+    memory_context = memory_context_cache.get(user_id)
     state["memory_context"] = memory_context
     return memory_context
 
 
-def load_hf_dataset_once(state: State):
+def get_run_memory_context(state: State, config: RunnableConfig) -> str:
+    """Memory context at the start of a run; replays reuse the one their cassette recorded."""
+    cassette = cassettes.session(config)
+    memory_context = cassette.memory_context(lambda: get_state_memory_context(state))
+    state["memory_context"] = memory_context
+    cassette.record_run(state.get("user_id") or "default", state.get("user_message") or "", memory_context)
+    return memory_context
+
+
+def load_hf_dataset_once(state: State, workspace: Path):
     if state.get("file_path"):
         return state["file_path"]
 
-    ds = load_hf_dataset.invoke({})
-    save_dataset.invoke({"ds": ds})
-    save_path = WORKSPACE / "dataset.parquet"
+    if DATASET_LOCAL_PATH:
+        source = Path(DATASET_LOCAL_PATH).resolve()
+    else:
+        # Hardlink from the content-addressed cache; only a miss downloads and converts.
+        source = dataset_cache.get_or_create()
+    save_path = dataset_cache.link(source, workspace / "dataset.parquet")
 
     state["file_path"] = str(save_path)
+    # Profiled from the source, not the per-run link, so every run reuses the cached profile.
+    state["dataset_profile"] = build_dataset_profile(source, save_path.name)
     return str(save_path)
 
 
+def prepare_run_workspace(state: State, config: RunnableConfig) -> str:
+    """Create this run's workspace, link the dataset into it and apply the retention policy."""
+    workspace = workspace_for_config(config)
+    cassette = cassettes.session(config)
+    if cassette.mode == "replay":
+        cassettes.seed_workspace(cassette.source, run_id_from_config(config))
+    maybe_cleanup_run_workspaces(keep={workspace.name})
+    return load_hf_dataset_once(state, workspace)
+
+
+def build_dataset_profile(path: Path, file_name: str) -> str:
+    """Compact profile of the dataset for prompts, cached in the dataset cache."""
+    try:
+        return render_profile(load_or_build_profile(path, dataset_cache.profile_path(path)), file_name=file_name)
+    except Exception as e:
+        logger.warning(f"Dataset profiling failed: {type(e).__name__}: {e}")
+        return "Not available; inspect the dataset with a script if needed."
+
+
 def extract_json(text):
     if '```json' not in text:
         return text
@@ -101,208 +183,585 @@ def normalize_tool_call(tool_call: dict):
             pass
     return name, args, tool_id
 
-def create_planner_node(state: State):
+TOOLS = {
+    "create_file": create_file,
+    "str_replace": str_replace,
+    "shell_exec": shell_exec,
+    "python_exec": python_exec,
+    "render_report": render_report,
+}
+tool_dispatcher = ToolDispatcher(TOOLS)
+NO_PDF_MESSAGE = (
+    "You have not created any .pdf file under workspace yet. "
+    "You still have not created any .pdf file under workspace. "
+    "Call render_report now to write the report PDF and then provide the filename."
+)
+NO_TOOL_CALL_MESSAGE = (
+    "Your previous reply did not call any tool. "
+    "Call render_report with the report sections and charts before responding."
+)
+
+
+# Every prompt is laid out static-first by build_messages so the server's prefix cache covers
+# the system prompt, tools, memory and dataset profile; see prompt_layout.py.
+def _plan_create_messages(state: State, memory_context: str) -> list:
+    return build_messages(
+        PLAN_SYSTEM_PROMPT,
+        PLAN_CREATE_PROMPT.format(user_message=state['user_message']),
+        memory_context=memory_context,
+        dataset_profile=state.get('dataset_profile', ''),
+    )
+
+
+def _plan_update_messages(state: State, memory_context: str) -> list:
+    plan = state['plan']
+    return build_messages(
+        PLAN_SYSTEM_PROMPT,
+        UPDATE_PLAN_PROMPT.format(plan=plan, goal=plan['goal']),
+        memory_context=memory_context,
+        dataset_profile=state.get('dataset_profile', ''),
+    )
+
+
+PLAN_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "Plan", "schema": Plan.model_json_schema()},
+}
+_structured_output_enabled = PLANNER_STRUCTURED_OUTPUT in ("auto", "json_schema")
+# Error text of a server that does not support the planner's response_format.
+STRUCTURED_OUTPUT_ERROR_RE = re.compile(r"response_format|json_schema|guided|structured output", re.IGNORECASE)
+
+
+def _planner_llm(node_name: str):
+    llm_for_node = node_llm(node_name)
+    if not _structured_output_enabled:
+        return llm_for_node
+    # Sent as a raw body field so the SDK's client-side parse() path (which raises on
+    # truncated output) is not used; a truncated plan goes back through the retry loop.
+    return llm_for_node.bind(extra_body={"response_format": PLAN_RESPONSE_FORMAT})
+
+
+def _disable_structured_output(error: Exception) -> bool:
+    """In auto mode, turn structured output off after the server rejects it.
+
+    Only a 400 about response_format / json_schema / guided decoding counts; any
+    other bad request (e.g. a prompt over the context length) is not a reason to
+    stop guiding later plans and is re-raised by the caller.
+    """
+    global _structured_output_enabled
+    if PLANNER_STRUCTURED_OUTPUT != "auto" or not _structured_output_enabled:
+        return False
+    import openai
+
+    if not isinstance(error, openai.BadRequestError):
+        return False
+    detail = f"{error.message} {json.dumps(error.body, default=str) if error.body is not None else ''}"
+    if not STRUCTURED_OUTPUT_ERROR_RE.search(detail):
+        return False
+    logger.warning(f"Server rejected response_format json_schema, planning without it: {type(error).__name__}: {detail}")
+    _structured_output_enabled = False
+    return True
+
+
+def _parse_plan(content: str) -> tuple[dict, list[str]]:
+    """Parse and validate a plan; returns (plan, repairs applied by the tolerant parser).
+
+    A plan without goal, steps or a step's title/description/status raises, so it goes
+    back through the retry loop. Unset optional fields stay absent (a plan that declares
+    no depends_on keeps the sequential order).
+    """
+    plan, repairs = lenient_json_loads(content)
+    if not isinstance(plan, dict):
+        raise ValueError(f"Expected a JSON object, got {type(plan).__name__}")
+    return Plan.model_validate(plan).model_dump(exclude_unset=True), repairs
+
+
+def _plan_stats(state: State) -> dict:
+    return dict(state.get("plan_stats") or {"llm_calls": 0, "retries": 0, "repaired": 0, "structured": 0})
+
+
+def _record_plan_attempt(stats: dict, attempt: int, repairs: list[str] | None = None) -> None:
+    stats["llm_calls"] += 1
+    stats["retries"] += attempt > 0
+    if _structured_output_enabled:
+        stats["structured"] += 1
+    if repairs:
+        stats["repaired"] += 1
+        logger.info(f"Plan JSON repaired without a retry: {sorted(set(repairs))}")
+
+
+def _invoke_planner(node_name: str, messages: list, attempt: int):
+    prefix_tracker.observe(node_name, messages)
+    try:
+        return _planner_llm(node_name).invoke(messages, {"metadata": {"retry": attempt}})
+    except Exception as e:
+        if not _disable_structured_output(e):
+            raise
+        return _planner_llm(node_name).invoke(messages, {"metadata": {"retry": attempt}})
+
+
+async def _ainvoke_planner(node_name: str, messages: list, attempt: int):
+    prefix_tracker.observe(node_name, messages)
+    try:
+        return await _planner_llm(node_name).ainvoke(messages, {"metadata": {"retry": attempt}})
+    except Exception as e:
+        if not _disable_structured_output(e):
+            raise
+        return await _planner_llm(node_name).ainvoke(messages, {"metadata": {"retry": attempt}})
+
+
+def _request_plan(node_name: str, messages: list, stats: dict, config: RunnableConfig | None = None) -> dict:
+    """Call the planner until a valid plan comes back; updates ``stats`` in place."""
+    messages = list(messages)
+    error = None
+    cassette = cassettes.session(config)
+    for attempt in range(PLANNER_MAX_ATTEMPTS):
+        response = cassette.llm(node_name, None, messages, lambda: _invoke_planner(node_name, messages, attempt))
+        try:
+            plan, repairs = _parse_plan(response.content)
+        except Exception as e:
+            error = e
+            _record_plan_attempt(stats, attempt)
+            logger.error(f"{node_name} JSON parse failed: {type(e).__name__}: {e}")
+            messages.append(_plan_parse_error_message(e, response.content))
+            continue
+        _record_plan_attempt(stats, attempt, repairs)
+        return plan
+    raise ValueError(f"{node_name} returned no valid plan after {PLANNER_MAX_ATTEMPTS} attempts") from error
+
+
+async def _arequest_plan(node_name: str, messages: list, stats: dict, config: RunnableConfig | None = None) -> dict:
+    """Async variant of ``_request_plan``."""
+    messages = list(messages)
+    error = None
+    cassette = cassettes.session(config)
+    for attempt in range(PLANNER_MAX_ATTEMPTS):
+        response = await cassette.allm(node_name, None, messages, lambda: _ainvoke_planner(node_name, messages, attempt))
+        try:
+            plan, repairs = _parse_plan(response.content)
+        except Exception as e:
+            error = e
+            _record_plan_attempt(stats, attempt)
+            logger.error(f"{node_name} JSON parse failed: {type(e).__name__}: {e}")
+            messages.append(_plan_parse_error_message(e, response.content))
+            continue
+        _record_plan_attempt(stats, attempt, repairs)
+        return plan
+    raise ValueError(f"{node_name} returned no valid plan after {PLANNER_MAX_ATTEMPTS} attempts") from error
+
+
+def _plan_parse_error_message(error: Exception, last_text: str | None) -> HumanMessage:
+    snippet = (last_text or "")[:1500]
+    return HumanMessage(
+        content=(
+            "Your previous output could not be parsed as a valid plan. "
+            "Return one valid JSON object only, with a goal and at least one step, and no extra text.\n"
+            f"Error: {type(error).__name__}: {error}\n"
+            f"Previous output snippet:\n{snippet}"
+        )
+    )
+
+
+def _ready_step_indexes(steps: list) -> list[int]:
+    """Indexes of pending steps whose dependencies are all completed.
+
+    Plans that declare no depends_on at all keep the old sequential order.
+    Falls back to the first pending step when dependencies can never be met
+    (cycles or edges to removed steps), so the plan keeps moving.
+    """
+    pending = [i for i, step in enumerate(steps) if step['status'] == 'pending']
+    if not any('depends_on' in step for step in steps):
+        return pending[:1]
+    ready = []
+    for i in pending:
+        deps = [d for d in _step_dependencies(steps[i]) if 0 <= d < len(steps) and d != i]
+        if all(steps[d]['status'] == 'completed' for d in deps):
+            ready.append(i)
+    if pending and not ready:
+        ready = pending[:1]
+    return ready[:MAX_PARALLEL_STEPS]
+
+
+def _step_dependencies(step: dict) -> list[int]:
+    deps = step.get('depends_on') or []
+    if not isinstance(deps, list):
+        deps = [deps]
+    result = []
+    for dep in deps:
+        try:
+            result.append(int(dep))
+        except (TypeError, ValueError):
+            continue
+    return result
+
+
+def _step_sends(state: State, indexes: list[int]) -> list[Send]:
+    return [Send("execute_step", {**state, "step_index": i}) for i in indexes]
+
+
+def _execute_messages(state: State, current_step: dict, memory_context: str) -> list:
+    return build_messages(
+        EXECUTE_SYSTEM_PROMPT,
+        EXECUTION_PROMPT.format(user_message=state['user_message'], step=current_step['description']),
+        memory_context=memory_context,
+        dataset_profile=state.get('dataset_profile', ''),
+        observations=context_manager.compact_observations(state.get('observations')),
+    )
+
+
+def _chart_files(config: RunnableConfig) -> str:
+    workspace = workspace_for_config(config)
+    charts = sorted(p.name for p in workspace.iterdir() if p.suffix.lower() in CHART_SUFFIXES) if workspace.is_dir() else []
+    return "\n".join(charts) or "(none)"
+
+
+def _report_messages(state: State, memory_context: str, config: RunnableConfig) -> list:
+    return build_messages(
+        REPORT_SYSTEM_PROMPT,
+        REPORT_EXECUTION_PROMPT.format(user_message=state.get("user_message", ""), charts=_chart_files(config)),
+        memory_context=memory_context,
+        dataset_profile=state.get('dataset_profile', ''),
+        observations=context_manager.compact_observations(state.get("observations")),
+    )
+
+
+def _fit_prompt(messages: list, usage: list, **labels) -> list:
+    """Compact messages to the token budget and record the prompt size and prefix reuse of this call."""
+    tools = tool_schemas(TOOLS)
+    prompt, prompt_tokens = context_manager.fit(messages, tools)
+    prefix_reuse = round(prefix_tracker.observe(labels["node"], prompt, tools), 3)
+    usage.append({**labels, "prompt_tokens": prompt_tokens, "prefix_reuse": prefix_reuse})
+    logger.info(f"prompt_tokens={prompt_tokens} prefix_reuse={prefix_reuse} {labels}")
+    return prompt
+
+
+def _tool_message(tool_name, tool_args, tool_id, tool_result) -> ToolMessage:
+    # Timing, exit codes and output sizes are in the tool spans (tracing.py); full payloads only at DEBUG.
+    logger.info(f"tool {tool_name} ({tool_id}) {'failed' if 'error' in (tool_result or {}) else 'done'}")
+    logger.debug(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
+    return ToolMessage(
+        content=json.dumps(tool_result, ensure_ascii=False),
+        tool_call_id=tool_id
+    )
+
+
+def _normalized_tool_calls(tool_calls: list) -> list[tuple]:
+    normalized = []
+    for tool_call in tool_calls:
+        tool_name, tool_args, tool_id = normalize_tool_call(tool_call)
+        if not tool_name:
+            logger.warning(f"Tool call missing name, raw payload: {tool_call}")
+            continue
+        normalized.append((tool_name, tool_args, tool_id))
+    return normalized
+
+
+def _call_configs(calls: list[tuple], config: RunnableConfig | None, step_index=None) -> list[RunnableConfig]:
+    """Per-call configs whose metadata identifies the step and tool call (keys of the tool log index)."""
+    configs = []
+    for _, _, tool_id in calls:
+        metadata = {"tool_call_id": tool_id}
+        if step_index is not None:
+            metadata["step_index"] = step_index
+        configs.append(merge_configs(config, {"metadata": metadata}))
+    return configs
+
+
+def _run_tool_calls(tool_calls: list, config: RunnableConfig | None = None, step_index=None) -> list[ToolMessage]:
+    calls = _normalized_tool_calls(tool_calls)
+    # A replay takes recorded results; only calls without one are dispatched.
+    cassette = cassettes.session(config)
+    results = cassette.tool_results(calls)
+    live = [call for call, result in zip(calls, results) if result is None]
+    if live:
+        live_results = tool_dispatcher.run([(name, args) for name, args, _ in live], _call_configs(live, config, step_index))
+        cassette.record_tools(live, live_results)
+        filled = iter(live_results)
+        results = [next(filled) if result is None else result for result in results]
+    return [_tool_message(name, args, tool_id, result) for (name, args, tool_id), result in zip(calls, results)]
+
+
+async def _arun_tool_calls(tool_calls: list, config: RunnableConfig | None = None, step_index=None) -> list[ToolMessage]:
+    calls = _normalized_tool_calls(tool_calls)
+    cassette = cassettes.session(config)
+    results = cassette.tool_results(calls)
+    live = [call for call, result in zip(calls, results) if result is None]
+    if live:
+        live_results = await tool_dispatcher.arun([(name, args) for name, args, _ in live], _call_configs(live, config, step_index))
+        cassette.record_tools(live, live_results)
+        filled = iter(live_results)
+        results = [next(filled) if result is None else result for result in results]
+    return [_tool_message(name, args, tool_id, result) for (name, args, tool_id), result in zip(calls, results)]
+
+
+def _latest_pdf_path(config: RunnableConfig) -> str:
+    pdf_files = sorted(workspace_for_config(config).glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+    return str(pdf_files[-1]) if pdf_files else ""
+
+
+def _finish_report(state: State, response, usage: list, config: RunnableConfig) -> dict:
+    # The report is the last node of a run, so its python kernel is no longer needed.
+    kernel_manager.shutdown(run_id_from_config(config))
+    if llm_cache:
+        logger.info(f"LLM cache stats: {llm_cache.stats()}")
+    if _llms:
+        from llm_pool import get_pool
+
+        logger.info(f"LLM endpoint stats: {get_pool().stats()}")
+    logger.info(f"Prompt prefix reuse: {prefix_tracker.stats()}")
+    logger.info(f"Replan stats: {state.get('replan_stats') or {}}, plan stats: {state.get('plan_stats') or {}}")
+    cassette_stats = cassettes.close(config)
+    if cassette_stats:
+        logger.info(f"Cassette stats: {cassette_stats}")
+    pdf_path = _latest_pdf_path(config)
+    if cassette_stats and cassette_stats["mode"] == "replay":
+        # A replay repeats a recorded run; it does not add a second report to the user's memory.
+        return {"final_report": response.content, "final_report_pdf_path": pdf_path, "prompt_tokens": usage}
+    user_id = state.get("user_id") or "default"
+    goal = ""
+    if isinstance(state.get("plan"), dict):
+        goal = state.get("plan", {}).get("goal", "")
+    memory_store.append_report_memory(
+        user_id=user_id,
+        goal=goal,
+        summary=extract_answer(response.content),
+        pdf_path=pdf_path,
+    )
+    return {
+        "final_report": response.content,
+        "final_report_pdf_path": pdf_path,
+        "prompt_tokens": usage,
+    }
+
+
+def create_planner_node(state: State, config: RunnableConfig):
     logger.info("***正在下载数据集***")
-    load_hf_dataset_once(state)
+    prepare_run_workspace(state, config)
     logger.info("***正在运行Create Planner node***")
-    memory_context = get_state_memory_context(state)
-    messages = [
-        SystemMessage(content=PLAN_SYSTEM_PROMPT),
-        HumanMessage(content=memory_context),
-        HumanMessage(content=PLAN_CREATE_PROMPT.format(user_message = state['user_message']))
-    ]
+    memory_context = get_run_memory_context(state, config)
+    messages = _plan_create_messages(state, memory_context)
     logger.info("***生成message***")
-    response = llm.invoke(messages)
+    plan_stats = _plan_stats(state)
+    plan = _request_plan("create_planner", messages, plan_stats, config)
     logger.info("***成功调用大模型***")
-    response = response.model_dump_json(indent=4, exclude_none=True)
-    response = json.loads(response)
-    plan = json.loads(extract_json(extract_answer(response['content'])))
     state['messages'] += [AIMessage(content=json.dumps(plan, ensure_ascii=False))]
-    return Command(goto="execute", update={"plan": plan})
+    return Command(goto="execute", update={
+        "plan": plan,
+        "memory_context": memory_context,
+        "file_path": state["file_path"],
+        "dataset_profile": state.get("dataset_profile", ""),
+        "plan_stats": plan_stats,
+    })
+
 
-def update_planner_node(state: State):
+async def acreate_planner_node(state: State, config: RunnableConfig):
+    logger.info("***正在下载数据集***")
+    await asyncio.to_thread(prepare_run_workspace, state, config)
+    logger.info("***正在运行Create Planner node***")
+    memory_context = get_run_memory_context(state, config)
+    messages = _plan_create_messages(state, memory_context)
+    logger.info("***生成message***")
+    plan_stats = _plan_stats(state)
+    plan = await _arequest_plan("create_planner", messages, plan_stats, config)
+    logger.info("***成功调用大模型***")
+    state['messages'] += [AIMessage(content=json.dumps(plan, ensure_ascii=False))]
+    return Command(goto="execute", update={
+        "plan": plan,
+        "memory_context": memory_context,
+        "file_path": state["file_path"],
+        "dataset_profile": state.get("dataset_profile", ""),
+        "plan_stats": plan_stats,
+    })
+
+
+def update_planner_node(state: State, config: RunnableConfig):
     logger.info("***正在运行Update Planner node***")
-    plan = state['plan']
-    goal = plan['goal']
     memory_context = state.get("memory_context") or get_state_memory_context(state)
-    node_context = [
-        SystemMessage(content=PLAN_SYSTEM_PROMPT),
-        HumanMessage(content=memory_context),
-        HumanMessage(content=UPDATE_PLAN_PROMPT.format(plan=plan, goal=goal))
-    ]
-    last_text = None
-    for _ in range(5):
-        response = None
-        try:
-            response = llm.invoke(node_context)
-            content = response.content if hasattr(response, 'content') else str(response)
-            last_text=content
-            cleaned_json_str = extract_json(extract_answer(content))
-            new_plan = json.loads(cleaned_json_str)
-            final_ai_message = AIMessage(content=json.dumps(new_plan, ensure_ascii=False))
-            
-            return Command(
-                goto="execute", 
-                update={
-                    "plan": new_plan,
-                    "messages": [final_ai_message]  # LangGraph auto-extends this into state['messages']
-                }
-            )
-        except Exception as e:
-            logger.error("Update planner JSON parse failed")
-            snippet = (last_text or "")[:1500]
-            node_context.append(HumanMessage(
-                content=(
-                    "Your previous output could not be parsed as strict JSON. "
-                    "Return one valid JSON object only, with no extra text.\n"
-                    f"Error: {type(e).__name__}: {e}\n"
-                    f"Previous output snippet:\n{snippet}"
-                )
-            ))
-            
+    node_context = _plan_update_messages(state, memory_context)
+    plan_stats = _plan_stats(state)
+    new_plan = _request_plan("update_planner", node_context, plan_stats, config)
+    final_ai_message = AIMessage(content=json.dumps(new_plan, ensure_ascii=False))
+    return Command(
+        goto="execute",
+        update={
+            "plan": new_plan,
+            "messages": [final_ai_message],  # LangGraph auto-extends this into state['messages']
+            "plan_stats": plan_stats,
+        }
+    )
+
+
+async def aupdate_planner_node(state: State, config: RunnableConfig):
+    logger.info("***正在运行Update Planner node***")
+    memory_context = state.get("memory_context") or get_state_memory_context(state)
+    node_context = _plan_update_messages(state, memory_context)
+    plan_stats = _plan_stats(state)
+    new_plan = await _arequest_plan("update_planner", node_context, plan_stats, config)
+    final_ai_message = AIMessage(content=json.dumps(new_plan, ensure_ascii=False))
+    return Command(
+        goto="execute",
+        update={
+            "plan": new_plan,
+            "messages": [final_ai_message],
+            "plan_stats": plan_stats,
+        }
+    )
+
+
 def execute_node(state: State):
+    """Dispatch every ready plan step to its own execute_step branch."""
     logger.info("***正在运行execute_node***")
-    plan = state['plan']
-    steps = plan['steps']
-    current_step = None
-    current_step_index = 0
-    
-    # Get the first pending step
-    for i, step in enumerate(steps):
-        status = step['status']
-        if status == 'pending':
-            current_step = step
-            current_step_index = i
-            break
-        
-    logger.info(f"Current executing step: {current_step}")
-    
+    ready = _ready_step_indexes(state['plan']['steps'])
+    logger.info(f"Ready steps: {ready}")
+
     # Jump to report only when no pending step remains.
-    if current_step is None:
+    if not ready:
         return Command(goto='report')
-    
+    return Command(goto=_step_sends(state, ready))
+
+
+def execute_step_node(state: dict, config: RunnableConfig):
+    """Run the tool loop for one plan step and report its summary to merge_steps."""
+    step_index = state['step_index']
+    current_step = state['plan']['steps'][step_index]
+    logger.info(f"Current executing step: {current_step}")
+
     memory_context = state.get('memory_context') or get_state_memory_context(state)
-    messages = state['observations'] + [
-        SystemMessage(content=EXECUTE_SYSTEM_PROMPT),
-        HumanMessage(content=memory_context),
-        HumanMessage(content=EXECUTION_PROMPT.format(user_message=state['user_message'], step=current_step['description']))
-    ]
-    
-    tool_result = None
+    messages = _execute_messages(state, current_step, memory_context)
+    usage = []
+    tool_failures = 0
+
     while True:
-        response = llm.bind_tools([create_file, str_replace, shell_exec]).invoke(messages)
+        prompt = _fit_prompt(messages, usage, node="execute", step=step_index)
+        response = cassettes.session(config).llm(
+            "execute", step_index, prompt, lambda: node_llm("execute").bind_tools(tool_schemas(TOOLS)).invoke(prompt)
+        )
         messages.append(response)
-        tools = {"create_file": create_file, 
-                 "str_replace": str_replace, 
-                 "shell_exec": shell_exec
-                }     
-        if response.tool_calls:
-            for tool_call in response.tool_calls:
-                tool_name, tool_args, tool_id = normalize_tool_call(tool_call)
-                if not tool_name:
-                    logger.warning(f"Tool call missing name, raw payload: {tool_call}")
-                    continue
-                tool_result = tools[tool_name].invoke(tool_args)
-                logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
-                messages.append(
-                    ToolMessage(
-                        content=json.dumps(tool_result,ensure_ascii=False),
-                        tool_call_id=tool_id
-                    )
-                )
-            steps[current_step_index]['status'] = 'completed'
-            continue
-        else:    
+        if not response.tool_calls:
             break
-        
-    logger.info(f"Current step summary: {extract_answer(response.content)}")
-    # If no tool call happened but a step summary was produced, still mark step completed to avoid loops.
-    if current_step is not None and steps[current_step_index].get('status') != 'completed':
-        steps[current_step_index]['status'] = 'completed'
-    
-    state['messages'] += [AIMessage(content=extract_answer(response.content))]
-    state['observations'] += [AIMessage(content=extract_answer(response.content))]
-    return Command(goto='update_planner', update={'plan': plan})
-    
+        tool_messages = _run_tool_calls(response.tool_calls, config, step_index)
+        tool_failures += sum(tool_message_failed(message) for message in tool_messages)
+        messages.extend(tool_messages)
 
-    
-def report_node(state: State):
+    summary = extract_answer(response.content)
+    logger.info(f"Current step summary: {summary}")
+    return {
+        "step_results": [{"index": step_index, "summary": summary, "tool_failures": tool_failures}],
+        "prompt_tokens": usage,
+    }
+
+
+async def aexecute_step_node(state: dict, config: RunnableConfig):
+    step_index = state['step_index']
+    current_step = state['plan']['steps'][step_index]
+    logger.info(f"Current executing step: {current_step}")
+
+    memory_context = state.get('memory_context') or get_state_memory_context(state)
+    messages = _execute_messages(state, current_step, memory_context)
+    usage = []
+    tool_failures = 0
+
+    while True:
+        prompt = _fit_prompt(messages, usage, node="execute", step=step_index)
+        response = await cassettes.session(config).allm(
+            "execute", step_index, prompt, lambda: node_llm("execute").bind_tools(tool_schemas(TOOLS)).ainvoke(prompt)
+        )
+        messages.append(response)
+        if not response.tool_calls:
+            break
+        tool_messages = await _arun_tool_calls(response.tool_calls, config, step_index)
+        tool_failures += sum(tool_message_failed(message) for message in tool_messages)
+        messages.extend(tool_messages)
+
+    summary = extract_answer(response.content)
+    logger.info(f"Current step summary: {summary}")
+    return {
+        "step_results": [{"index": step_index, "summary": summary, "tool_failures": tool_failures}],
+        "prompt_tokens": usage,
+    }
+
+
+def merge_steps_node(state: State):
+    """Fan-in point: mark finished steps completed and append their observations in plan order.
+
+    The status update is applied here; the replanner LLM only runs when the
+    replan policy sees a reason to revisit the remaining steps.
+    """
+    plan = copy.deepcopy(state['plan'])
+    results = sorted(state.get('step_results') or [], key=lambda r: r['index'])
+    summaries = [AIMessage(content=result['summary']) for result in results]
+    for result in results:
+        plan['steps'][result['index']]['status'] = 'completed'
+    reason, replan_stats = replan_policy.update_stats(state.get('replan_stats'), results)
+    if reason:
+        logger.info(f"Replanning: {reason}")
+    else:
+        logger.info(f"Skipping replanner, plan updated locally ({replan_stats})")
+    return Command(
+        goto='update_planner' if reason else 'execute',
+        update={
+            'plan': plan,
+            'observations': (state.get('observations') or []) + summaries,
+            'messages': summaries,
+            'step_results': None,
+            'replan_stats': replan_stats,
+        }
+    )
+
+
+def report_node(state: State, config: RunnableConfig):
     """Report node that write a final report."""
     logger.info("***正在运行report_node***")
     
-    observations = state.get("observations") or []
-    user_message = state.get("user_message", "")
     memory_context = state.get("memory_context") or get_state_memory_context(state)
-    messages = observations + [
-        SystemMessage(content=REPORT_SYSTEM_PROMPT),
-        HumanMessage(content=memory_context),
-        HumanMessage(content=REPORT_EXECUTION_PROMPT.format(user_message=user_message))
-    ]
+    messages = _report_messages(state, memory_context, config)
+    usage = []
     max_rounds = 8
     rounds = 0
     while rounds < max_rounds:
         rounds += 1
-        response = llm.bind_tools([create_file, str_replace, shell_exec]).invoke(messages)
+        prompt = _fit_prompt(messages, usage, node="report", round=rounds)
+        response = cassettes.session(config).llm(
+            "report", None, prompt, lambda: node_llm("report").bind_tools(tool_schemas(TOOLS)).invoke(prompt)
+        )
         messages.append(response)
-        tools = {"create_file": create_file, 
-                 "str_replace": str_replace, 
-                 "shell_exec": shell_exec}     
         if response.tool_calls:
-            for tool_call in response.tool_calls:
-                tool_name, tool_args, tool_id = normalize_tool_call(tool_call)
-                if not tool_name:
-                    logger.warning(f"Tool call missing name, raw payload: {tool_call}")
-                    continue
-                tool_result = tools[tool_name].invoke(tool_args)
-                logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
-                messages.append(
-                    ToolMessage(
-                        content=json.dumps(tool_result, ensure_ascii=False),
-                        tool_call_id=tool_id
-                    )
-                )
-                
-            
-        
-            pdf_files = sorted(WORKSPACE.glob("*.pdf"))
-            if not pdf_files:
+            messages.extend(_run_tool_calls(response.tool_calls, config))
+            if not _latest_pdf_path(config):
                 logger.warning("No PDF generated yet in workspace, ask model to continue.")
-                messages.append(
-                    HumanMessage(
-                        content=(
-                            "You have not created any .pdf file under workspace yet. "
-                            "You still have not created any .pdf file under workspace. "
-                            "Please call tools now to generate a real PDF and then provide the filename."
-                        )
-                    )
-                )
+                messages.append(HumanMessage(content=NO_PDF_MESSAGE))
                 continue
             break
 
-        messages.append(
-            HumanMessage(
-                content=(
-                    "Your previous reply did not call any tool. "
-                    "Call tools to create the final PDF file in workspace before responding."
-                )
-            )
+        messages.append(HumanMessage(content=NO_TOOL_CALL_MESSAGE))
+
+    return _finish_report(state, response, usage, config)
+
+
+async def areport_node(state: State, config: RunnableConfig):
+    """Async report node that write a final report."""
+    logger.info("***正在运行report_node***")
+
+    memory_context = state.get("memory_context") or get_state_memory_context(state)
+    messages = _report_messages(state, memory_context, config)
+    usage = []
+    max_rounds = 8
+    rounds = 0
+    while rounds < max_rounds:
+        rounds += 1
+        prompt = _fit_prompt(messages, usage, node="report", round=rounds)
+        response = await cassettes.session(config).allm(
+            "report", None, prompt, lambda: node_llm("report").bind_tools(tool_schemas(TOOLS)).ainvoke(prompt)
         )
-            
-        
+        messages.append(response)
+        if response.tool_calls:
+            messages.extend(await _arun_tool_calls(response.tool_calls, config))
+            if not _latest_pdf_path(config):
+                logger.warning("No PDF generated yet in workspace, ask model to continue.")
+                messages.append(HumanMessage(content=NO_PDF_MESSAGE))
+                continue
+            break
 
-    pdf_files = sorted(WORKSPACE.glob("*.pdf"))
-    pdf_path = str(pdf_files[-1]) if pdf_files else ""
-    user_id = state.get("user_id") or "default"
-    goal = ""
-    if isinstance(state.get("plan"), dict):
-        goal = state.get("plan", {}).get("goal", "")
-    memory_store.append_report_memory(
-        user_id=user_id,
-        goal=goal,
-        summary=extract_answer(response.content),
-        pdf_path=pdf_path,
-    )
-    return {
-        "final_report": response.content,
-        "final_report_pdf_path": pdf_path,
-    }
\ No newline at end of file
+        messages.append(HumanMessage(content=NO_TOOL_CALL_MESSAGE))
+
+    return await asyncio.to_thread(_finish_report, state, response, usage, config)
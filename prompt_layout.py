@@ -0,0 +1,123 @@
+"""Message layout shared by every node, ordered for the server's prefix cache.
+
+vLLM's automatic prefix caching (and OpenAI's prompt caching) skips prefill
+for the longest prompt prefix it has already seen. Prompts are therefore
+built from most static to most dynamic:
+
+    system prompt, tool schemas, memory context, dataset profile, observations, task
+
+The chat template renders the tool schemas right after the system prompt, so
+the system prompt, tools, memory and dataset profile are the same bytes for
+every step of a run (and, up to the memory context, for every run), and only
+the observations and the task need prefill. Observations only ever grow at
+the end, and the folded summary of older ones only gains lines.
+
+``PrefixTracker`` estimates how much of each prompt repeats a prefix this
+process already sent, per message (the granularity this layout controls).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from prompts import DATASET_PROFILE_PROMPT
+
+# Message-prefix hashes remembered for the reuse estimate (oldest are forgotten first).
+MAX_TRACKED_PREFIXES = 4096
+
+
+def build_messages(
+    system_prompt: str,
+    task: str,
+    memory_context: str = "",
+    dataset_profile: str = "",
+    observations: list | None = None,
+) -> list:
+    """Messages of one node's prompt, static parts first."""
+    messages = [SystemMessage(content=system_prompt)]
+    if memory_context:
+        messages.append(HumanMessage(content=memory_context))
+    if dataset_profile:
+        messages.append(HumanMessage(content=DATASET_PROFILE_PROMPT.format(dataset_profile=dataset_profile)))
+    messages.extend(observations or [])
+    messages.append(HumanMessage(content=task))
+    return messages
+
+
+_tool_schemas: dict[tuple, list[dict]] = {}
+_tool_schemas_lock = threading.Lock()
+
+
+def tool_schemas(tools: dict) -> list[dict]:
+    """OpenAI schemas of ``tools`` (name -> tool), converted once so every request sends the same bytes."""
+    key = tuple(tools)
+    if key not in _tool_schemas:
+        with _tool_schemas_lock:
+            if key not in _tool_schemas:
+                _tool_schemas[key] = [convert_to_openai_tool(tool) for tool in tools.values()]
+    return _tool_schemas[key]
+
+
+def _message_text(message) -> str:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    tool_calls = [[call["name"], call["args"]] for call in getattr(message, "tool_calls", None) or []]
+    return json.dumps([message.type, content, tool_calls], ensure_ascii=False, sort_keys=True, default=str)
+
+
+class PrefixTracker:
+    """Share of each prompt that repeats a prefix sent before, by characters, per node.
+
+    An estimate of what the server can serve from its prefix cache: it assumes
+    the cache still holds everything this process sent and counts whole
+    messages only (the server also reuses partial messages, in blocks).
+    """
+
+    def __init__(self, max_prefixes: int = MAX_TRACKED_PREFIXES):
+        self.max_prefixes = max_prefixes
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, node: str, messages: list, tools: list | None = None) -> float:
+        """Record one prompt and return the share of it that repeats an earlier prefix."""
+        parts = [_message_text(message) for message in messages]
+        if tools:
+            parts.insert(1, json.dumps(tools, ensure_ascii=False, sort_keys=True))
+        total = sum(len(part) for part in parts)
+        reused = 0
+        digest = hashlib.sha256()
+        with self._lock:
+            matching = True
+            for part in parts:
+                digest.update(part.encode("utf-8"))
+                key = digest.hexdigest()
+                if matching and key in self._seen:
+                    self._seen.move_to_end(key)
+                    reused += len(part)
+                    continue
+                matching = False
+                self._seen[key] = None
+            while len(self._seen) > self.max_prefixes:
+                self._seen.popitem(last=False)
+            stats = self._stats.setdefault(node, {"calls": 0, "prompt_chars": 0, "reused_chars": 0})
+            stats["calls"] += 1
+            stats["prompt_chars"] += total
+            stats["reused_chars"] += reused
+        return reused / total if total else 0.0
+
+    def stats(self) -> dict:
+        """{node: {"calls", "prefix_reuse"}} since the process started."""
+        with self._lock:
+            return {
+                node: {
+                    "calls": stats["calls"],
+                    "prefix_reuse": round(stats["reused_chars"] / stats["prompt_chars"], 3) if stats["prompt_chars"] else 0.0,
+                }
+                for node, stats in self._stats.items()
+            }
+
+
+prefix_tracker = PrefixTracker()
@@ -35,8 +35,9 @@ Return format requirements are as follows:
         - title: string, required, step title
         - description: string, required, step description
         - status: string, required, step status, can be pending or completed
+        - depends_on: array of integers, optional, 0-based indexes of earlier steps whose results this step needs; use [] if the step only needs the dataset
     - goal: string, plan goal generated based on the context
-- If the task is determined to be unfeasible, return an empty array for steps and empty string for goal
+- If the task is determined to be unfeasible, return a single step that explains to the user why it cannot be done
 
 EXAMPLE JSON OUTPUT:
 {{
@@ -46,7 +47,8 @@ EXAMPLE JSON OUTPUT:
       {{  
             "title": "",
             "description": ""
-            "status": "pending"
+            "status": "pending",
+            "depends_on": []
       }}
    ],
 }}
@@ -55,6 +57,8 @@ Create a plan according to the following requirements:
 - Provide as much detail as possible for each step
 - Break down complex steps into multiple sub-steps
 - If multiple charts need to be drawn, draw them step by step, generating only one chart per step
+- Steps whose depends_on are all completed run in parallel, so only list a dependency when the step really needs that step's output
+- The dataset profile above is already computed; do not add steps that only inspect columns, types or missing values
 
 User message:
 {user_message}/no_think
@@ -67,6 +71,7 @@ You are updating the plan, you need to update the plan based on the context resu
 - Status: pending or completed
 - Only re-plan the following uncompleted steps, don't change the completed steps
 - Keep the output format consistent with the input plan's format.
+- Keep depends_on indexes pointing at the right steps when you add or delete steps
 
 Input:
 - plan: the plan steps with json to update
@@ -82,6 +87,12 @@ Goal:
 {goal}/no_think
 """
 
+# Sent as its own message after the memory context (see prompt_layout.py), not inside a task prompt.
+DATASET_PROFILE_PROMPT = """<dataset_profile>
+{dataset_profile}
+</dataset_profile>
+"""
+
 
 EXECUTE_SYSTEM_PROMPT = """
 You are an AI agent with autonomous capabilities.
@@ -118,7 +129,7 @@ You will be provided with a chronological event stream (may be truncated or part
 You are operating in an agent loop, iteratively completing tasks through these steps:
 1. Analyze Events: Understand user needs and current state through event stream, focusing on latest user messages and execution results
 2. Select Tools: Choose next tool call based on current state, task planning
-3. Iterate: Choose only one tool call per iteration, patiently repeat above steps until task completion
+3. Iterate: Choose one tool call per iteration (independent actions such as writing several files may be batched in one turn), patiently repeat above steps until task completion
 </agent_loop>
 
 <file_rules>
@@ -129,7 +140,8 @@ You are operating in an agent loop, iteratively completing tasks through these s
 </file_rules>
 
 <coding_rules>
-- Must save code to files before execution; direct code input to interpreter commands is forbidden
+- Run Python analysis with the python_exec tool; it keeps variables and loaded DataFrames between calls, so never reload data that is already in memory
+- Use shell_exec for non-Python commands; do not pass code inline to interpreter commands
 - Write Python code for complex mathematical calculations and analysis
 </coding_rules>
 
@@ -155,6 +167,8 @@ Select the most appropriate tool based on <user_message> and context to complete
 4. Generate a bar chart by default if there are no special requirements.
 7. The generated summary should be clearly labeled with the corresponding image file name.
 8. Font should use  Noto Sans CJK JP.
+9. Take column names, types and value ranges from <dataset_profile>; do not write scripts just to inspect the dataset.
+10. Use python_exec for Python. Load the dataset once with `df = pd.read_parquet("dataset.parquet")` (skip it if `df` already exists) and reuse `df` in later calls.
 </requirements>
 
 <additional_rules>
@@ -185,9 +199,6 @@ REPORT_SYSTEM_PROMPT = """
 You are a report generation expert. Based on the provided contextual information (including data, visualizations, and analytical results), 
 generate a high-value analytical report. The final deliverable should typically be a PDF file.
 </goal>
-<requirements>
-Font should use  Noto Sans CJK JP.
-</requirements>
 <style_guide>
 - Use tables and charts to present data clearly.
 - Do not describe every data point in the charts; focus only on statistically or practically significant findings.
@@ -198,7 +209,7 @@ Font should use  Noto Sans CJK JP.
 - The report must follow a standard data analysis report structure, including but not limited to: background, data overview, data exploration and visualization, analytical insights, recommendations, and conclusions (expand as appropriate).
 - Visualizations must be embedded within the analytical narrative and must not be presented separately or as attachments.
 - The report must not contain any code execution errors or technical debugging information.
-- First generate individual sub-reports, then merge them into a complete final report.
+- Write the whole report in one render_report call: one section per part of the structure, each chart placed in the section that discusses it.
 - Present the final analytical report as a file.
 </attention>
 """
@@ -209,14 +220,17 @@ Generate the final report file for the user request below.
 </task>
 
 <requirements>
-1. You must create a real PDF file under workspace/ (for example `final_report.pdf`).
-2. Use tools to create intermediate markdown/html files and convert them to PDF if needed.
-3. After the PDF is created, respond with a short confirmation including the PDF filename.
-4. Do not output code blocks as the final answer; complete the file creation first.
-5. Font should use  Noto Sans CJK JP.
+1. Call render_report once with the report title and all sections; it writes the PDF (for example `final_report.pdf`) with the CJK font embedded.
+2. Write each section's text as markdown (sub-headings, paragraphs, tables) and list the chart files it discusses in `charts`, using the file names below.
+3. Do not write conversion scripts or intermediate markdown/html files.
+4. After the PDF is created, respond with a short confirmation including the PDF filename.
 </requirements>
 
 <user_message>
 {user_message}
 </user_message>
+
+<charts>
+{charts}
+</charts>
 """
\ No newline at end of file
@@ -0,0 +1,85 @@
+import json
+import logging
+
+from langchain_core.messages import ToolMessage
+
+from config import get_setting, setting_list
+
+logger = logging.getLogger(__name__)
+
+# "incremental" only calls the replanner on triggers; "always" replans after every merge.
+REPLAN_MODE = get_setting("REPLAN_MODE", "planner.replan_mode", default="incremental")
+# Replan after this many completed steps without a replan; 0 disables the periodic trigger.
+REPLAN_EVERY = int(get_setting("REPLAN_EVERY", "planner.replan_every", default=3))
+# Narrow phrases only: words like "error", "missing" or "instead" are routine in successful
+# analysis summaries ("standard error", "no missing values"), and failed tool calls (error or
+# non-zero exit code) already trigger a replan through tool_failures.
+DEFAULT_DEVIATION_KEYWORDS = [
+    "failed to", "could not", "unable to", "not found", "no such file", "traceback", "exception",
+    "was skipped", "执行失败", "无法", "报错",
+]
+# Phrases in a step summary that suggest the step did not go as planned.
+REPLAN_KEYWORDS = setting_list(
+    get_setting("REPLAN_KEYWORDS", "planner.replan_keywords", default=DEFAULT_DEVIATION_KEYWORDS)
+)
+
+
+def tool_message_failed(message: ToolMessage) -> bool:
+    """Whether a tool result reports an error or a non-zero exit code."""
+    try:
+        result = json.loads(message.content)
+    except (TypeError, ValueError):
+        return False
+    if not isinstance(result, dict):
+        return False
+    if "error" in result:
+        return True
+    payload = result.get("message")
+    return isinstance(payload, dict) and payload.get("exit_code") not in (None, 0)
+
+
+class ReplanPolicy:
+    """Decides after each merge whether the plan needs the replanner LLM.
+
+    Step statuses are applied locally by merge_steps either way; the replanner
+    is only worth a call when a step went wrong or drifted, plus a periodic
+    check so long plans still get revisited.
+    """
+
+    def __init__(self, mode: str = REPLAN_MODE, every: int = REPLAN_EVERY, keywords: list[str] = REPLAN_KEYWORDS):
+        if mode not in ("incremental", "always"):
+            raise ValueError(f"Unknown planner.replan_mode: {mode}")
+        self.mode = mode
+        self.every = every
+        self.keywords = [keyword.lower() for keyword in keywords]
+
+    def trigger(self, results: list[dict], steps_since_replan: int) -> str | None:
+        """Reason to call the replanner for these step results, or None to skip it."""
+        if self.mode == "always":
+            return "always"
+        for result in results:
+            if result.get("tool_failures"):
+                return f"step {result['index']} had {result['tool_failures']} failed tool call(s)"
+            summary = (result.get("summary") or "").lower()
+            for keyword in self.keywords:
+                if keyword in summary:
+                    return f"step {result['index']} summary mentions {keyword!r}"
+        if self.every > 0 and steps_since_replan >= self.every:
+            return f"{steps_since_replan} steps since the last replan"
+        return None
+
+    def update_stats(self, stats: dict | None, results: list[dict]) -> tuple[str | None, dict]:
+        """Apply one merge to the run's replan counters; returns (trigger reason, new stats)."""
+        stats = dict(stats or {"invoked": 0, "skipped": 0, "steps_since_replan": 0})
+        steps_since_replan = stats["steps_since_replan"] + len(results)
+        reason = self.trigger(results, steps_since_replan)
+        if reason:
+            stats["invoked"] += 1
+            stats["steps_since_replan"] = 0
+        else:
+            stats["skipped"] += 1
+            stats["steps_since_replan"] = steps_since_replan
+        return reason, stats
+
+
+replan_policy = ReplanPolicy()
@@ -0,0 +1,241 @@
+"""PDF rendering behind the ``render_report`` tool.
+
+The model hands over the report as sections of light markdown (headings,
+paragraphs, ``-``/``1.`` lists, ``|`` tables, ``**bold**``) plus chart files
+made in earlier steps, and the PDF is laid out here in one call with the Noto
+Sans CJK font embedded (subset), so Chinese/Japanese text renders without the
+model writing its own conversion script. fpdf2 is imported on first use.
+
+    python report_pdf.py fonts    # which font files would be embedded
+"""
+import argparse
+import logging
+import re
+from pathlib import Path
+
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Without an explicit path the usual install locations of Noto Sans CJK are tried.
+REPORT_FONT_PATH = get_setting("REPORT_FONT_PATH", "tools.render_report.font_path")
+REPORT_BOLD_FONT_PATH = get_setting("REPORT_BOLD_FONT_PATH", "tools.render_report.bold_font_path")
+# Face of a .ttc collection: 0 JP, 1 KR, 2 SC, 3 TC, 4 HK for NotoSansCJK-*.ttc.
+REPORT_FONT_INDEX = int(get_setting("REPORT_FONT_INDEX", "tools.render_report.font_index", default=0))
+FONT_CANDIDATES = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJKjp-Regular.otf",
+    "/usr/share/fonts/noto-cjk/NotoSansCJKjp-Regular.otf",
+    "~/.local/share/fonts/NotoSansCJKjp-Regular.otf",
+    "~/.fonts/NotoSansCJKjp-Regular.otf",
+]
+FONT_FAMILY = "NotoSansCJK"
+BODY_FONT_SIZE = 10.5
+HEADING_FONT_SIZES = {0: 20, 1: 15, 2: 13, 3: 11.5}
+LINE_HEIGHT = 6
+IMAGE_WIDTH_RATIO = 0.9
+# Image files the report prompt lists as charts available to place.
+CHART_SUFFIXES = (".png", ".jpg", ".jpeg", ".svg")
+
+_TABLE_SEPARATOR_RE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+_HEADING_RE = re.compile(r"^(#{1,3})\s+(.*)$")
+_BULLET_RE = re.compile(r"^\s*[-*+]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^\s*(\d+)[.)]\s+(.*)$")
+_IMAGE_RE = re.compile(r"^!\[([^\]]*)\]\(([^)]+)\)$")
+
+
+def find_fonts() -> tuple[Path | None, Path | None]:
+    """(regular, bold) font files to embed; bold is None when only the regular face is installed."""
+    regular = None
+    for candidate in [REPORT_FONT_PATH] if REPORT_FONT_PATH else FONT_CANDIDATES:
+        path = Path(candidate).expanduser()
+        if path.is_file():
+            regular = path
+            break
+    if regular is None:
+        return None, None
+    bold = Path(REPORT_BOLD_FONT_PATH).expanduser() if REPORT_BOLD_FONT_PATH else regular.with_name(regular.name.replace("Regular", "Bold"))
+    return regular, bold if bold.is_file() and bold != regular else None
+
+
+def _inline(text: str) -> str:
+    # Only **bold** is kept for fpdf2's markdown: CJK fonts have no italic face, so __italic__ and
+    # code spans are shown as plain text.
+    return text.replace("`", "").replace("__", "").strip()
+
+
+def _table_cells(line: str) -> list[str]:
+    # Table cells are written without markdown, so their ** markers are dropped too.
+    return [_inline(cell).replace("**", "") for cell in line.strip().strip("|").split("|")]
+
+
+def parse_blocks(markdown: str) -> list[tuple]:
+    """Blocks of a section body: (heading, level, text), (paragraph, text), (item, marker, text),
+    (table, rows) and (image, path, caption)."""
+    blocks, paragraph, table = [], [], []
+
+    def flush():
+        if paragraph:
+            blocks.append(("paragraph", " ".join(paragraph)))
+            paragraph.clear()
+        if table:
+            blocks.append(("table", [_table_cells(row) for row in table if not _TABLE_SEPARATOR_RE.match(row)]))
+            table.clear()
+
+    for raw in (markdown or "").splitlines():
+        line = raw.strip()
+        if line.startswith("|"):
+            if paragraph:
+                flush()
+            table.append(line)
+            continue
+        if table:
+            flush()
+        if not line:
+            flush()
+        elif match := _IMAGE_RE.match(line):
+            flush()
+            blocks.append(("image", match.group(2).strip(), match.group(1).strip()))
+        elif match := _HEADING_RE.match(line):
+            flush()
+            blocks.append(("heading", len(match.group(1)), _inline(match.group(2))))
+        elif match := _BULLET_RE.match(raw):
+            flush()
+            blocks.append(("item", "•", _inline(match.group(1))))
+        elif match := _NUMBERED_RE.match(raw):
+            flush()
+            blocks.append(("item", f"{match.group(1)}.", _inline(match.group(2))))
+        else:
+            paragraph.append(_inline(line))
+    flush()
+    return blocks
+
+
+def _resolve_chart(name: str, workspace: Path) -> Path | None:
+    """Chart file inside the workspace; a stray ``workspace/`` prefix or directory falls back to the file name."""
+    root = workspace.resolve()
+    for candidate in (name, name.removeprefix("workspace/"), Path(name).name):
+        path = (root / candidate).resolve()
+        if path.is_relative_to(root) and path.is_file():
+            return path
+    return None
+
+
+def _new_pdf(regular: Path, bold: Path | None):
+    from fpdf import FPDF
+
+    class ReportPDF(FPDF):
+        def footer(self):
+            self.set_y(-12)
+            self.set_font(FONT_FAMILY, size=8)
+            self.cell(0, 8, str(self.page_no()), align="C")
+
+    pdf = ReportPDF(format="A4")
+    pdf.set_margins(18, 18, 18)
+    pdf.set_auto_page_break(True, margin=18)
+    # Each registered style parses the font file again, so only the two that _inline leaves are added.
+    for style, path in (("", regular), ("B", bold or regular)):
+        pdf.add_font(FONT_FAMILY, style, str(path), collection_font_number=REPORT_FONT_INDEX if path.suffix.lower() == ".ttc" else 0)
+    return pdf
+
+
+def _write_table(pdf, rows: list[list[str]]) -> None:
+    width = max(len(row) for row in rows)
+    pdf.set_font(FONT_FAMILY, size=BODY_FONT_SIZE - 1.5)
+    with pdf.table(first_row_as_headings=len(rows) > 1, text_align="LEFT", line_height=LINE_HEIGHT - 0.5) as table:
+        for cells in rows:
+            row = table.row()
+            for cell in cells + [""] * (width - len(cells)):
+                row.cell(cell)
+    pdf.ln(2)
+
+
+def _write_image(pdf, path: Path, caption: str) -> None:
+    width = pdf.epw * IMAGE_WIDTH_RATIO
+    pdf.image(str(path), x=pdf.l_margin + (pdf.epw - width) / 2, w=width)
+    if caption:
+        pdf.set_font(FONT_FAMILY, size=BODY_FONT_SIZE - 2)
+        pdf.multi_cell(0, LINE_HEIGHT - 1, caption, align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(3)
+
+
+def render_report(title: str, sections: list[dict], output: Path, workspace: Path) -> dict:
+    """Write ``sections`` ({"heading", "markdown", "charts"}) as a PDF at ``output``.
+
+    Charts are looked up in ``workspace``; missing ones are skipped and listed in the result.
+    """
+    try:
+        import fpdf  # noqa: F401
+    except ImportError:
+        return {"error": "render_report needs fpdf2 (pip install fpdf2)"}
+    regular, bold = find_fonts()
+    if regular is None:
+        return {"error": "Noto Sans CJK font not found; install fonts-noto-cjk or set tools.render_report.font_path"}
+
+    pdf = _new_pdf(regular, bold)
+    pdf.set_title(title)
+    pdf.add_page()
+    pdf.set_font(FONT_FAMILY, "B", HEADING_FONT_SIZES[0])
+    pdf.multi_cell(0, 10, _inline(title), align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+
+    embedded, missing, placed = [], [], set()
+
+    def place_chart(name: str, caption: str = "") -> None:
+        # A chart both referenced inline and listed in the section's charts is placed once.
+        path = _resolve_chart(name, workspace)
+        if path is None:
+            if name not in missing:
+                missing.append(name)
+            return
+        if path in placed:
+            return
+        _write_image(pdf, path, caption)
+        placed.add(path)
+        embedded.append(path.name)
+
+    for section in sections:
+        if section.get("heading"):
+            pdf.set_font(FONT_FAMILY, "B", HEADING_FONT_SIZES[1])
+            pdf.multi_cell(0, 8, _inline(section["heading"]), new_x="LMARGIN", new_y="NEXT")
+            pdf.ln(1)
+        for block in parse_blocks(section.get("markdown") or ""):
+            kind = block[0]
+            if kind == "heading":
+                pdf.set_font(FONT_FAMILY, "B", HEADING_FONT_SIZES[min(block[1] + 1, 3)])
+                pdf.multi_cell(0, 7, block[2], new_x="LMARGIN", new_y="NEXT")
+            elif kind == "paragraph":
+                pdf.set_font(FONT_FAMILY, size=BODY_FONT_SIZE)
+                pdf.multi_cell(0, LINE_HEIGHT, block[1], markdown=True, new_x="LMARGIN", new_y="NEXT")
+                pdf.ln(2)
+            elif kind == "item":
+                pdf.set_font(FONT_FAMILY, size=BODY_FONT_SIZE)
+                pdf.set_x(pdf.l_margin + 4)
+                pdf.cell(6, LINE_HEIGHT, block[1])
+                pdf.multi_cell(0, LINE_HEIGHT, block[2], markdown=True, new_x="LMARGIN", new_y="NEXT")
+            elif kind == "table" and block[1]:
+                _write_table(pdf, block[1])
+            elif kind == "image":
+                place_chart(block[1], block[2])
+        for chart in section.get("charts") or []:
+            place_chart(chart)
+        pdf.ln(3)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    pdf.output(str(output))
+    logger.info(f"Rendered {output.name}: {pdf.pages_count} pages, {len(embedded)} charts, font {regular.name}")
+    return {"pdf": output.name, "pages": pdf.pages_count, "charts": embedded, "missing_charts": missing}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the render_report setup.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("fonts", help="print the font files render_report embeds")
+    args = parser.parse_args()
+
+    regular, bold = find_fonts()
+    print(f"regular: {regular or 'not found (set tools.render_report.font_path)'}")
+    print(f"bold:    {bold or 'regular face is used'}")
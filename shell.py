@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import codecs
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from config import get_setting
+from tool_logs import get_store, parse_ref
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock and no-output limits for one shell_exec call; 0 disables either.
+SHELL_EXEC_TIMEOUT = float(get_setting("SHELL_EXEC_TIMEOUT", "tools.shell_exec.timeout", default=1800))
+SHELL_EXEC_IDLE_TIMEOUT = float(get_setting("SHELL_EXEC_IDLE_TIMEOUT", "tools.shell_exec.idle_timeout", default=600))
+# Seconds between SIGTERM and SIGKILL when a command is killed.
+KILL_GRACE_SECONDS = 5
+READ_CHUNK_BYTES = 65536
+EXIT_MARKER = "===== EXIT ====="
+
+_running: dict[str, dict] = {}
+_running_lock = threading.Lock()
+
+
+class OutputPreview:
+    """Head and tail of a stream within ``max_chars``, rendered like ``_truncate_output``."""
+
+    def __init__(self, max_chars: int):
+        self.head_chars = max_chars // 2
+        self.tail_chars = max_chars - self.head_chars
+        self.max_chars = max_chars
+        self.head = ""
+        self.tail = ""
+        self.total = 0
+
+    def feed(self, text: str) -> None:
+        self.total += len(text)
+        if len(self.head) < self.head_chars:
+            take = self.head_chars - len(self.head)
+            self.head += text[:take]
+            text = text[take:]
+        if text:
+            self.tail = (self.tail + text)[-self.tail_chars:] if self.tail_chars else ""
+
+    def render(self) -> tuple[str, bool]:
+        if self.total <= self.max_chars:
+            return self.head + self.tail, False
+        return self.head + f"\n... [truncated {self.total - self.max_chars} chars] ...\n" + self.tail, True
+
+
+class ShellCapture:
+    """Streams a command's output to a spool file as it arrives.
+
+    Only the bounded previews are kept in memory. The log interleaves stdout and
+    stderr chunks under section markers and ends with an exit marker, so a reader
+    tailing it can tell when the command is done. When the command ends the log
+    moves into the tool log store under ``log_keys`` (run_id, step, call_id).
+    """
+
+    def __init__(self, command: str, max_output_chars: int, prefix: str = "shell_exec", log_keys: dict | None = None):
+        self.command = command
+        self.prefix = prefix
+        self.log_keys = log_keys or {}
+        self.log_path = get_store().spool_path(prefix)
+        self.stdout = OutputPreview(max_output_chars)
+        self.stderr = OutputPreview(max_output_chars)
+        self.started = time.monotonic()
+        self.last_output = self.started
+        self.killed: str | None = None
+        self._section = None
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._log.write(f"$ {command}\n")
+        self._log.flush()
+
+    def register(self, pid: int) -> None:
+        with _running_lock:
+            _running[str(self.log_path)] = {
+                "command": self.command,
+                "pid": pid,
+                "log": str(self.log_path),
+                "started_at": time.time(),
+            }
+
+    def feed(self, stream: str, data: bytes, decoder, final: bool = False) -> None:
+        text = decoder.decode(data, final=final)
+        if not text:
+            return
+        self.last_output = time.monotonic()
+        (self.stdout if stream == "stdout" else self.stderr).feed(text)
+        if self._section != stream:
+            self._log.write(f"\n===== {stream.upper()} =====\n")
+            self._section = stream
+        self._log.write(text)
+        self._log.flush()
+
+    def expired(self, timeout: float, idle_timeout: float) -> str | None:
+        now = time.monotonic()
+        if timeout > 0 and now - self.started > timeout:
+            return f"wall-clock timeout after {timeout:.0f}s"
+        if idle_timeout > 0 and now - self.last_output > idle_timeout:
+            return f"no output for {idle_timeout:.0f}s"
+        return None
+
+    def close(self) -> None:
+        with _running_lock:
+            _running.pop(str(self.log_path), None)
+        if not self._log.closed:
+            self._log.close()
+
+    def finish(self, return_code: int) -> dict:
+        if self.killed:
+            self.stderr.feed(f"\n[killed: {self.killed}]")
+        self._log.write(f"\n{EXIT_MARKER}\nexit_code: {return_code}\n")
+        if self.killed:
+            self._log.write(f"killed: {self.killed}\n")
+        self.close()
+        log_ref = get_store().append_file(self.log_path, tool=self.prefix, **self.log_keys)
+
+        stdout_preview, stdout_truncated = self.stdout.render()
+        stderr_preview, stderr_truncated = self.stderr.render()
+        result = {
+            "stdout": stdout_preview,
+            "stderr": stderr_preview,
+            "exit_code": return_code,
+            "stdout_truncated": stdout_truncated,
+            "stderr_truncated": stderr_truncated,
+            "full_output_log": log_ref,
+        }
+        if self.killed:
+            result["killed"] = self.killed
+        return result
+
+
+def _kill_group(pid: int, sig: int) -> None:
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def _decoders():
+    return {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+
+
+def run_shell(
+    command: str,
+    cwd: Path,
+    max_output_chars: int,
+    timeout: float = SHELL_EXEC_TIMEOUT,
+    idle_timeout: float = SHELL_EXEC_IDLE_TIMEOUT,
+    log_keys: dict | None = None,
+) -> dict:
+    """Run ``command`` in its own process group, streaming output to a log file."""
+    capture = ShellCapture(command, max_output_chars, log_keys=log_keys)
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    capture.register(proc.pid)
+    decoders = _decoders()
+    selector = selectors.DefaultSelector()
+    selector.register(proc.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(proc.stderr, selectors.EVENT_READ, "stderr")
+    kill_deadline = None
+    try:
+        while selector.get_map():
+            for key, _ in selector.select(timeout=0.5):
+                data = os.read(key.fileobj.fileno(), READ_CHUNK_BYTES)
+                if data:
+                    capture.feed(key.data, data, decoders[key.data])
+                else:
+                    selector.unregister(key.fileobj)
+            if kill_deadline is None:
+                reason = capture.expired(timeout, idle_timeout)
+                if reason:
+                    capture.killed = reason
+                    _kill_group(proc.pid, signal.SIGTERM)
+                    kill_deadline = time.monotonic() + KILL_GRACE_SECONDS
+            elif time.monotonic() > kill_deadline:
+                # Also stops orphans that kept the pipes open after the shell exited.
+                _kill_group(proc.pid, signal.SIGKILL)
+                break
+        return_code = proc.wait()
+    except BaseException:
+        capture.close()
+        raise
+    finally:
+        selector.close()
+        proc.stdout.close()
+        proc.stderr.close()
+        if proc.poll() is None:
+            _kill_group(proc.pid, signal.SIGKILL)
+            proc.wait()
+    for name, decoder in decoders.items():
+        capture.feed(name, b"", decoder, final=True)
+    return capture.finish(return_code)
+
+
+async def _collect_pumps(pumps: asyncio.Future) -> None:
+    """Wait for the output pumps: a failed pump raises (the log would be incomplete), the
+    cancellation after a SIGKILL does not."""
+    try:
+        await pumps
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise
+
+
+async def arun_shell(
+    command: str,
+    cwd: Path,
+    max_output_chars: int,
+    timeout: float = SHELL_EXEC_TIMEOUT,
+    idle_timeout: float = SHELL_EXEC_IDLE_TIMEOUT,
+    log_keys: dict | None = None,
+) -> dict:
+    """Async variant of ``run_shell`` on an asyncio subprocess."""
+    capture = ShellCapture(command, max_output_chars, log_keys=log_keys)
+    proc = await asyncio.create_subprocess_shell(
+        command,
+        cwd=cwd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+    capture.register(proc.pid)
+    decoders = _decoders()
+
+    async def pump(name: str, stream: asyncio.StreamReader) -> None:
+        while data := await stream.read(READ_CHUNK_BYTES):
+            capture.feed(name, data, decoders[name])
+
+    pumps = asyncio.gather(pump("stdout", proc.stdout), pump("stderr", proc.stderr))
+    try:
+        kill_deadline = None
+        while True:
+            done, _ = await asyncio.wait({pumps}, timeout=0.5)
+            if done:
+                break
+            if kill_deadline is None:
+                reason = capture.expired(timeout, idle_timeout)
+                if reason:
+                    capture.killed = reason
+                    _kill_group(proc.pid, signal.SIGTERM)
+                    kill_deadline = time.monotonic() + KILL_GRACE_SECONDS
+            elif time.monotonic() > kill_deadline:
+                _kill_group(proc.pid, signal.SIGKILL)
+                pumps.cancel()
+                break
+        await _collect_pumps(pumps)
+        return_code = await proc.wait()
+    except BaseException:
+        capture.close()
+        raise
+    finally:
+        if proc.returncode is None:
+            _kill_group(proc.pid, signal.SIGKILL)
+            await proc.wait()
+        if not pumps.done():
+            pumps.cancel()
+            await asyncio.wait({pumps})
+        if not pumps.cancelled():
+            # Marks the error retrieved; outside an earlier exception it was already raised above.
+            pumps.exception()
+    for name, decoder in decoders.items():
+        capture.feed(name, b"", decoder, final=True)
+    # Moving the spool into a segment copies the whole log; keep it off the event loop.
+    return await asyncio.to_thread(capture.finish, return_code)
+
+
+def running_commands() -> list[dict]:
+    """Shell commands currently running in this process, with their live log paths."""
+    with _running_lock:
+        return [dict(info, elapsed=round(time.time() - info["started_at"], 1)) for info in _running.values()]
+
+
+def tail_log(log_path: str | Path, max_bytes: int = 4096) -> str:
+    """Last ``max_bytes`` of a (possibly still growing) spool file or of a stored log reference."""
+    try:
+        parse_ref(str(log_path))
+    except ValueError:
+        pass
+    else:
+        return get_store().read(str(log_path))[-max_bytes:].decode("utf-8", errors="replace")
+    with open(log_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        return f.read().decode("utf-8", errors="replace")
+
+
+def follow_log(log_path: str | Path, poll_seconds: float = 0.5) -> None:
+    """Print a log as it grows until the command's exit marker shows up."""
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            line = f.readline()
+            if line:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+                if line.startswith(EXIT_MARKER):
+                    sys.stdout.write(f.read())
+                    return
+            else:
+                time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect shell_exec logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    tail = sub.add_parser("tail", help="print the end of a log (running command or newest log by default)")
+    tail.add_argument("log", nargs="?", help="spool file of a running command or a full_output_log reference")
+    tail.add_argument("-f", "--follow", action="store_true", help="keep printing until the command exits")
+    tail.add_argument("-c", "--bytes", type=int, default=4096)
+    args = parser.parse_args()
+
+    log = args.log
+    if log is None:
+        spools = sorted(get_store().spool_dir.glob("shell_exec_*.log"), key=lambda p: p.stat().st_mtime)
+        log = spools[-1] if spools else get_store().latest()
+        if not log:
+            sys.exit("No shell_exec logs yet")
+    if args.follow and Path(log).exists():
+        follow_log(log)
+    else:
+        print(tail_log(log, args.bytes))
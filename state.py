@@ -1,5 +1,6 @@
+import operator
 from langgraph.graph import MessagesState
-from typing import Optional, List, Dict, Literal
+from typing import Annotated, Optional, List, Dict, Literal
 
 from enum import Enum
 from typing import List, Optional
@@ -7,16 +8,28 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
+# Fields without a default are required, both when a plan is validated and in the
+# json_schema response_format the planner is constrained to.
 class Step(BaseModel):
-    title: str = ""
-    description: str = ""
-    status: Literal["pending", "completed"] = "pending"
+    title: str
+    description: str
+    status: Literal["pending", "completed"]
+    # 0-based indexes of earlier steps this step needs; steps with no
+    # unfinished dependencies are executed in parallel.
+    depends_on: List[int] = []
 
 
 class Plan(BaseModel):
-    goal: str = ""
+    goal: str
     thought: str = ""
-    steps: List[Step] = []
+    steps: List[Step] = Field(min_length=1)
+
+def merge_step_results(left: list | None, right: list | None) -> list:
+    """Collect results from parallel step workers; an update of None clears the list."""
+    if right is None:
+        return []
+    return (left or []) + right
+
 
 class State(MessagesState):
     user_id: str = "default"
@@ -24,5 +37,15 @@ class State(MessagesState):
     plan: Plan
     observations: List = []
     final_report: str =  ""
+    final_report_pdf_path: str = ""
     memory_context: str = ""
+    file_path: str = ""
+    dataset_profile: str = ""
+    step_results: Annotated[list, merge_step_results]
+    # Per-call prompt token counts: {"node", "prompt_tokens", ...}
+    prompt_tokens: Annotated[list, operator.add]
+    # Replanner calls made vs skipped: {"invoked", "skipped", "steps_since_replan"}
+    replan_stats: dict
+    # Planner LLM calls, parse retries, repaired outputs and structured-output calls
+    plan_stats: dict
     
\ No newline at end of file
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from langgraph.types import Command
+
+from config import get_setting
+from graph import _run_config, build_inputs, get_async_graph
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = get_setting("SERVER_HOST", "server.host", default="127.0.0.1")
+SERVER_PORT = int(get_setting("SERVER_PORT", "server.port", default=8080))
+# Seconds without events before a keep-alive comment is sent to SSE clients.
+SSE_HEARTBEAT_SECONDS = 15
+GRAPH_NODES = {"create_planner", "update_planner", "execute", "execute_step", "merge_steps", "report"}
+PREVIEW_CHARS = 500
+
+
+def _preview(value) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS] + " ..."
+
+
+def _node_update(output):
+    if isinstance(output, Command):
+        return output.update if isinstance(output.update, dict) else {}
+    return output if isinstance(output, dict) else {}
+
+
+def _step_index(data: dict):
+    payload = data.get("input")
+    return payload.get("step_index") if isinstance(payload, dict) else None
+
+
+def _tool_output(output):
+    return getattr(output, "content", output)
+
+
+async def astream_run(user_message: str, user_id: str = "default", thread_id: str | None = None, recursion_limit: int = 100):
+    """Run one analysis and yield progress events as they happen.
+
+    Events are dicts with an ``event`` type (run_start, node_start, node_end,
+    token, tool_start, tool_end, plan, done, error) and ``elapsed`` seconds since
+    the run started; ``done`` also reports time to first token.
+    """
+    thread_id = thread_id or f"{user_id}_{uuid.uuid4().hex[:8]}"
+    config = _run_config(thread_id, recursion_limit)
+    started = time.monotonic()
+    first_token = None
+
+    def event(kind: str, **data) -> dict:
+        return {"event": kind, "elapsed": round(time.monotonic() - started, 3), **data}
+
+    yield event("run_start", thread_id=thread_id, user_id=user_id)
+    try:
+        async for item in get_async_graph().astream_events(build_inputs(user_message, user_id), config, version="v2"):
+            kind = item["event"]
+            name = item.get("name")
+            metadata = item.get("metadata") or {}
+            node = metadata.get("langgraph_node")
+            data = item.get("data") or {}
+
+            if kind == "on_chain_start" and name in GRAPH_NODES and name == node:
+                yield event("node_start", node=name, step_index=_step_index(data))
+            elif kind == "on_chain_end" and name in GRAPH_NODES and name == node:
+                update = _node_update(data.get("output"))
+                if update.get("plan"):
+                    yield event("plan", node=name, plan=update["plan"])
+                yield event("node_end", node=name, step_index=_step_index(data))
+            elif kind == "on_chat_model_stream":
+                chunk = data.get("chunk")
+                delta = getattr(chunk, "content", "")
+                if delta:
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    yield event("token", node=node, delta=delta)
+            elif kind == "on_tool_start":
+                yield event("tool_start", node=node, tool=name, run_id=item.get("run_id"), input=_preview(data.get("input")))
+            elif kind == "on_tool_end":
+                yield event("tool_end", node=node, tool=name, run_id=item.get("run_id"), output=_preview(_tool_output(data.get("output"))))
+    except Exception as e:
+        logger.exception(f"Streamed run {thread_id} failed")
+        yield event("error", thread_id=thread_id, error=f"{type(e).__name__}: {e}")
+        return
+
+    values = (await get_async_graph().aget_state(config)).values
+    yield event(
+        "done",
+        thread_id=thread_id,
+        time_to_first_token=None if first_token is None else round(first_token, 3),
+        final_report=values.get("final_report", ""),
+        final_report_pdf_path=values.get("final_report_pdf_path", ""),
+    )
+
+
+def _sse(event: dict) -> bytes:
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n".encode("utf-8")
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: str, body: dict) -> None:
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+        "Connection: close\r\n\r\n".encode("ascii") + data
+    )
+    await writer.drain()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict]:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    url = urlsplit(target)
+    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    length = int(headers.get("content-length") or 0)
+    if length:
+        body = json.loads((await reader.readexactly(length)).decode("utf-8"))
+        params.update(body)
+    return method, url.path, params
+
+
+async def _stream_to_client(writer: asyncio.StreamWriter, params: dict) -> None:
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+        b"Connection: keep-alive\r\nX-Accel-Buffering: no\r\n\r\n"
+    )
+    await writer.drain()
+    events = astream_run(
+        user_message=params["user_message"],
+        user_id=params.get("user_id") or "default",
+        thread_id=params.get("thread_id"),
+        recursion_limit=int(params.get("recursion_limit") or 100),
+    )
+    next_event = asyncio.ensure_future(anext(events))
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=SSE_HEARTBEAT_SECONDS)
+            if not done:
+                writer.write(b": ping\n\n")
+                await writer.drain()
+                continue
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                break
+            writer.write(_sse(event))
+            await writer.drain()
+            next_event = asyncio.ensure_future(anext(events))
+    finally:
+        # A client that disconnects stops its run; the checkpoint lets it be resumed.
+        next_event.cancel()
+        await asyncio.gather(next_event, return_exceptions=True)
+        await events.aclose()
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        method, path, params = await _read_request(reader)
+        if path == "/health":
+            await _write_response(writer, "200 OK", {"status": "ok"})
+        elif path == "/runs" and method in ("GET", "POST"):
+            if not params.get("user_message"):
+                await _write_response(writer, "400 Bad Request", {"error": "user_message is required"})
+            else:
+                await _stream_to_client(writer, params)
+        else:
+            await _write_response(writer, "404 Not Found", {"error": f"no route for {method} {path}"})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except Exception as e:
+        logger.exception("SSE request failed")
+        try:
+            await _write_response(writer, "400 Bad Request", {"error": f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+    """Serve runs as Server-Sent Events.
+
+    GET /runs?user_message=...&user_id=...&thread_id=... (EventSource friendly) or
+    POST /runs with the same fields as JSON; GET /health for probes.
+    """
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"Streaming runs on http://{host}:{port}/runs")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,302 @@
+import argparse
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from config import WORKSPACE, get_setting
+from workspaces import run_id_from_config
+
+logger = logging.getLogger(__name__)
+
+TOOL_LOGS_DIR = WORKSPACE / "tool_logs"
+# The active segment is closed once it reaches either limit.
+TOOL_LOG_SEGMENT_MAX_BYTES = int(get_setting("TOOL_LOG_SEGMENT_MAX_BYTES", "tools.logs.segment_max_bytes", default=64 * 1024**2))
+TOOL_LOG_SEGMENT_MAX_AGE_HOURS = float(get_setting("TOOL_LOG_SEGMENT_MAX_AGE_HOURS", "tools.logs.segment_max_age_hours", default=24))
+# Closed segments (and their index rows) older than this are deleted; 0 keeps them forever.
+TOOL_LOG_RETENTION_DAYS = float(get_setting("TOOL_LOG_RETENTION_DAYS", "tools.logs.retention_days", default=30))
+TOOL_LOG_COMPRESS = str(get_setting("TOOL_LOG_COMPRESS", "tools.logs.compress", default="true")).lower() in ("1", "true", "yes")
+# Spool files of commands that crashed their process are removed after this.
+STALE_SPOOL_SECONDS = 86400
+
+_REF_RE = re.compile(r"^(segment_\d{6,}_\d{8}T\d{6}Z\.log)@(\d+)\+(\d+)$")
+_SEGMENT_GLOB = "segment_*.log*"
+
+
+def _stamp() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _segment_seq(name: str) -> int:
+    return int(name.split("_")[1])
+
+
+def _segment_started(name: str) -> float:
+    stamp = name.split("_")[2].split(".")[0]
+    return datetime.strptime(stamp, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+def format_ref(segment: str, offset: int, length: int) -> str:
+    return f"{segment}@{offset}+{length}"
+
+
+def parse_ref(ref: str) -> tuple[str, int, int]:
+    """Split a log reference into (segment name, byte offset, byte length)."""
+    match = _REF_RE.match(os.path.basename(str(ref)))
+    if not match:
+        raise ValueError(f"Not a tool log reference: {ref}")
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+class ToolLogStore:
+    """Append-only segmented store for full tool output.
+
+    Every tool call's log is appended as one contiguous record to the active
+    segment and is addressed by ``<segment>@<offset>+<length>``; that reference
+    stays valid after the segment is rotated and gzipped. A small SQLite index
+    maps run / step / tool call ids to references. Output of a running command
+    goes to a spool file (tail it live) and is moved into a segment when the
+    command ends, so the directory only holds segments, the index and in-flight
+    spools.
+    """
+
+    def __init__(
+        self,
+        root: Path = TOOL_LOGS_DIR,
+        segment_max_bytes: int = TOOL_LOG_SEGMENT_MAX_BYTES,
+        segment_max_age_hours: float = TOOL_LOG_SEGMENT_MAX_AGE_HOURS,
+        retention_days: float = TOOL_LOG_RETENTION_DAYS,
+        compress: bool = TOOL_LOG_COMPRESS,
+    ):
+        self.root = Path(root)
+        self.spool_dir = self.root / "spool"
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age_hours * 3600
+        self.retention = retention_days * 86400
+        self.compress = compress
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    ref TEXT PRIMARY KEY,
+                    run_id TEXT NOT NULL,
+                    step TEXT NOT NULL,
+                    call_id TEXT NOT NULL,
+                    tool TEXT NOT NULL,
+                    segment TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_run ON entries (run_id, step, call_id);
+                CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment);
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.root / "index.sqlite", timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        # The index's write lock also serializes segment appends across processes.
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def spool_path(self, tool: str) -> Path:
+        """Private file for the output of a call that is still running."""
+        return self.spool_dir / f"{tool}_{_stamp()}_{uuid.uuid4().hex[:8]}.log"
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.root.glob(_SEGMENT_GLOB), key=lambda path: _segment_seq(path.name))
+
+    def _active_segment(self) -> tuple[Path, list[Path]]:
+        """The segment to append to, plus closed segments still waiting to be compressed.
+
+        Called under the index lock, so a rotation only renames the full segment to
+        ``.closed``; ``_compress_segment`` gzips it after the lock is released.
+        """
+        segments = self._segments()
+        open_segments = [path for path in segments if path.suffix == ".log"]
+        if open_segments:
+            active = open_segments[-1]
+            size = active.stat().st_size
+            age = time.time() - _segment_started(active.name)
+            if size < self.segment_max_bytes and age < self.segment_max_age:
+                return active, []
+        seq = _segment_seq(segments[-1].name) + 1 if segments else 1
+        active = self.root / f"segment_{seq:06d}_{_stamp()}.log"
+        active.touch()
+        if not self.compress:
+            return active, []
+        for path in open_segments:
+            os.replace(path, path.with_name(f"{path.name}.closed"))
+        # Also picks up segments left closed but uncompressed by a crashed process.
+        return active, sorted(self.root.glob("segment_*.log.closed"))
+
+    def _compress_segment(self, path: Path) -> None:
+        """Gzip a closed segment to ``<segment>.gz``; ``read`` finds it under either name meanwhile."""
+        segment = path.name.removesuffix(".closed")
+        tmp_path = path.with_name(f".{segment}.{uuid.uuid4().hex[:8]}.gz.tmp")
+        try:
+            with open(path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        except FileNotFoundError:
+            # Another process compressed it first.
+            tmp_path.unlink(missing_ok=True)
+            return
+        os.replace(tmp_path, path.with_name(f"{segment}.gz"))
+        path.unlink(missing_ok=True)
+
+    def _append(self, write, run_id: str, step: str, call_id: str, tool: str) -> str:
+        with self._write() as conn:
+            segment, closed = self._active_segment()
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                write(f)
+                length = f.tell() - offset
+            ref = format_ref(segment.name, offset, length)
+            conn.execute(
+                "INSERT INTO entries (ref, run_id, step, call_id, tool, segment, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ref, run_id, str(step), call_id, tool, segment.name, time.time()),
+            )
+        # Compressing a full segment takes seconds; other writers must not wait for it.
+        for path in closed:
+            self._compress_segment(path)
+        return ref
+
+    def append(self, data: bytes, run_id: str = "", step: str = "", call_id: str = "", tool: str = "") -> str:
+        """Store one complete log record and return its reference."""
+        return self._append(lambda f: f.write(data), run_id, step, call_id, tool)
+
+    def append_file(self, path: Path, run_id: str = "", step: str = "", call_id: str = "", tool: str = "") -> str:
+        """Move a finished spool file into the active segment and return its reference."""
+
+        def write(f):
+            with open(path, "rb") as src:
+                shutil.copyfileobj(src, f)
+
+        ref = self._append(write, run_id, step, call_id, tool)
+        path.unlink(missing_ok=True)
+        return ref
+
+    def read(self, ref: str) -> bytes:
+        """The exact bytes recorded under ``ref``."""
+        segment, offset, length = parse_ref(ref)
+        path = self.root / segment
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            # Rotated since the reference was handed out: closed (not yet compressed), then gzipped.
+            try:
+                f = open(path.with_name(f"{segment}.closed"), "rb")
+            except FileNotFoundError:
+                f = gzip.open(path.with_name(f"{segment}.gz"), "rb")
+        with f:
+            f.seek(offset)
+            return f.read(length)
+
+    def find(self, run_id: str, step: str | None = None, call_id: str | None = None) -> list[dict]:
+        """Index rows of one run, optionally narrowed to a step and/or tool call."""
+        query = "SELECT ref, run_id, step, call_id, tool, created_at FROM entries WHERE run_id = ?"
+        params = [run_id]
+        if step is not None:
+            query += " AND step = ?"
+            params.append(str(step))
+        if call_id is not None:
+            query += " AND call_id = ?"
+            params.append(call_id)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at", params).fetchall()
+        keys = ("ref", "run_id", "step", "call_id", "tool", "created_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def latest(self) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT ref FROM entries ORDER BY created_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def prune(self) -> list[str]:
+        """Delete closed segments past the retention period, their index rows and stale spools."""
+        now = time.time()
+        for path in self.spool_dir.iterdir():
+            if now - path.stat().st_mtime > STALE_SPOOL_SECONDS:
+                path.unlink(missing_ok=True)
+        if self.retention <= 0:
+            return []
+        removed = []
+        with self._write() as conn:
+            segments = self._segments()
+            for path in segments[:-1]:
+                if now - _segment_started(path.name) <= self.retention:
+                    break
+                name = path.name.removesuffix(".gz").removesuffix(".closed")
+                conn.execute("DELETE FROM entries WHERE segment = ?", (name,))
+                path.unlink(missing_ok=True)
+                removed.append(name)
+        if removed:
+            logger.info(f"Pruned {len(removed)} tool log segments")
+        return removed
+
+
+_store: ToolLogStore | None = None
+
+
+def get_store() -> ToolLogStore:
+    global _store
+    if _store is None:
+        _store = ToolLogStore()
+        _store.prune()
+    return _store
+
+
+def log_keys(config: dict | None) -> dict:
+    """run_id / step / call_id of a tool invocation, taken from its RunnableConfig."""
+    config = config or {}
+    metadata = config.get("metadata") or {}
+    return {
+        "run_id": run_id_from_config(config),
+        "step": str(metadata.get("step_index", metadata.get("langgraph_node", ""))),
+        "call_id": str(metadata.get("tool_call_id") or ""),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the tool log store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print the log behind a full_output_log reference")
+    show.add_argument("ref")
+    find = sub.add_parser("find", help="list the logs of a run")
+    find.add_argument("run_id")
+    find.add_argument("--step")
+    find.add_argument("--call-id")
+    sub.add_parser("prune", help="apply the retention policy now")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == "show":
+        sys.stdout.write(store.read(args.ref).decode("utf-8", errors="replace"))
+    elif args.command == "find":
+        for row in store.find(args.run_id, args.step, args.call_id):
+            print(f"{row['ref']}  step={row['step']}  call={row['call_id']}  {row['tool']}")
+    else:
+        print("\n".join(store.prune()))
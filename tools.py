@@ -1,20 +1,22 @@
-from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool, tool
+from pydantic import BaseModel, Field
+import asyncio
 import textwrap
-from datasets import load_dataset
 from pathlib import Path
-import os
-import traceback
-import subprocess
-from datasets import load_dataset
-from datetime import datetime, timezone
-import uuid
 from config import WORKSPACE, get_config, get_setting
+from kernel import kernel_manager
+from report_pdf import render_report as render_report_pdf
+from shell import arun_shell, run_shell
+from tool_logs import get_store, log_keys
+from workspaces import run_id_from_config, run_workspace, workspace_for_config
 
 
 SHELL_EXEC_MAX_OUTPUT_CHARS = int(get_setting("SHELL_EXEC_MAX_OUTPUT_CHARS", "tools.shell_exec.max_output_chars", default=1000))
-def _safe_path(rel_path: str) -> Path:
-    p = (WORKSPACE / rel_path).resolve()
-    if not str(p).startswith(str(WORKSPACE.resolve())):
+def _safe_path(rel_path: str, root: Path = WORKSPACE) -> Path:
+    root = root.resolve()
+    p = (root / rel_path).resolve()
+    if p != root and root not in p.parents:
         raise ValueError(f"Path escape blocked: {rel_path}")
     return p
 
@@ -33,11 +35,7 @@ def _truncate_output(text: str, max_chars: int) -> tuple[str, bool]:
     return truncated, True
 
 
-def _write_shell_exec_log(command: str, stdout: str, stderr: str, return_code: int) -> str:
-    logs_dir = WORKSPACE / "tool_logs"
-    logs_dir.mkdir(parents=True, exist_ok=True)
-    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    log_path = logs_dir / f"shell_exec_{stamp}_{uuid.uuid4().hex[:8]}.log"
+def _write_shell_exec_log(command: str, stdout: str, stderr: str, return_code: int, config=None, tool: str = "shell_exec") -> str:
     content = (
         f"$ {command}\n"
         f"exit_code: {return_code}\n"
@@ -46,55 +44,70 @@ def _write_shell_exec_log(command: str, stdout: str, stderr: str, return_code: i
         "\n===== STDERR =====\n"
         f"{stderr or ''}\n"
     )
-    log_path.write_text(content, encoding="utf-8")
-    return str(log_path)
+    return get_store().append(content.encode("utf-8"), tool=tool, **log_keys(config))
+def hf_dataset_settings() -> dict:
+    """Dataset coordinates from env/config: dataset, config, split and optional revision."""
+    return {
+        "dataset": get_setting(
+            "HF_DATASET",
+            "tools.load_data.dataset",
+            default=get_config("load_data.dataset"),
+            required=True,
+        ),
+        "config": get_setting(
+            "HF_DATASET_CONFIG",
+            "tools.load_data.dataset_config",
+            default=get_config("load_data.dataset_config"),
+        ),
+        "split": get_setting(
+            "HF_SPLIT",
+            "tools.load_data.split",
+            default=get_config("load_data.split", "train"),
+        ),
+        "revision": get_setting(
+            "HF_REVISION",
+            "tools.load_data.revision",
+            default=get_config("load_data.revision"),
+        ),
+    }
+
+
+def load_dataset_from_settings(settings: dict):
+    # datasets takes over a second to import; only cache misses need it.
+    from datasets import load_dataset
+
+    kwargs = {"split": settings["split"]}
+    if settings.get("revision"):
+        kwargs["revision"] = settings["revision"]
+
+    if settings["config"]:
+        return load_dataset(settings["dataset"], settings["config"], **kwargs)
+    return load_dataset(settings["dataset"], **kwargs)
+
+
 @tool
 def load_hf_dataset():
     """Download the dataset from Huggingface"""
-    dataset_name = get_setting(
-        "HF_DATASET",
-        "tools.load_data.dataset",
-        default=get_config("load_data.dataset"),
-        required=True,
-    )
-    dataset_config = get_setting(
-        "HF_DATASET_CONFIG",
-        "tools.load_data.dataset_config",
-        default=get_config("load_data.dataset_config"),
-    )
-    split = get_setting(
-        "HF_SPLIT",
-        "tools.load_data.split",
-        default=get_config("load_data.split", "train"),
-    )
-
-    if dataset_config:
-        ds = load_dataset(dataset_name, dataset_config, split=split)
-    else:
-        ds = load_dataset(dataset_name, split=split)
-
-    return ds
+    return load_dataset_from_settings(hf_dataset_settings())
 @tool
-def save_dataset(ds):
-    """Save the dataset to specific file path"""
-    save_path = WORKSPACE / "dataset.parquet"
+def save_dataset(ds, config: RunnableConfig):
+    """Save the dataset to dataset.parquet in the run's workspace"""
+    save_path = workspace_for_config(config) / "dataset.parquet"
     ds.to_parquet(str(save_path))
 
 def clean_code(code: str) -> str:
     return textwrap.dedent(code).lstrip()
 @tool
-def create_file(file_name, file_contents):
+def create_file(file_name, file_contents, config: RunnableConfig):
     """
-    Create a new file with the provided contents at a given path in the workspace.
+    Create a new file with the provided contents at a given path in the run's workspace.
     
     args:
         file_name (str): Name to the file to be created
         file_contents (str): The content to write to the file
     """
     try:
-        WORKSPACE.mkdir(exist_ok=True)
-
-        file_path = _safe_path(file_name)
+        file_path = _safe_path(file_name, workspace_for_config(config))
         file_path.parent.mkdir(parents=True, exist_ok=True)
 
         with open(file_path, "w", encoding="utf-8") as f:
@@ -110,7 +123,7 @@ def create_file(file_name, file_contents):
         }
 
 @tool
-def str_replace(file_name, old_str, new_str):
+def str_replace(file_name, old_str, new_str, config: RunnableConfig):
     """
     Replace specific text in a file.
     
@@ -120,8 +133,7 @@ def str_replace(file_name, old_str, new_str):
         new_str (str): Replacement text
     """
     try:
-        WORKSPACE.mkdir(exist_ok=True)
-        file_path = _safe_path(file_name)
+        file_path = _safe_path(file_name, workspace_for_config(config))
         if not file_path.exists():
             return {"error": f"File not found: {file_path}"}
         with open(file_path, "r", encoding="utf-8") as f:
@@ -151,10 +163,36 @@ def send_message(message: str):
     
     return message
 
-@tool
-def shell_exec(command: str) -> dict:
+def _shell_exec_result(command: str, stdout: str, stderr: str, return_code: int, config=None, tool: str = "shell_exec") -> dict:
+    log_path = _write_shell_exec_log(
+        command=command,
+        stdout=stdout,
+        stderr=stderr,
+        return_code=return_code,
+        config=config,
+        tool=tool,
+    )
+
+    stdout_preview, stdout_truncated = _truncate_output(stdout, SHELL_EXEC_MAX_OUTPUT_CHARS)
+    stderr_preview, stderr_truncated = _truncate_output(stderr, SHELL_EXEC_MAX_OUTPUT_CHARS)
+
+    # Return bounded results for ToolMessage to avoid oversized context payloads.
+    return {
+        "message": {
+            "stdout": stdout_preview,
+            "stderr": stderr_preview,
+            "exit_code": return_code,
+            "stdout_truncated": stdout_truncated,
+            "stderr_truncated": stderr_truncated,
+            "full_output_log": log_path,
+        }
+    }
+
+
+def _shell_exec(command: str, config: RunnableConfig) -> dict:
     """
-    Execute a shell command in the current working directory.
+    Execute a shell command in the run's workspace directory.
+    Commands that run too long or stop producing output are killed.
 
     Args:
         command (str): Shell command to execute.
@@ -163,48 +201,127 @@ def shell_exec(command: str) -> dict:
         dict: Contains:
             - stdout: standard output
             - stderr: standard error
+            - full_output_log: reference to the complete output; print it with
+              `python tool_logs.py show <full_output_log>`
     """
   
     try:
-        # Execute command
-        result = subprocess.run(
-            command,
-            shell=True,          
-            cwd=WORKSPACE,          
-            capture_output=True,
-            text=True,    
-            check=False
-        )
+        # Output streams to the log as it arrives; only a head/tail preview stays in memory.
+        return {"message": run_shell(
+            command, workspace_for_config(config), SHELL_EXEC_MAX_OUTPUT_CHARS, log_keys=log_keys(config)
+        )}
 
-        # Return results
-        log_path = _write_shell_exec_log(
-            command=command,
-            stdout=result.stdout,
-            stderr=result.stderr,
-            return_code=result.returncode,
-        )
+    except Exception as e:
+        return {"error":{"stderr": str(e), "type": type(e).__name__}}
 
-        stdout_preview, stdout_truncated = _truncate_output(result.stdout, SHELL_EXEC_MAX_OUTPUT_CHARS)
-        stderr_preview, stderr_truncated = _truncate_output(result.stderr, SHELL_EXEC_MAX_OUTPUT_CHARS)
 
-        # Return bounded results for ToolMessage to avoid oversized context payloads.
-        return {
-            "message": {
-                "stdout": stdout_preview,
-                "stderr": stderr_preview,
-                "exit_code": result.returncode,
-                "stdout_truncated": stdout_truncated,
-                "stderr_truncated": stderr_truncated,
-                "full_output_log": log_path,
-            }
-        }
+async def _ashell_exec(command: str, config: RunnableConfig) -> dict:
+    """Async variant of shell_exec backed by an asyncio subprocess."""
+    try:
+        return {"message": await arun_shell(
+            command, workspace_for_config(config), SHELL_EXEC_MAX_OUTPUT_CHARS, log_keys=log_keys(config)
+        )}
 
     except Exception as e:
         return {"error":{"stderr": str(e), "type": type(e).__name__}}
-    
+
+
+shell_exec = StructuredTool.from_function(
+    func=_shell_exec,
+    coroutine=_ashell_exec,
+    name="shell_exec",
+)
+
+
+def _python_exec(code: str, config: RunnableConfig) -> dict:
+    """
+    Execute Python code in a persistent kernel whose working directory is the run's workspace.
+
+    Variables, imports and loaded DataFrames survive between calls within the same run,
+    so load data once (e.g. df = pd.read_parquet("dataset.parquet")) and reuse it.
+    pandas (pd), numpy (np) and matplotlib (Agg backend) are already imported.
+
+    Args:
+        code (str): Python source to execute. Use print() to show results.
+    """
+    try:
+        run_id = run_id_from_config(config)
+        result = kernel_manager.get(run_id, cwd=run_workspace(run_id)).execute(clean_code(code))
+        stderr = result["stderr"]
+        if result.get("restarted"):
+            stderr = "[kernel restarted: variables from earlier calls are gone]\n" + stderr
+        return _shell_exec_result(
+            f"python_exec <<EOF\n{code}\nEOF", result["stdout"], stderr, result["exit_code"], config, "python_exec"
+        )
+    except Exception as e:
+        return {"error":{"stderr": str(e), "type": type(e).__name__}}
+
+
+async def _apython_exec(code: str, config: RunnableConfig) -> dict:
+    """Async variant of python_exec; the blocking kernel round-trip runs in a worker thread."""
+    return await asyncio.to_thread(_python_exec, code, config)
+
+
+python_exec = StructuredTool.from_function(
+    func=_python_exec,
+    coroutine=_apython_exec,
+    name="python_exec",
+)
+
+
+class ReportSection(BaseModel):
+    heading: str = Field(description="Section title")
+    markdown: str = Field(
+        default="",
+        description="Section text: paragraphs, '#'/'##' sub-headings, '-' or '1.' lists, '|' tables, **bold**; "
+        "'![caption](chart.png)' on its own line places a chart there",
+    )
+    charts: list[str] = Field(default_factory=list, description="Chart image files from earlier steps, shown after the text")
+
+
+class RenderReportInput(BaseModel):
+    title: str = Field(description="Report title")
+    sections: list[ReportSection] = Field(description="Report sections in order")
+    file_name: str = Field(default="final_report.pdf", description="PDF file to write in the workspace")
+
+
+def _render_report(title: str, sections: list, config: RunnableConfig, file_name: str = "final_report.pdf") -> dict:
+    """
+    Render the final report as a PDF in one call, with the Noto Sans CJK font embedded.
+    Reference charts made in earlier steps by file name; no conversion script is needed.
+
+    Args:
+        title (str): Report title.
+        sections (list): Sections with heading, markdown text and chart file names.
+        file_name (str): PDF file to write in the run's workspace.
+    """
+    try:
+        workspace = workspace_for_config(config)
+        output = _safe_path(file_name if file_name.lower().endswith(".pdf") else f"{file_name}.pdf", workspace)
+        sections = [section.model_dump() if isinstance(section, BaseModel) else dict(section) for section in sections]
+        result = render_report_pdf(title, sections, output, workspace)
+        return result if "error" in result else {"message": result}
+    except Exception as e:
+        return {"error": {"stderr": str(e), "type": type(e).__name__}}
+
+
+async def _arender_report(title: str, sections: list, config: RunnableConfig, file_name: str = "final_report.pdf") -> dict:
+    """Async variant of render_report; font subsetting and layout run in a worker thread."""
+    return await asyncio.to_thread(_render_report, title, sections, config, file_name)
+
+
+render_report = StructuredTool.from_function(
+    func=_render_report,
+    coroutine=_arender_report,
+    name="render_report",
+    args_schema=RenderReportInput,
+)
+
 @tool
 def load_student_dataset() -> dict:
     """Load StudentPerformance dataset from HuggingFace and return a small summary."""
+    from datasets import load_dataset
+
     ds = load_dataset("riyadahmadov/StudentPerformance")
     train = ds["train"]
     return {
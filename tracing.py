@@ -0,0 +1,320 @@
+"""Spans for graph nodes, LLM calls and tool calls, exported as JSONL.
+
+``SpanTracer`` is a LangChain callback handler added to every run config, so
+nodes, ``llm.invoke`` and tool invocations (which inherit the node's config)
+are timed without touching the node code. Each finished span is one line in
+``workspace/traces/spans_<date>.jsonl`` using OTLP field names (traceId,
+spanId, parentSpanId, startTimeUnixNano, ...). ``python tracing.py summarize``
+prints p50/p95 latencies per node, LLM call site and tool.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import WORKSPACE, get_setting
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = str(get_setting("TRACING_ENABLED", "tracing.enabled", default="true")).lower() in ("1", "true", "yes")
+TRACES_DIR = WORKSPACE / get_setting("TRACES_DIR", "tracing.path", default="traces")
+GRAPH_NODES = {"create_planner", "update_planner", "execute", "execute_step", "merge_steps", "report"}
+
+
+def _usage(response) -> dict:
+    """Prompt/completion token counts of an LLMResult, from usage_metadata or llm_output.
+
+    ``cached_prompt_tokens`` (prompt tokens served from the prefix cache) is only
+    set when the server reports it (vLLM with ``--enable-prompt-tokens-details``).
+    """
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                counts = {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+                cached = (usage.get("input_token_details") or {}).get("cache_read")
+                if cached is not None:
+                    counts["cached_prompt_tokens"] = cached
+                return counts
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    counts = {
+        "prompt_tokens": token_usage.get("prompt_tokens", 0),
+        "completion_tokens": token_usage.get("completion_tokens", 0),
+    }
+    cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached is not None:
+        counts["cached_prompt_tokens"] = cached
+    return counts
+
+
+def _tool_outcome(output) -> dict:
+    """Output size and, for shell_exec/python_exec results, the exit code."""
+    content = getattr(output, "content", output)
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+    outcome = {"output_bytes": len(content.encode("utf-8"))}
+    try:
+        result = json.loads(content)
+    except ValueError:
+        return outcome
+    if isinstance(result, dict):
+        message = result.get("message")
+        if isinstance(message, dict) and "exit_code" in message:
+            outcome["exit_code"] = message["exit_code"]
+        if "error" in result:
+            outcome["error"] = True
+    return outcome
+
+
+class SpanWriter:
+    """Appends spans to a per-day JSONL file; safe to share between threads."""
+
+    def __init__(self, directory: Path = TRACES_DIR):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    def write(self, span: dict) -> None:
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        line = json.dumps(span, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / f"spans_{day}.jsonl", "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class SpanTracer(BaseCallbackHandler):
+    """Records node, LLM and tool spans of graph runs."""
+
+    # Called inline from whichever thread runs the node or tool; state is guarded by a lock.
+    run_inline = True
+
+    def __init__(self, writer: SpanWriter | None = None):
+        self.writer = writer or SpanWriter()
+        self._open: dict[UUID, dict] = {}
+        # run id -> (trace id, span id of the run or of its nearest traced ancestor)
+        self._links: dict[UUID, tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, kind: str, name: str, metadata: dict | None, **attributes) -> None:
+        metadata = metadata or {}
+        with self._lock:
+            trace_id, parent_span_id = self._links.get(parent_run_id, (run_id.hex, None))
+            self._links[run_id] = (trace_id, run_id.hex)
+            self._open[run_id] = {
+                "traceId": trace_id,
+                "spanId": run_id.hex,
+                "parentSpanId": parent_span_id,
+                "name": name,
+                "kind": kind,
+                "startTimeUnixNano": time.time_ns(),
+                "_started": time.monotonic(),
+                "attributes": {
+                    "thread_id": metadata.get("thread_id"),
+                    "node": metadata.get("langgraph_node"),
+                    **{key: value for key, value in attributes.items() if value is not None},
+                },
+            }
+
+    def _end(self, run_id: UUID, error: BaseException | None = None, **attributes) -> None:
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            if span is None:
+                return
+            if span["parentSpanId"] is None:
+                # A root span ends its trace.
+                self._links = {key: link for key, link in self._links.items() if link[0] != span["traceId"]}
+        started = span.pop("_started")
+        first_token = span.pop("_first_token", None)
+        span["endTimeUnixNano"] = time.time_ns()
+        span["duration_ms"] = round((time.monotonic() - started) * 1000, 3)
+        if first_token is not None:
+            span["attributes"]["ttft_ms"] = round((first_token - started) * 1000, 3)
+        span["attributes"].update(attributes)
+        span["status"] = {"code": "ERROR", "message": f"{type(error).__name__}: {error}"} if error else {"code": "OK"}
+        try:
+            self.writer.write(span)
+        except OSError as e:
+            logger.warning(f"Could not write span: {e}")
+
+    # Graph and nodes
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs) -> None:
+        metadata = metadata or {}
+        if parent_run_id is None:
+            self._start(run_id, None, "run", name or "graph", metadata)
+        elif name in GRAPH_NODES and name == metadata.get("langgraph_node"):
+            step_index = inputs.get("step_index") if isinstance(inputs, dict) else None
+            self._start(run_id, parent_run_id, "node", name, metadata, step_index=step_index)
+        else:
+            # Internal runnables: keep the trace linked without emitting a span.
+            with self._lock:
+                if parent_run_id in self._links:
+                    self._links[run_id] = self._links[parent_run_id]
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs) -> None:
+        metadata = metadata or {}
+        self._start(
+            run_id, parent_run_id, "llm", f"llm.{metadata.get('langgraph_node') or name or 'call'}", metadata,
+            model=metadata.get("ls_model_name"), retry=metadata.get("retry", 0), messages=len(messages[0]) if messages else 0,
+        )
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs) -> None:
+        with self._lock:
+            span = self._open.get(run_id)
+            if span is not None and "_first_token" not in span:
+                span["_first_token"] = time.monotonic()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self._end(run_id, **_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    # Tools
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs) -> None:
+        metadata = metadata or {}
+        self._start(
+            run_id, parent_run_id, "tool", name or (serialized or {}).get("name", "tool"), metadata,
+            tool_call_id=metadata.get("tool_call_id"), step_index=metadata.get("step_index"),
+            input_bytes=len(str(input_str).encode("utf-8")),
+        )
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._end(run_id, **_tool_outcome(output))
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+
+class UsageCounter(BaseCallbackHandler):
+    """Counts the LLM calls of one run (planner calls included) and their prompt/completion tokens."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        usage = _usage(response)
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+
+    def totals(self) -> dict:
+        with self._lock:
+            return {"llm_calls": self.llm_calls, "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+
+_tracer: SpanTracer | None = None
+
+
+def run_callbacks() -> list:
+    """Callbacks to add to a run config; empty when tracing.enabled is false."""
+    global _tracer
+    if not TRACING_ENABLED:
+        return []
+    if _tracer is None:
+        _tracer = SpanTracer()
+    return [_tracer]
+
+
+def read_spans(paths: list[Path], thread_id: str | None = None):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if thread_id and span.get("attributes", {}).get("thread_id") != thread_id:
+                    continue
+                yield span
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(spans) -> list[dict]:
+    """p50/p95/max latency and totals per (kind, name), slowest total first."""
+    groups: dict[tuple, list[dict]] = {}
+    for span in spans:
+        groups.setdefault((span["kind"], span["name"]), []).append(span)
+    rows = []
+    for (kind, name), items in groups.items():
+        durations = [span["duration_ms"] for span in items]
+        row = {
+            "kind": kind,
+            "name": name,
+            "count": len(items),
+            "errors": sum(1 for span in items if span.get("status", {}).get("code") == "ERROR"),
+            "p50_ms": _percentile(durations, 0.5),
+            "p95_ms": _percentile(durations, 0.95),
+            "max_ms": max(durations),
+            "total_ms": round(sum(durations), 3),
+        }
+        if kind == "llm":
+            row["prompt_tokens"] = sum(span["attributes"].get("prompt_tokens", 0) for span in items)
+            row["completion_tokens"] = sum(span["attributes"].get("completion_tokens", 0) for span in items)
+            cached = [span["attributes"]["cached_prompt_tokens"] for span in items if "cached_prompt_tokens" in span["attributes"]]
+            if cached:
+                row["cached_prompt_tokens"] = sum(cached)
+            ttfts = [span["attributes"]["ttft_ms"] for span in items if "ttft_ms" in span["attributes"]]
+            if ttfts:
+                row["ttft_p50_ms"] = _percentile(ttfts, 0.5)
+        if kind == "tool":
+            row["output_bytes"] = sum(span["attributes"].get("output_bytes", 0) for span in items)
+        rows.append(row)
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def _print_table(rows: list[dict]) -> None:
+    print(f"{'kind':<5} {'name':<22} {'count':>6} {'err':>4} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total s':>9}  extra")
+    for row in rows:
+        extra = {key: row[key] for key in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens", "ttft_p50_ms", "output_bytes") if key in row}
+        print(
+            f"{row['kind']:<5} {row['name'][:22]:<22} {row['count']:>6} {row['errors']:>4} {row['p50_ms']:>10.1f} "
+            f"{row['p95_ms']:>10.1f} {row['max_ms']:>10.1f} {row['total_ms'] / 1000:>9.2f}  {extra or ''}"
+        )
+    by_kind = {}
+    for row in rows:
+        by_kind[row["kind"]] = by_kind.get(row["kind"], 0) + row["total_ms"]
+    if by_kind.get("llm") or by_kind.get("tool"):
+        print(f"\nmodel time {by_kind.get('llm', 0) / 1000:.2f}s, tool time {by_kind.get('tool', 0) / 1000:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect run traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary = sub.add_parser("summarize", help="p50/p95 latency by node, LLM call site and tool")
+    summary.add_argument("files", nargs="*", type=Path, help=f"span files (default: all in {TRACES_DIR})")
+    summary.add_argument("--thread-id", help="only spans of this run")
+    summary.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = parser.parse_args()
+
+    files = args.files or sorted(TRACES_DIR.glob("spans_*.jsonl"))
+    rows = summarize(read_spans(files, args.thread_id))
+    if not rows:
+        raise SystemExit("No spans found")
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_table(rows)
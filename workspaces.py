@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from config import WORKSPACE, get_setting
+
+logger = logging.getLogger(__name__)
+
+RUNS_DIR = WORKSPACE / "runs"
+# Run workspaces untouched for longer than this are deleted; 0 disables.
+RUN_WORKSPACE_RETENTION_DAYS = float(get_setting("RUN_WORKSPACE_RETENTION_DAYS", "workspace.retention_days", default=7))
+# Most recently used run workspaces kept; 0 means no limit.
+RUN_WORKSPACE_MAX_RUNS = int(get_setting("RUN_WORKSPACE_MAX_RUNS", "workspace.max_runs", default=500))
+# Disk budget for all run workspaces (shared hardlinked inputs not counted); 0 means no limit.
+RUN_WORKSPACE_MAX_BYTES = int(get_setting("RUN_WORKSPACE_MAX_BYTES", "workspace.max_bytes", default=20 * 1024**3))
+# Workspaces used more recently than this are never cleaned up (the run may still be going).
+ACTIVE_GRACE_SECONDS = 3600
+# Minimum seconds between automatic cleanups triggered by new runs.
+CLEANUP_INTERVAL_SECONDS = 600
+LAST_USED_MARKER = ".last_used"
+# Characters of the sanitized thread id kept in front of its hash in the directory name.
+RUN_NAME_PREFIX_CHARS = 48
+
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def run_id_from_config(config: dict | None) -> str:
+    """Run id of a graph invocation: its checkpoint thread_id, or "default"."""
+    return str(((config or {}).get("configurable") or {}).get("thread_id") or "default")
+
+
+def run_workspace_name(run_id: str) -> str:
+    """Directory name of a run: a readable prefix of the id plus a hash of the whole id.
+
+    Thread ids come from clients (the SSE endpoint), so the name must never be "." or ".."
+    and ids that sanitize alike ("a/b", "a_b") must not share a directory.
+    """
+    prefix = re.sub(r"[^\w-]", "_", run_id)[:RUN_NAME_PREFIX_CHARS]
+    return f"{prefix}-{hashlib.sha256(run_id.encode('utf-8')).hexdigest()[:12]}"
+
+
+def run_workspace(run_id: str) -> Path:
+    """Directory private to one run (thread_id); created on first use and marked as used."""
+    path = RUNS_DIR / run_workspace_name(run_id)
+    if path.resolve().parent != RUNS_DIR.resolve():
+        raise ValueError(f"Run workspace escapes {RUNS_DIR}: {run_id!r}")
+    path.mkdir(parents=True, exist_ok=True)
+    (path / LAST_USED_MARKER).touch()
+    return path
+
+
+def workspace_for_config(config: dict | None) -> Path:
+    return run_workspace(run_id_from_config(config))
+
+
+def _last_used(path: Path) -> float:
+    try:
+        return (path / LAST_USED_MARKER).stat().st_mtime
+    except FileNotFoundError:
+        return path.stat().st_mtime
+
+
+def _own_bytes(path: Path) -> int:
+    """Bytes that deleting ``path`` would free; hardlinks to shared inputs are not counted."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink <= 1:
+                total += stat.st_size
+    return total
+
+
+def cleanup_run_workspaces(
+    retention_days: float = RUN_WORKSPACE_RETENTION_DAYS,
+    max_runs: int = RUN_WORKSPACE_MAX_RUNS,
+    max_bytes: int = RUN_WORKSPACE_MAX_BYTES,
+    keep: set[str] | None = None,
+) -> list[str]:
+    """Delete the least recently used run workspaces until the retention limits hold.
+
+    Workspaces in ``keep`` or used within the last hour are never removed.
+    Returns the names of the deleted workspaces.
+    """
+    if not RUNS_DIR.exists():
+        return []
+    with _cleanup_lock:
+        now = time.time()
+        runs = sorted(
+            ((path, _last_used(path)) for path in RUNS_DIR.iterdir() if path.is_dir()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        sizes = {path: _own_bytes(path) for path, _ in runs} if max_bytes > 0 else {}
+        total = sum(sizes.values())
+        removed = []
+        # Newest first: everything past the first limit that is exceeded goes.
+        for index, (path, last_used) in enumerate(runs):
+            if path.name in (keep or set()) or now - last_used < ACTIVE_GRACE_SECONDS:
+                continue
+            expired = retention_days > 0 and now - last_used > retention_days * 86400
+            over_count = max_runs > 0 and index >= max_runs
+            over_size = max_bytes > 0 and total > max_bytes
+            if not (expired or over_count or over_size):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= sizes.get(path, 0)
+            removed.append(path.name)
+        if removed:
+            logger.info(f"Removed {len(removed)} run workspaces: {removed[:10]}")
+        return removed
+
+
+def maybe_cleanup_run_workspaces(keep: set[str] | None = None) -> list[str]:
+    """``cleanup_run_workspaces`` at most once per CLEANUP_INTERVAL_SECONDS in this process."""
+    global _last_cleanup
+    now = time.monotonic()
+    if _last_cleanup and now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+        return []
+    _last_cleanup = now
+    try:
+        return cleanup_run_workspaces(keep=keep)
+    except OSError as e:
+        logger.warning(f"Run workspace cleanup failed: {e}")
+        return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage per-run workspaces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="list run workspaces, most recently used first")
+    sub.add_parser("cleanup", help="apply the workspace retention policy now")
+    args = parser.parse_args()
+
+    if args.command == "cleanup":
+        print("\n".join(cleanup_run_workspaces()))
+    elif RUNS_DIR.exists():
+        for path in sorted(RUNS_DIR.iterdir(), key=_last_used, reverse=True):
+            if path.is_dir():
+                used = time.strftime("%Y-%m-%d %H:%M", time.localtime(_last_used(path)))
+                print(f"{path.name}  last used {used}  {_own_bytes(path)} bytes")